@@ -1,14 +1,73 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
-from db import get_connection  # sua função para conectar ao MySQL
-from datetime import datetime
+from db import get_connection, get_connection_leitura, marcar_escrita, liberar_conexoes_requisicao, pool_stats  # sua função para conectar ao MySQL
+import db
+from cache import catalogo_cache, cupons_cache, resposta_cacheada
+from paginacao import Pagina, ParametroInvalido, filtro_lista, filtro_periodo, ler_flag
+from tentativas import store_tentativas  # contador de tentativas compartilhado entre workers
+from senhas import PoolSenhasOcupado, hash_senha, verificar_senha
+import importacao
+import rollups
+from busca import BuscaCatalogo
+import imagens
+import compressao
+import serializacao
+import metricas
+import consultas
+from datetime import datetime, timedelta
 from mysql.connector import Error
+from werkzeug.exceptions import RequestEntityTooLarge
+import csv
+import io
 from datetime import datetime
 import os
 import pytz
+import time
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag', 'X-Next-Cursor'])
+# Com nginx na frente, IMAGENS_X_SENDFILE=1 deixa o envio dos arquivos de imagem para ele
+app.config['USE_X_SENDFILE'] = os.getenv('IMAGENS_X_SENDFILE', '0') == '1'
+serializacao.iniciar(app)   # orjson (se instalado) mantendo o formato de datas/Decimal
+compressao.iniciar(app)   # gzip/brotli nas respostas JSON grandes
+metricas.iniciar(app)     # latência por rota, status e tempo de banco (GET /metrics)
+consultas.iniciar(app)    # log de consultas lentas e orçamento de consultas por rota
+rollups.iniciar(get_connection)   # confere uma vez se as tabelas de rollup existem
+
+# Devolve ao pool as conexões que algum handler esqueceu de fechar
+@app.teardown_request
+def devolver_conexoes(exc):
+    vazadas = liberar_conexoes_requisicao()
+    if vazadas:
+        print(f"⚠️ {vazadas} conexão(ões) não fechada(s) em {request.endpoint}")
+
+# Executa uma consulta de leitura do catálogo (usada como carga do cache).
+# Vai a uma réplica, menos logo depois de uma invalidação: aí a carga lê do
+# primário para o cache não guardar a versão nova com dados antigos.
+def consultar_catalogo(sql, params=(), cache=catalogo_cache):
+    conn = get_connection_leitura(primario=cache.recente(db.JANELA_LEITURA))
+    if conn is None:
+        raise Error(msg='Não foi possível conectar ao banco de dados')
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+# Índice de busca de produtos (montado a partir do catálogo, sem ir ao MySQL na busca)
+def carregar_produtos(ids):
+    return consultar_catalogo(
+        f"SELECT * FROM produtos WHERE idProdutos IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+
+busca_produtos = BuscaCatalogo(catalogo_cache, lambda: consultar_catalogo("SELECT * FROM produtos"), carregar_produtos)
+
+# Invalida o catálogo e aplica a mudança dos produtos "ids" no índice de busca.
+# ids=None: não se sabe quais mudaram (a próxima busca reconstrói o índice)
+def produtos_alterados(ids=None):
+    anterior, nova = catalogo_cache.trocar_versao()
+    busca_produtos.produtos_alterados(ids, anterior, nova)
 
 #=====================================================================================================================================================================================
 #                                                                  Acesso ao APP - Usuário/Administrador
@@ -32,6 +91,12 @@ def criar_usuario():
     if not all([nome_completo, telefone, email, senha, data_nascimento, cpf]):
         return jsonify({'error': 'Todos os campos são obrigatórios'}), 400
 
+    # Senha guardada só como hash
+    try:
+        senha_hash = hash_senha(senha)
+    except PoolSenhasOcupado as e:
+        return jsonify({'error': str(e)}), 503
+
     # Conectando ao banco
     conn = get_connection()
     if conn is None:
@@ -44,7 +109,7 @@ def criar_usuario():
             """INSERT INTO usuario
             (nome_social, nome_completo, email, senha, cpf, telefone, data_nascimento, data_cadastro, data_ultimo_acesso, ativo, Administrador_idAdministrador)
             VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW(), %s, %s)""",
-            (None, nome_completo, email, senha, cpf, telefone, data_nascimento, 1, None)
+            (None, nome_completo, email, senha_hash, cpf, telefone, data_nascimento, 1, None)
         )
 
 
@@ -60,8 +125,7 @@ def criar_usuario():
 # ------------------------
 # Login de Usuário
 # ------------------------
-# Dicionário para controlar tentativas (em produção use Redis ou banco)
-tentativas_login = {}
+SQL_LOGIN_USUARIO = "SELECT * FROM usuario WHERE email = %s"
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -78,19 +142,20 @@ def login():
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT * FROM usuario WHERE email = %s", (email,))
+        cursor.execute(SQL_LOGIN_USUARIO, (email,))
         user = cursor.fetchone()
 
         # Se o usuário está bloqueado, retorna imediatamente e NÃO conta tentativas
         if user and user.get('ativo') == 0:
             return jsonify({'error': 'Conta bloqueada por excesso de tentativas. Entre em contato com o suporte.'}), 403
 
-        # Inicializa contador de tentativas
-        if email not in tentativas_login:
-            tentativas_login[email] = 0
-
-        if user and user['senha'] == senha:
-            tentativas_login[email] = 0
+        confere, regravar = verificar_senha(senha, user['senha'] if user else None)
+        if confere:
+            store_tentativas().limpar('login', email)
+            # Senha antiga (texto puro ou custo desatualizado): regrava com o hash atual
+            if regravar:
+                cursor.execute("UPDATE usuario SET senha = %s WHERE idUsuario = %s",
+                               (hash_senha(senha), user['idUsuario']))
             conn.commit()
             return jsonify({
                 'message': 'Login bem-sucedido:',
@@ -106,16 +171,18 @@ def login():
             }), 200
 
         # Senha incorreta, incrementa tentativas
-        tentativas_login[email] += 1
-        tentativas_restantes = 5 - tentativas_login[email]
+        falhas = store_tentativas().registrar('login', email)
+        tentativas_restantes = 5 - falhas
 
-        if tentativas_login[email] >= 5:
+        if falhas >= 5:
             cursor.execute("UPDATE usuario SET ativo = 0 WHERE email = %s", (email,))
             conn.commit()
             return jsonify({'error': 'Conta bloqueada por excesso de tentativas. Entre em contato com o suporte.'}), 403
 
         return jsonify({'error': f'Email ou senha inválidos. Restam {tentativas_restantes} tentativa(s).'}), 401
 
+    except PoolSenhasOcupado as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -126,7 +193,7 @@ def login():
 # ------------------------
 # Login de Administrador
 # ------------------------
-tentativas_login_admin = {}
+SQL_LOGIN_ADMIN = "SELECT * FROM administrador WHERE email = %s"
 
 @app.route('/login_admin', methods=['POST'])
 def login_admin():
@@ -143,19 +210,19 @@ def login_admin():
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT * FROM administrador WHERE email = %s", (email,))
+        cursor.execute(SQL_LOGIN_ADMIN, (email,))
         user = cursor.fetchone()
 
         # Se o administrador está bloqueado, retorna imediatamente e NÃO conta tentativas
         if user and user.get('ativo') == 0:
             return jsonify({'error': 'Conta de administrador bloqueada por excesso de tentativas. Contate o suporte.'}), 403
 
-        # Inicializa contador de tentativas
-        if email not in tentativas_login_admin:
-            tentativas_login_admin[email] = 0
-
-        if user and user['senha'] == senha:
-            tentativas_login_admin[email] = 0
+        confere, regravar = verificar_senha(senha, user['senha'] if user else None)
+        if confere:
+            store_tentativas().limpar('login_admin', email)
+            if regravar:
+                cursor.execute("UPDATE administrador SET senha = %s WHERE idAdministrador = %s",
+                               (hash_senha(senha), user['idAdministrador']))
             conn.commit()
             return jsonify({
                 'message': 'Login bem-sucedido',
@@ -167,16 +234,18 @@ def login_admin():
             }), 200
 
         # Senha incorreta, incrementa tentativas
-        tentativas_login_admin[email] += 1
-        tentativas_restantes = 5 - tentativas_login_admin[email]
+        falhas = store_tentativas().registrar('login_admin', email)
+        tentativas_restantes = 5 - falhas
 
-        if tentativas_login_admin[email] >= 5:
+        if falhas >= 5:
             cursor.execute("UPDATE administrador SET ativo = 0 WHERE email = %s", (email,))
             conn.commit()
             return jsonify({'error': 'Conta de administrador bloqueada por excesso de tentativas. Contate o suporte.'}), 403
 
         return jsonify({'error': f'Email ou senha inválidos. Restam {tentativas_restantes} tentativa(s).'}), 401
 
+    except PoolSenhasOcupado as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -189,14 +258,14 @@ def login_admin():
 #======================
 #   Buscar Endereço
 #======================
+SQL_ENDERECOS_USUARIO = "SELECT * FROM endereco WHERE Usuario_idUsuario = %s"
+
 @app.route("/get_endereco/<int:idUsuario>", methods=["GET"])
 def get_enderecos(idUsuario):
     conn = get_connection()
     cur = conn.cursor(dictionary=True)
 
-    query = "SELECT * FROM endereco WHERE Usuario_idUsuario = %s"
-    
-    cur.execute(query, (idUsuario,))
+    cur.execute(SQL_ENDERECOS_USUARIO, (idUsuario,))
     enderecos = cur.fetchall()
 
     cur.close()
@@ -393,7 +462,8 @@ def update_password(user_id):
             }), 404
 
         # 2. Verificar se a senha atual está correta
-        if user['senha'] != current_password:
+        confere, _ = verificar_senha(current_password, user['senha'])
+        if not confere:
             return jsonify({
                 'success': False,
                 'message': '❌ Senha atual incorreta'
@@ -404,7 +474,7 @@ def update_password(user_id):
             """UPDATE usuario 
                SET senha = %s, data_ultimo_acesso = NOW() 
                WHERE idUsuario = %s""",
-            (new_password, user_id)
+            (hash_senha(new_password), user_id)
         )
         conn.commit()
 
@@ -414,6 +484,8 @@ def update_password(user_id):
             'message': '✅ Senha atualizada com sucesso'
         }), 200
 
+    except PoolSenhasOcupado as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
     except Exception as e:
         conn.rollback()
         return jsonify({
@@ -430,8 +502,11 @@ def update_password(user_id):
 # Reset de Senha (Email + CPF + Data de Nascimento) com limite de tentativas
 # ------------------------
 
-# Dicionário para controlar tentativas (em produção use Redis ou banco)
-tentativas_reset = {}
+SQL_CONFERIR_DADOS_RESET = """
+    SELECT idUsuario, nome_completo, email 
+    FROM usuario 
+    WHERE email = %s AND cpf = %s AND data_nascimento = %s AND ativo = 1
+"""
 
 @app.route('/reset_password', methods=['POST'])
 def reset_password():
@@ -466,32 +541,26 @@ def reset_password():
         usuario = cursor.fetchone()
 
         if not usuario:
+            verificar_senha(nova_senha, None)   # mesmo custo do caminho com usuário
             return jsonify({'error': 'Usuário não encontrado'}), 404
 
         # 2. Verifica se a conta está bloqueada
         if usuario['ativo'] == 0:
             return jsonify({'error': 'Conta bloqueada por excesso de tentativas. Entre em contato com o suporte.'}), 403
 
-        # 3. Inicializa contador de tentativas para este email
-        if email not in tentativas_reset:
-            tentativas_reset[email] = 0
-
-        # 4. Verifica se CPF e data de nascimento conferem
-        cursor.execute("""
-            SELECT idUsuario, nome_completo, email 
-            FROM usuario 
-            WHERE email = %s AND cpf = %s AND data_nascimento = %s AND ativo = 1
-        """, (email, cpf, data_nascimento))
+        # 3. Verifica se CPF e data de nascimento conferem
+        cursor.execute(SQL_CONFERIR_DADOS_RESET, (email, cpf, data_nascimento))
         
         usuario_validado = cursor.fetchone()
 
         if not usuario_validado:
+            verificar_senha(nova_senha, None)   # mesmo custo do hash da senha nova
             # Incrementa tentativas
-            tentativas_reset[email] += 1
-            tentativas_restantes = 5 - tentativas_reset[email]
+            falhas = store_tentativas().registrar('reset', email)
+            tentativas_restantes = 5 - falhas
 
             # Se atingiu 5 tentativas, bloqueia a conta
-            if tentativas_reset[email] >= 5:
+            if falhas >= 5:
                 cursor.execute("""
                     UPDATE usuario 
                     SET ativo = 0
@@ -507,18 +576,17 @@ def reset_password():
                 'error': f'Dados incorretos. Você tem {tentativas_restantes} tentativa(s) restante(s).'
             }), 401
 
-        # 5. Dados corretos - Atualiza a senha e reseta tentativas
+        # 4. Dados corretos - Atualiza a senha e reseta tentativas
         cursor.execute("""
             UPDATE usuario 
             SET senha = %s, data_ultimo_acesso = NOW()
             WHERE idUsuario = %s
-        """, (nova_senha, usuario_validado['idUsuario']))
+        """, (hash_senha(nova_senha), usuario_validado['idUsuario']))
         
         conn.commit()
 
         # Remove do controle de tentativas
-        if email in tentativas_reset:
-            del tentativas_reset[email]
+        store_tentativas().limpar('reset', email)
 
         return jsonify({
             'message': '✅ Senha alterada com sucesso!',
@@ -528,6 +596,8 @@ def reset_password():
             }
         }), 200
 
+    except PoolSenhasOcupado as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         conn.rollback()
         return jsonify({'error': f'Erro ao redefinir senha: {str(e)}'}), 500
@@ -541,18 +611,35 @@ def reset_password():
 # ===================================================================================================================================================================================
 # ------------------------
 # Listar todos os usuários
+# ?limit=&after= (paginação), ?sort=id|nome&order=asc|desc, ?ativo=1|0
 # ------------------------
 @app.route('/usuario', methods=['GET'])
 def listar_usuarios():
+    try:
+        pagina = Pagina(request.args, {
+            'id': ('idUsuario', 'idUsuario'),
+            'nome': ('nome_completo', 'nome_completo'),
+        }, 'id', ('idUsuario', 'idUsuario'))
+        condicoes, params = [], []
+        ativo = ler_flag(request.args.get('ativo'))
+        if ativo is not None:
+            condicoes.append('ativo = %s')
+            params.append(ativo)
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_connection()
     if conn is None:
         return jsonify({'error': 'Não foi possível conectar ao banco de dados'}), 500
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT idUsuario, nome_completo, email, telefone, data_nascimento, ativo, cpf FROM usuario")
-        users = cursor.fetchall()
-        return jsonify(users), 200
+        sql, params = pagina.montar(
+            "SELECT idUsuario, nome_completo, email, telefone, data_nascimento, ativo, cpf FROM usuario",
+            condicoes, params)
+        cursor.execute(sql, params)
+        users = pagina.cortar(cursor.fetchall())
+        return pagina.aplicar_cabecalho(jsonify(users)), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -599,8 +686,12 @@ def editar_usuario_admin(id):
         valores.append(ativo)
     # ⚡ Adicionar senha apenas se fornecida e não vazia
     if senha is not None and senha.strip() != '':
+        try:
+            senha_hash = hash_senha(senha)
+        except PoolSenhasOcupado as e:
+            return jsonify({'error': str(e)}), 503
         campos.append("senha=%s")
-        valores.append(senha)
+        valores.append(senha_hash)
 
     if not campos:
         return jsonify({'error': 'Nenhum campo para atualizar'}), 400
@@ -671,6 +762,11 @@ def adicionar_usuario(admin_id):
     if not all([nome_completo, telefone, email, senha, data_nascimento, cpf]):
         return jsonify({'error': 'Todos os campos são obrigatórios'}), 400
 
+    try:
+        senha_hash = hash_senha(senha)
+    except PoolSenhasOcupado as e:
+        return jsonify({'error': str(e)}), 503
+
     conn = get_connection()
     if conn is None:
         return jsonify({'error': 'Não foi possível conectar ao banco de dados'}), 500
@@ -681,7 +777,7 @@ def adicionar_usuario(admin_id):
             """INSERT INTO usuario
                (nome_social, nome_completo, email, senha, cpf, telefone, data_nascimento, data_cadastro, data_ultimo_acesso, ativo, Administrador_idAdministrador)
                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW(), %s, %s)""",
-            (None, nome_completo, email, senha, cpf, telefone, data_nascimento, 1, admin_id)
+            (None, nome_completo, email, senha_hash, cpf, telefone, data_nascimento, 1, admin_id)
         )
         conn.commit()
         return jsonify({'message': 'Usuário adicionado com sucesso!'}), 200
@@ -696,6 +792,9 @@ def adicionar_usuario(admin_id):
 #--------------------------
 # Buscar cliente pelo CPF
 #--------------------------
+SQL_BUSCAR_CLIENTE = """SELECT idUsuario, nome_completo, email, senha, cpf, telefone, 
+                   data_nascimento, ativo FROM usuario WHERE cpf=%s"""
+
 @app.route('/cliente/<cpf>', methods=['GET'])
 def buscar_cliente(cpf):
     try:
@@ -708,9 +807,7 @@ def buscar_cliente(cpf):
         print(f"🔍 Buscando CPF: {cpf_limpo}")  # Debug
         
         # ⚡ INCLUIR idUsuario na query
-        query = """SELECT idUsuario, nome_completo, email, senha, cpf, telefone, 
-                   data_nascimento, ativo FROM usuario WHERE cpf=%s"""
-        cursor.execute(query, (cpf_limpo,))
+        cursor.execute(SQL_BUSCAR_CLIENTE, (cpf_limpo,))
         cliente = cursor.fetchone()
         
         if cliente:
@@ -803,6 +900,12 @@ def add_product():
     if not all([nome, descricao, valor is not None, imagem, quantidade_estoque is not None]):
         return jsonify({'error': 'Campos obrigatórios faltando'}), 400
 
+    # Imagem enviada em base64/data URI vai para o armazenamento; no produto fica só a URL
+    try:
+        imagem = imagens.guardar_se_inline(imagem, url_base_imagens())
+    except imagens.ImagemInvalida as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_connection()
     cursor = conn.cursor()
     try:
@@ -817,6 +920,7 @@ def add_product():
             data_cadastro, vitrine_id, administrador_id, categoria
         ))
         conn.commit()
+        produtos_alterados([cursor.lastrowid])
         return jsonify({'message': 'Produto cadastrado com sucesso!'}), 201
     except Exception as e:
         conn.rollback()
@@ -825,6 +929,49 @@ def add_product():
         cursor.close()
         conn.close()
 
+# ---------------------------
+# Importar produtos em massa (CSV ou NDJSON)
+# ---------------------------
+# Content-Type: text/csv ou application/x-ndjson (ou ?formato=csv|ndjson)
+# Colunas: nome, descricao, valor, imagem, quantidade_estoque, categoria, vitrine_id
+# ?upsert=1 atualiza os produtos que já existem com o mesmo nome
+# ?administrador_id= administrador responsável pelos produtos
+@app.route('/add_products/bulk', methods=['POST'])
+def importar_produtos():
+    formato = request.args.get('formato')
+    if not formato:
+        formato = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+    if formato not in ('csv', 'ndjson'):
+        return jsonify({'error': "formato deve ser 'csv' ou 'ndjson'"}), 400
+    try:
+        upsert = ler_flag(request.args.get('upsert', '0'))
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_connection()
+    if conn is None:
+        return jsonify({'error': 'Não foi possível conectar ao banco de dados'}), 500
+
+    relatorio = None
+    try:
+        relatorio = importacao.importar(
+            conn,
+            importacao.ler_linhas(request.stream, formato),
+            administrador_id=request.args.get('administrador_id', type=int),
+            upsert=bool(upsert),
+            base_imagens=url_base_imagens(),
+        )
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': f'Arquivo inválido: {e}'}), 400
+    finally:
+        conn.close()
+        # Lotes já gravados continuam valendo mesmo se o arquivo quebrar no meio.
+        # Produtos novos não têm os ids conhecidos: aí o índice de busca é reconstruído
+        produtos_alterados(relatorio.ids_atualizados if relatorio and not relatorio.inseridos else None)
+
+    status = 201 if relatorio.inseridos or relatorio.atualizados else 400
+    return jsonify(relatorio.como_dict()), status
+
 # ------------------------
 # Deletar um produto
 # ------------------------
@@ -834,27 +981,49 @@ def delete_produto(id):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM produtos WHERE idProdutos = %s", (id,))
     conn.commit()
+    cursor.close()
+    conn.close()
+    produtos_alterados([id])
     return jsonify({"message": "Produto excluído"})
 
 # ------------------------
 # Visualizar um produto
+# ?limit=&after= (paginação), ?sort=id|nome|valor&order=asc|desc, ?categoria=, ?promocao=1|0
 # ------------------------
 @app.route('/get_products', methods=['GET'])
 def get_products():
     try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
+        pagina = Pagina(request.args, {
+            'id': ('idProdutos', 'idProdutos'),
+            'nome': ('nome', 'nome'),
+            'valor': ('valor', 'valor'),
+        }, 'id', ('idProdutos', 'idProdutos'))
+        condicoes, params = [], []
+        if request.args.get('categoria'):
+            condicoes.append('categoria = %s')
+            params.append(request.args['categoria'])
+        promocao = ler_flag(request.args.get('promocao'))
+        if promocao is not None:
+            condicoes.append('is_promotion = %s')
+            params.append(promocao)
+    except ParametroInvalido as e:
+        return jsonify({'error': str(e)}), 400
+
+    def carregar():
+        sql, valores = pagina.montar("""
             SELECT idProdutos, nome, descricao, valor, avaliacao, imagem, 
                    quantidade_estoque, categoria, data_cadastro
-            FROM produtos
-        """)
-        produtos = cursor.fetchall()
+            FROM produtos""", condicoes, params)
+        produtos = pagina.cortar(consultar_catalogo(sql, valores))
+        if pagina.limite is None:
+            return {'produtos': produtos}
+        return {'produtos': produtos, 'proximo_cursor': pagina.proximo}
 
-        cursor.close()
-        conn.close()
-
-        return jsonify({'produtos': produtos}), 200
+    try:
+        chave = ('get_products',) + tuple(sorted(request.args.items(multi=True)))
+        # X-Next-Cursor vem do próprio payload, então vale também quando a página sai do cache
+        return resposta_cacheada(catalogo_cache, chave, carregar, cabecalhos=lambda dados: (
+            {'X-Next-Cursor': dados['proximo_cursor']} if dados.get('proximo_cursor') else {}))
 
     except Exception as e:
         print("Erro ao buscar produtos:", e)
@@ -890,6 +1059,10 @@ def update_produto(id):
         campos.append("valor=%s")
         valores.append(valor)
     if imagem is not None:
+        try:
+            imagem = imagens.guardar_se_inline(imagem, url_base_imagens())
+        except imagens.ImagemInvalida as e:
+            return jsonify({'error': str(e)}), 400
         campos.append("imagem=%s")
         valores.append(imagem)
     if quantidade_estoque is not None:
@@ -914,6 +1087,7 @@ def update_produto(id):
         linhas_afetadas = cursor.rowcount
         cursor.close()
         conn.close()
+        produtos_alterados([id])
 
         if linhas_afetadas > 0:
             return jsonify({'message': 'Produto atualizado com sucesso!'}), 200
@@ -927,25 +1101,25 @@ def update_produto(id):
 # ------------------------
 # Listar produtos em promoção
 # ------------------------
+SQL_PROMOCOES = """
+    SELECT 
+        idProdutos,
+        nome,
+        descricao,
+        categoria,
+        valor,
+        imagem,
+        is_promotion
+    FROM produtos
+    WHERE is_promotion = 1
+"""
+
 @app.route('/promocao', methods=['GET'])
 def get_promocoes():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT 
-            idProdutos,
-            nome,
-            descricao,
-            categoria,
-            valor,
-            imagem,
-            is_promotion
-        FROM produtos
-        WHERE is_promotion = 1
-    """)
-    promocoes = cursor.fetchall()
-    conn.close()
-    return jsonify(promocoes)
+    try:
+        return resposta_cacheada(catalogo_cache, ('promocao',), lambda: consultar_catalogo(SQL_PROMOCOES))
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
 
 # ------------------------
 # Adicionar produto à promoção
@@ -958,6 +1132,10 @@ def add_promocao():
 
     if not id_produto or preco_promocional is None:
         return jsonify({'error': 'Produto_idProduto e preco_promocional são obrigatórios'}), 400
+    try:
+        id_produto = int(id_produto)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Produto_idProduto deve ser um número'}), 400
 
     conn = get_connection()
     cursor = conn.cursor()
@@ -968,6 +1146,7 @@ def add_promocao():
     """, (preco_promocional, id_produto))
     conn.commit()
     conn.close()
+    produtos_alterados([id_produto])
 
     return jsonify({'message': 'Produto adicionado à promoção com sucesso'}), 201
 
@@ -990,6 +1169,7 @@ def update_promocao(id):
     """, (preco_promocional, id))
     conn.commit()
     conn.close()
+    produtos_alterados([id])
 
     return jsonify({'message': 'Produto em promoção atualizado'})
 
@@ -1007,6 +1187,7 @@ def remove_promocao(id):
     """, (id,))
     conn.commit()
     conn.close()
+    produtos_alterados([id])
     return jsonify({'message': 'Produto removido da promoção'})
 
 # ===================================================================================================================================================================================
@@ -1017,24 +1198,22 @@ def remove_promocao(id):
 # ------------------------
 @app.route('/cupons', methods=['GET'])
 def get_cupons():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT 
-            idCupom,
-            codigo,
-            descricao,
-            desconto,
-            tipo_desconto,
-            data_validade,
-            ativo,
-            Administrador_idAdministrador,
-            data_criacao
-        FROM cupom
-    """)
-    cupons = cursor.fetchall()
-    conn.close()
-    return jsonify({'cupons': cupons})
+    try:
+        return resposta_cacheada(cupons_cache, ('cupons',), lambda: {'cupons': consultar_catalogo("""
+            SELECT 
+                idCupom,
+                codigo,
+                descricao,
+                desconto,
+                tipo_desconto,
+                data_validade,
+                ativo,
+                Administrador_idAdministrador,
+                data_criacao
+            FROM cupom
+        """, cache=cupons_cache)}, publico=False)
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
 
 # ------------------------
 # Adicionar cupom
@@ -1061,6 +1240,7 @@ def add_cupom():
     """, (codigo, descricao, desconto, tipo_desconto, data_validade, ativo, admin_id))
     conn.commit()
     conn.close()
+    cupons_cache.invalidar()
     return jsonify({'message': 'Cupom adicionado com sucesso'}), 201
 
 # ------------------------
@@ -1092,6 +1272,7 @@ def update_cupom(id):
         conn.commit()
         cursor.close()
         conn.close()
+        cupons_cache.invalidar()
         return jsonify({'message': 'Cupom atualizado com sucesso'})
     except Exception as e:
         print("Erro ao atualizar cupom:", e)
@@ -1113,8 +1294,75 @@ def remove_cupom(id):
     
     conn.commit()
     conn.close()
+    cupons_cache.invalidar()
     return jsonify({'message': 'Cupom removido com sucesso'})
 
+#===================================================================================================================================================================================
+#                                                                               Imagens dos Produtos
+#===================================================================================================================================================================================
+def url_base_imagens():
+    return os.getenv('IMAGENS_URL_BASE') or request.host_url
+
+# ------------------------
+# Enviar uma imagem (multipart "arquivo", ou o corpo cru com Content-Type image/*)
+# ------------------------
+# Corpo acima do limite (imagem + folga para os cabeçalhos do multipart) é recusado
+# enquanto é lido, sem carregar tudo na memória
+FOLGA_MULTIPART = 64 * 1024
+
+@app.route('/imagens', methods=['POST'])
+def upload_imagem():
+    request.max_content_length = imagens.MAX_BYTES + FOLGA_MULTIPART   # só nesta rota
+    try:
+        arquivo = request.files.get('arquivo')
+        dados = arquivo.read(imagens.MAX_BYTES + 1) if arquivo else request.stream.read(imagens.MAX_BYTES + 1)
+        if len(dados) > imagens.MAX_BYTES:
+            raise RequestEntityTooLarge()
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'Imagem maior que {imagens.MAX_BYTES // (1024 * 1024)} MB'}), 413
+    try:
+        hash_imagem = imagens.salvar(dados)
+    except imagens.ImagemInvalida as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'hash': hash_imagem, 'url': imagens.url(hash_imagem, url_base_imagens())}), 201
+
+# ------------------------
+# Servir uma imagem (conteúdo nunca muda para o mesmo hash)
+# ------------------------
+@app.route('/imagens/<string:hash_imagem>', methods=['GET'])
+def get_imagem(hash_imagem):
+    encontrada = imagens.localizar(hash_imagem)
+    if encontrada is None:
+        return jsonify({'error': 'Imagem não encontrada'}), 404
+    caminho, mimetype = encontrada
+    # send_file usa o wsgi.file_wrapper do servidor (sendfile no gunicorn)
+    resposta = send_file(caminho, mimetype=mimetype, etag=hash_imagem, conditional=True)
+    resposta.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resposta
+
+# ------------------------
+# Miniatura com largura máxima (gerada na primeira vez, depois servida do disco)
+# ?formato=webp|jpg (padrão: WebP se o Accept do cliente pedir)
+# ------------------------
+@app.route('/imagens/<string:hash_imagem>/w/<int:largura>', methods=['GET'])
+def get_imagem_derivada(hash_imagem, largura):
+    formato = request.args.get('formato')
+    if formato not in (None, 'webp', 'jpg'):
+        return jsonify({'error': "formato deve ser 'webp' ou 'jpg'"}), 400
+    aceita_webp = formato == 'webp' or (formato is None and 'image/webp' in request.headers.get('Accept', ''))
+    try:
+        encontrada = imagens.derivado(hash_imagem, max(largura, 1), aceita_webp)
+    except TimeoutError:
+        return jsonify({'error': 'Imagem ainda sendo processada, tente novamente'}), 503
+    if encontrada is None:
+        return jsonify({'error': 'Imagem não encontrada'}), 404
+    caminho, mimetype = encontrada
+    resposta = send_file(caminho, mimetype=mimetype, conditional=True,
+                         etag=os.path.basename(caminho))
+    resposta.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    resposta.vary.add('Accept')
+    return resposta
+
 #===================================================================================================================================================================================
 #                                                                               Vitrine de Produtos
 #===================================================================================================================================================================================
@@ -1123,11 +1371,11 @@ def remove_cupom(id):
 # ===========================
 @app.route('/categorias', methods=['GET'])
 def get_categorias():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL AND categoria <> ''")
-    categorias = cursor.fetchall()
-    return jsonify(categorias)
+    try:
+        return resposta_cacheada(catalogo_cache, ('categorias',), lambda: consultar_catalogo(
+            "SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL AND categoria <> ''"))
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
 
 # ------------------------
 # Listar todos os produtos
@@ -1135,41 +1383,55 @@ def get_categorias():
 @app.route('/produtos', methods=['GET'])
 def get_produtos():
     try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM produtos")
-        produtos = cursor.fetchall()
-        return jsonify(produtos)
+        return resposta_cacheada(catalogo_cache, ('produtos',), lambda: consultar_catalogo("SELECT * FROM produtos"))
     except Error as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 # ------------------------
 # Listar produtos em promoção
 # ------------------------
 
+# ------------------------
+# Buscar produtos (nome, descrição e categoria; sem acento; prefixo na última palavra)
+# ?q=, ?categoria=, ?limit= (padrão 20, máx. 100), ?prefixo=1|0
+# ------------------------
+@app.route('/produtos/busca', methods=['GET'])
+def buscar_produtos():
+    consulta = request.args.get('q', '').strip()
+    if not consulta:
+        return jsonify({"error": "Parâmetro 'q' é obrigatório"}), 400
+    try:
+        limite = min(max(int(request.args.get('limit', 20)), 1), 100)
+        prefixo = ler_flag(request.args.get('prefixo', '1'))
+    except (ValueError, ParametroInvalido):
+        return jsonify({"error": "Parâmetros inválidos (limit inteiro, prefixo 1 ou 0)"}), 400
+
+    try:
+        inicio = time.perf_counter()
+        total, resultados, facetas = busca_produtos.buscar(
+            consulta, request.args.get('categoria'), limite, bool(prefixo))
+        tempo_ms = (time.perf_counter() - inicio) * 1000
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        'total': total,
+        'resultados': resultados,
+        'facetas': facetas,
+        'tempo_ms': round(tempo_ms, 3),
+    }), 200
+
 # ------------------------
 # Listar produtos por categoria
 # ------------------------
+SQL_PRODUTOS_CATEGORIA = "SELECT * FROM produtos WHERE categoria = %s"
+
 @app.route('/produtos/categoria/<string:categoria>', methods=['GET'])
 def get_produtos_categoria(categoria):
     try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM produtos WHERE categoria = %s", (categoria,))
-        produtos = cursor.fetchall()
-        return jsonify(produtos)
+        return resposta_cacheada(catalogo_cache, ('produtos_categoria', categoria), lambda: consultar_catalogo(
+            SQL_PRODUTOS_CATEGORIA, (categoria,)))
     except Error as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 
 #====================================================================================================================================================================================
@@ -1178,18 +1440,20 @@ def get_produtos_categoria(categoria):
 # ===============================
 # Listar favoritos de um usuário
 # ===============================
+SQL_FAVORITOS_USUARIO = """
+    SELECT f.idFavoritos, p.idProdutos, p.nome, p.descricao, p.valor,
+           p.imagem, p.avaliacao, p.categoria, p.is_promotion
+    FROM favoritos f
+    JOIN produtos p ON f.Produtos_idProdutos = p.idProdutos
+    WHERE f.Usuario_idUsuario = %s
+"""
+
 @app.route('/favoritos/<int:user_id>', methods=['GET'])
 def get_favoritos(user_id):
-    conn = get_connection()
+    conn = get_connection_leitura(f'usuario:{user_id}')
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT f.idFavoritos, p.idProdutos, p.nome, p.descricao, p.valor,
-                   p.imagem, p.avaliacao, p.categoria, p.is_promotion
-            FROM favoritos f
-            JOIN produtos p ON f.Produtos_idProdutos = p.idProdutos
-            WHERE f.Usuario_idUsuario = %s
-        """, (user_id,))
+        cursor.execute(SQL_FAVORITOS_USUARIO, (user_id,))
         favoritos = cursor.fetchall()
         return jsonify(favoritos), 200
     except Exception as e:
@@ -1219,6 +1483,7 @@ def add_favorito():
             (user_id, produto_id)
         )
         conn.commit()
+        marcar_escrita(f'usuario:{user_id}')
         favorito_id = cursor.lastrowid
         return jsonify({"idFavoritos": favorito_id}), 201
     except Exception as e:
@@ -1236,8 +1501,13 @@ def remove_favorito(fav_id):
     conn = get_connection()
     cursor = conn.cursor()
     try:
+        # Dono do favorito, para a lista dele sair do primário logo em seguida
+        cursor.execute("SELECT Usuario_idUsuario FROM favoritos WHERE idFavoritos = %s", (fav_id,))
+        dono = cursor.fetchone()
         cursor.execute("DELETE FROM favoritos WHERE idFavoritos = %s", (fav_id,))
         conn.commit()
+        if dono:
+            marcar_escrita(f'usuario:{dono[0]}')
         return jsonify({"message": "Favorito removido"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1252,26 +1522,28 @@ def remove_favorito(fav_id):
 #--------------------------------
 # Listar carrinho de um usuário
 #--------------------------------
+# Seleciona produtos do carrinho junto com o ID do carrinho
+SQL_ITENS_CARRINHO = """
+    SELECT cp.idCarrinho_Produtos AS id,
+           cp.Carrinho_idCarrinho AS carrinho_id,
+           p.idProdutos AS produto_id,
+           p.nome,
+           p.descricao,
+           p.valor,
+           p.imagem,
+           cp.quantidade
+    FROM carrinho_produto cp
+    JOIN carrinho c ON cp.Carrinho_idCarrinho = c.idCarrinho
+    JOIN produtos p ON cp.Produtos_idProdutos = p.idProdutos
+    WHERE c.Usuario_idUsuario = %s
+"""
+
 @app.route('/get_carrinho/<int:user_id>', methods=['GET'])
 def get_carrinho(user_id):
     conn = get_connection()
     cur = conn.cursor(dictionary=True)
     
-    # Seleciona produtos do carrinho junto com o ID do carrinho
-    cur.execute("""
-        SELECT cp.idCarrinho_Produtos AS id,
-               cp.Carrinho_idCarrinho AS carrinho_id,
-               p.idProdutos AS produto_id,
-               p.nome,
-               p.descricao,
-               p.valor,
-               p.imagem,
-               cp.quantidade
-        FROM carrinho_produto cp
-        JOIN carrinho c ON cp.Carrinho_idCarrinho = c.idCarrinho
-        JOIN produtos p ON cp.Produtos_idProdutos = p.idProdutos
-        WHERE c.Usuario_idUsuario = %s
-    """, (user_id,))
+    cur.execute(SQL_ITENS_CARRINHO, (user_id,))
     
     items = cur.fetchall()
     cur.close()
@@ -1280,6 +1552,142 @@ def get_carrinho(user_id):
     return jsonify(items)
 
 
+#--------------------------------
+# Funções do carrinho
+#--------------------------------
+# Requer a chave única (Carrinho_idCarrinho, Produtos_idProdutos) em carrinho_produto
+# (criada pela migração 002 de migracoes.py; ver também "Banco de dados - MySql/carrinho_produto_unico.sql").
+SQL_SOMAR_ITEM = """
+    INSERT INTO carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos, quantidade, data_criacao)
+    VALUES (%s, %s, %s, NOW())
+    ON DUPLICATE KEY UPDATE quantidade = quantidade + VALUES(quantidade), data_criacao = NOW()
+"""
+
+SQL_DEFINIR_ITEM = """
+    INSERT INTO carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos, quantidade, data_criacao)
+    VALUES (%s, %s, %s, NOW())
+    ON DUPLICATE KEY UPDATE quantidade = VALUES(quantidade), data_criacao = NOW()
+"""
+
+# Carrinho aberto do usuário num único upsert: cria se não existir, senão só devolve o id
+# (LAST_INSERT_ID(idCarrinho) faz o lastrowid trazer o carrinho que já existia).
+# Requer a chave única uq_carrinho_aberto (um carrinho aberto por usuário, migração 005).
+# Sem leitura antes da escrita, dois toques seguidos não criam dois carrinhos nem
+# travam um ao outro por gap lock: o segundo espera a linha do primeiro e reaproveita.
+# Ordem das travas em todas as rotas do carrinho: linha do carrinho, depois os itens.
+SQL_CARRINHO_ABERTO = """
+    INSERT INTO carrinho (data_criacao, Usuario_idUsuario, status)
+    VALUES (NOW(), %s, 'aberto')
+    ON DUPLICATE KEY UPDATE idCarrinho = LAST_INSERT_ID(idCarrinho)
+"""
+
+
+# Caminho antigo, usado só quando as chaves únicas acima não existem no banco
+# (migrações 002/005 não aplicadas): trava a linha do usuário e lê antes de escrever.
+SQL_TRAVAR_USUARIO = "SELECT idUsuario FROM usuario WHERE idUsuario = %s FOR UPDATE"
+SQL_BUSCAR_CARRINHO_ABERTO = """
+    SELECT idCarrinho FROM carrinho
+    WHERE Usuario_idUsuario = %s AND status = 'aberto'
+    ORDER BY idCarrinho LIMIT 1 FOR UPDATE
+"""
+SQL_CRIAR_CARRINHO = "INSERT INTO carrinho (data_criacao, Usuario_idUsuario, status) VALUES (NOW(), %s, 'aberto')"
+SQL_BUSCAR_ITEM = """
+    SELECT idCarrinho_Produtos FROM carrinho_produto
+    WHERE Carrinho_idCarrinho = %s AND Produtos_idProdutos = %s
+    ORDER BY idCarrinho_Produtos LIMIT 1 FOR UPDATE
+"""
+SQL_SOMAR_ITEM_EXISTENTE = "UPDATE carrinho_produto SET quantidade = quantidade + %s, data_criacao = NOW() WHERE idCarrinho_Produtos = %s"
+SQL_DEFINIR_ITEM_EXISTENTE = "UPDATE carrinho_produto SET quantidade = %s, data_criacao = NOW() WHERE idCarrinho_Produtos = %s"
+SQL_INSERIR_ITEM = """
+    INSERT INTO carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos, quantidade, data_criacao)
+    VALUES (%s, %s, %s, NOW())
+"""
+
+# Chaves únicas das quais os upserts dependem, por colunas (o nome pode variar se
+# foi criada à mão pelo script SQL): (tabela, colunas na ordem do índice)
+CHAVES_CARRINHO = {
+    ('carrinho', 'usuario_aberto'),
+    ('carrinho_produto', 'carrinho_idcarrinho,produtos_idprodutos'),
+}
+SQL_CHAVES_CARRINHO = """
+    SELECT table_name, GROUP_CONCAT(column_name ORDER BY seq_in_index)
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND non_unique = 0
+      AND table_name IN ('carrinho', 'carrinho_produto')
+    GROUP BY table_name, index_name
+"""
+_chaves_carrinho = {'ok': None}   # None = ainda não conferido (banco fora ao subir)
+
+
+def registrar_chaves_carrinho(linhas):
+    encontradas = {(tabela.lower(), colunas.lower()) for tabela, colunas in linhas}
+    _chaves_carrinho['ok'] = CHAVES_CARRINHO <= encontradas
+    if not _chaves_carrinho['ok']:
+        print("🚨 Chaves únicas do carrinho (uq_carrinho_aberto / uq_carrinho_produto) não encontradas! "
+              "O carrinho vai usar o caminho antigo, com trava no usuário, até rodar 'python migracoes.py' e reiniciar a API")
+    return _chaves_carrinho['ok']
+
+
+def conferir_chaves_carrinho(conectar):
+    # Confere uma vez, ao subir a API, se as chaves únicas do carrinho existem
+    conn = conectar()
+    if conn is None:
+        print("⚠️ Carrinho: banco indisponível ao subir; chaves conferidas na primeira chamada")
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SQL_CHAVES_CARRINHO)
+        registrar_chaves_carrinho(cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def chaves_carrinho(cur):
+    # True se os upserts podem ser usados; confere aqui se não deu para conferir ao subir
+    if _chaves_carrinho['ok'] is None:
+        cur.execute(SQL_CHAVES_CARRINHO)
+        registrar_chaves_carrinho(cur.fetchall())
+    return _chaves_carrinho['ok']
+
+
+def carrinho_aberto(cur, usuario_id):
+    # Devolve o carrinho aberto do usuário, criando se não existir
+    if chaves_carrinho(cur):
+        cur.execute(SQL_CARRINHO_ABERTO, (usuario_id,))
+        return cur.lastrowid
+
+    # Sem a chave única: a trava no usuário impede dois carrinhos abertos
+    cur.execute(SQL_TRAVAR_USUARIO, (usuario_id,))
+    cur.fetchall()
+    cur.execute(SQL_BUSCAR_CARRINHO_ABERTO, (usuario_id,))
+    carrinho = cur.fetchone()
+    if carrinho:
+        return carrinho[0]
+    cur.execute(SQL_CRIAR_CARRINHO, (usuario_id,))
+    return cur.lastrowid
+
+
+def gravar_itens(cur, carrinho_id, itens, somar=True):
+    # itens: [(produto_id, quantidade)]; soma à quantidade atual ou define a quantidade.
+    # Chamar depois de carrinho_aberto (no caminho antigo a trava do usuário já está com a transação)
+    if chaves_carrinho(cur):
+        cur.executemany(SQL_SOMAR_ITEM if somar else SQL_DEFINIR_ITEM,
+                        [(carrinho_id, produto_id, quantidade) for produto_id, quantidade in itens])
+        return
+
+    for produto_id, quantidade in itens:
+        cur.execute(SQL_BUSCAR_ITEM, (carrinho_id, produto_id))
+        item = cur.fetchone()
+        if item:
+            cur.execute(SQL_SOMAR_ITEM_EXISTENTE if somar else SQL_DEFINIR_ITEM_EXISTENTE, (quantidade, item[0]))
+        else:
+            cur.execute(SQL_INSERIR_ITEM, (carrinho_id, produto_id, quantidade))
+
+
+conferir_chaves_carrinho(get_connection)
+
+
 #--------------------------------
 # Adicionar produto ao carrinho
 @app.route("/add_carrinho", methods=["POST"])
@@ -1288,54 +1696,109 @@ def add_carrinho():
     usuario_id = data["usuario_id"]
     produto_id = data["produto_id"]
     quantidade = data.get("quantidade", 1)
+    if not isinstance(quantidade, int) or quantidade < 1:
+        return jsonify({"status": "erro", "msg": "Quantidade inválida"}), 400
 
     conn = get_connection()
     cur = conn.cursor(buffered=True)  # ⚡ importante
 
-    # 1️⃣ Verifica se existe carrinho aberto para o usuário
-    cur.execute(
-        "SELECT idCarrinho FROM carrinho WHERE Usuario_idUsuario=%s AND status='aberto'",
-        (usuario_id,)
-    )
-    carrinho = cur.fetchone()
+    try:
+        # 1️⃣ Carrinho aberto do usuário (criado no primeiro toque)
+        carrinho_id = carrinho_aberto(cur, usuario_id)
+
+        # 2️⃣ Soma a quantidade se o produto já estiver no carrinho
+        gravar_itens(cur, carrinho_id, [(produto_id, quantidade)])
 
-    if carrinho:
-        carrinho_id = carrinho[0]
-    else:
-        # Cria novo carrinho sem coluna inexistente
-        cur.execute(
-            "INSERT INTO carrinho (data_criacao, Usuario_idUsuario, status) VALUES (NOW(), %s, 'aberto')",
-            (usuario_id,)
-        )
         conn.commit()
-        carrinho_id = cur.lastrowid
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"status": "erro", "msg": str(e)}), 500
+    finally:
+        cur.close()
+        conn.close()
 
-    # 2️⃣ Verifica se o produto já está no carrinho
-    cur.execute(
-        "SELECT idCarrinho_Produtos, quantidade FROM carrinho_produto WHERE Carrinho_idCarrinho=%s AND Produtos_idProdutos=%s",
-        (carrinho_id, produto_id)
-    )
-    produto_no_carrinho = cur.fetchone()
+    return jsonify({"status": "sucesso", "msg": "Produto adicionado ao carrinho"})
 
-    if produto_no_carrinho:
-        # Atualiza quantidade
-        nova_quantidade = produto_no_carrinho[1] + quantidade
-        cur.execute(
-            "UPDATE carrinho_produto SET quantidade=%s, data_criacao=NOW() WHERE idCarrinho_Produtos=%s",
-            (nova_quantidade, produto_no_carrinho[0])
-        )
-    else:
-        # Insere produto novo no carrinho correto
-        cur.execute(
-            "INSERT INTO carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos, quantidade, data_criacao) VALUES (%s, %s, %s, NOW())",
-            (carrinho_id, produto_id, quantidade)
-        )
+#-------------------------------------------------
+# Aplicar várias alterações no carrinho de uma vez
+#-------------------------------------------------
+# Corpo: {"operacoes": [{"op": "add", "produto_id": 1, "quantidade": 2},
+#                       {"op": "set", "produto_id": 2, "quantidade": 5},
+#                       {"op": "remove", "produto_id": 3}]}
+# As operações são aplicadas em ordem, numa única transação.
+@app.route("/carrinho/<int:usuario_id>/itens", methods=["POST"])
+def alterar_carrinho_lote(usuario_id):
+    data = request.get_json() or {}
+    operacoes = data.get("operacoes")
+    if not isinstance(operacoes, list) or not operacoes:
+        return jsonify({"status": "erro", "msg": "Campo 'operacoes' (lista) é obrigatório"}), 400
+    if len(operacoes) > 200:
+        return jsonify({"status": "erro", "msg": "Máximo de 200 operações por chamada"}), 400
+
+    # Reduz as operações a um estado final por produto:
+    #   ('somar', n) -> quantidade atual + n | ('definir', n) -> n | ('remover', 0)
+    final = {}
+    for i, operacao in enumerate(operacoes):
+        op = operacao.get("op")
+        produto_id = operacao.get("produto_id")
+        quantidade = operacao.get("quantidade", 1)
+        if not isinstance(produto_id, int) or op not in ("add", "set", "remove") or \
+                (op != "remove" and not isinstance(quantidade, int)) or (op == "add" and quantidade < 1):
+            return jsonify({"status": "erro", "msg": f"Operação {i} inválida"}), 400
+
+        tipo, atual = final.get(produto_id, (None, 0))
+        if op == "remove" or (op == "set" and quantidade <= 0):
+            final[produto_id] = ("remover", 0)
+        elif op == "set":
+            final[produto_id] = ("definir", quantidade)
+        elif tipo == "remover":
+            final[produto_id] = ("definir", quantidade)
+        elif tipo == "definir":
+            final[produto_id] = ("definir", atual + quantidade)
+        else:
+            final[produto_id] = ("somar", atual + quantidade)
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    conn = get_connection()
+    if conn is None:
+        return jsonify({"status": "erro", "msg": "Não foi possível conectar ao banco de dados"}), 500
+    cur = conn.cursor(buffered=True)
 
-    return jsonify({"status": "sucesso", "msg": "Produto adicionado ao carrinho"})
+    try:
+        carrinho_id = carrinho_aberto(cur, usuario_id)
+
+        somar = [(p, q) for p, (tipo, q) in final.items() if tipo == "somar"]
+        definir = [(p, q) for p, (tipo, q) in final.items() if tipo == "definir"]
+        remover = [p for p, (tipo, _) in final.items() if tipo == "remover"]
+
+        if somar:
+            gravar_itens(cur, carrinho_id, somar)
+        if definir:
+            gravar_itens(cur, carrinho_id, definir, somar=False)
+        if remover:
+            cur.execute(f"""
+                DELETE FROM carrinho_produto
+                WHERE Carrinho_idCarrinho = %s AND Produtos_idProdutos IN ({', '.join(['%s'] * len(remover))})
+            """, (carrinho_id, *remover))
+
+        conn.commit()
+
+        cur.execute("""
+            SELECT idCarrinho_Produtos, Produtos_idProdutos, quantidade
+            FROM carrinho_produto
+            WHERE Carrinho_idCarrinho = %s
+        """, (carrinho_id,))
+        itens = [
+            {"id": id_item, "produto_id": produto_id, "quantidade": quantidade}
+            for id_item, produto_id, quantidade in cur.fetchall()
+        ]
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"status": "erro", "msg": str(e)}), 500
+    finally:
+        cur.close()
+        conn.close()
+
+    return jsonify({"status": "ok", "carrinho_id": carrinho_id, "itens": itens})
 
 #----------------------------------------------
 # Alterar quantidade do produto no carrinho
@@ -1373,6 +1836,8 @@ def remove_carrinho(cart_prod_id):
 #-------------------------------------
 # Remover todos os itens do carrinho
 #-------------------------------------
+SQL_CONTAR_ITENS_CARRINHO = "SELECT COUNT(*) FROM carrinho_produto WHERE Carrinho_idCarrinho = %s"
+
 @app.route('/remove_produto_carrinho', methods=['POST'])
 def remove_produto_carrinho():
     data = request.get_json()
@@ -1389,10 +1854,7 @@ def remove_produto_carrinho():
     )
 
     # 2️⃣ Verifica se ainda existem produtos naquele carrinho
-    cur.execute(
-        "SELECT COUNT(*) FROM carrinho_produto WHERE Carrinho_idCarrinho = %s",
-        (carrinho_id,)
-    )
+    cur.execute(SQL_CONTAR_ITENS_CARRINHO, (carrinho_id,))
     count = cur.fetchone()[0]
 
     # 3️⃣ Se não houver produtos, deleta o carrinho
@@ -1465,13 +1927,15 @@ def endereco_usuario(usuario_id):
 # ==========================
 # 3. Cupom
 # ==========================
+SQL_CUPOM_VALIDO = "SELECT * FROM cupom WHERE codigo=%s AND ativo=1 AND data_validade>=CURDATE()"
+
 @app.route("/validar_cupom", methods=["POST"])
 def validar_cupom():
     data = request.json
     codigo = data.get("codigo")
     conn = get_connection()
     cur = conn.cursor(dictionary=True, buffered=True)
-    cur.execute("SELECT * FROM cupom WHERE codigo=%s AND ativo=1 AND data_validade>=CURDATE()", (codigo,))
+    cur.execute(SQL_CUPOM_VALIDO, (codigo,))
     cupom = cur.fetchone()
     cur.close()
     conn.close()
@@ -1511,6 +1975,16 @@ def adicionar_cartao():
 from datetime import datetime
 import pytz
 
+def sql_travar_produtos(quantidade):
+    # Trava as linhas dos produtos do pedido em ordem de id (IN com um %s por produto)
+    return f"""
+        SELECT idProdutos, nome, quantidade_estoque, quantidade_reservada
+        FROM produtos
+        WHERE idProdutos IN ({', '.join(['%s'] * quantidade)})
+        ORDER BY idProdutos
+        FOR UPDATE
+    """
+
 @app.route("/criar_pedido", methods=["POST"])
 def criar_pedido():
     data = request.json
@@ -1528,93 +2002,168 @@ def criar_pedido():
     brasil = pytz.timezone('America/Sao_Paulo')
     data_status = datetime.now(brasil).strftime('%Y-%m-%d %H:%M:%S')
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # Verifica o estoque e a quantidade de cada produto
-    for item in data["items"]:
+    # Verifica a quantidade de cada produto (antes de abrir conexão)
+    itens = data["items"]
+    if not itens:
+        return jsonify({"erro": "O pedido não tem itens."}), 400
+    quantidades = {}
+    for item in itens:
         if item["quantity"] is None or item["quantity"] <= 0:
-            cur.close()
-            conn.close()
             return jsonify({
                 "erro": f"Quantidade inválida para '{item.get('nome', 'produto')}'. Selecione ao menos 1 unidade."
             }), 400
+        quantidades[item["id"]] = quantidades.get(item["id"], 0) + item["quantity"]
 
-        cur.execute("""
-            SELECT quantidade_estoque, nome FROM produtos WHERE idProdutos = %s
-        """, (item["id"],))
-        result = cur.fetchone()
-        if not result or result[0] < item["quantity"]:
-            nome_produto = result[1] if result else "Produto desconhecido"
-            cur.close()
-            conn.close()
-            return jsonify({
-                "erro": f"Estoque insuficiente para '{nome_produto}'. Disponível: {result[0] if result else 0}"
-            }), 400
+    ids = sorted(quantidades)
 
-    # Insere o pedido com data_status correta
-    cur.execute("""
-        INSERT INTO relatorio_pedido
-        (Usuario_idUsuario, endereco, valor_total, valor_frete, valor_desconto, cupom_codigo, status, observacao, tipo_pagamento, data_status)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    """, (usuario_id, endereco, valor_total, valor_frete, valor_desconto, cupom_codigo, status, observacao, pagamento, data_status))
+    conn = get_connection()
+    if conn is None:
+        return jsonify({"erro": "Não foi possível conectar ao banco de dados"}), 500
+    cur = conn.cursor()
 
-    pedido_id = cur.lastrowid
-    for item in data["items"]:
+    try:
+        # 1️⃣ Trava as linhas de todos os produtos do pedido (sempre na mesma ordem
+        #    para evitar deadlock). Outro checkout dos mesmos produtos espera aqui.
+        #    A reserva dos pedidos em aberto fica na própria linha do produto.
+        cur.execute(sql_travar_produtos(len(ids)), tuple(ids))
+        produtos = {id_produto: (nome, estoque, reservada) for id_produto, nome, estoque, reservada in cur.fetchall()}
+
+        # 2️⃣ Disponível = estoque - reservado (o estoque só é baixado quando o pedido vira "Entregue")
+        for id_produto in ids:
+            if id_produto not in produtos:
+                conn.rollback()
+                return jsonify({
+                    "erro": "Estoque insuficiente para 'Produto desconhecido'. Disponível: 0"
+                }), 400
+            nome_produto, estoque, reservada = produtos[id_produto]
+            disponivel = int(estoque) - int(reservada)
+            if disponivel < quantidades[id_produto]:
+                conn.rollback()
+                return jsonify({
+                    "erro": f"Estoque insuficiente para '{nome_produto}'. Disponível: {max(disponivel, 0)}"
+                }), 400
+        atualizar_estoque(cur, quantidades, reserva=1)
+
+        # 3️⃣ Insere o pedido com data_status correta
         cur.execute("""
+            INSERT INTO relatorio_pedido
+            (Usuario_idUsuario, endereco, valor_total, valor_frete, valor_desconto, cupom_codigo, status, observacao, tipo_pagamento, data_status)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        """, (usuario_id, endereco, valor_total, valor_frete, valor_desconto, cupom_codigo, status, observacao, pagamento, data_status))
+        pedido_id = cur.lastrowid
+
+        # 4️⃣ Todas as linhas do pedido num único INSERT de várias linhas
+        cur.executemany("""
             INSERT INTO relatorio_pedido_produto
             (Relatorio_Pedido_id, Produto_id, quantidade, preco_unitario)
             VALUES (%s,%s,%s,%s)
-        """, (pedido_id, item["id"], item["quantity"], item["price"]))
+        """, [(pedido_id, item["id"], item["quantity"], item["price"]) for item in itens])
 
-    conn.commit()
-    cur.close()
-    conn.close()
+        # 5️⃣ Soma o pedido novo nos rollups de vendas
+        rollups.aplicar(cur, [pedido_id], 1)
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"erro": f"Erro ao criar pedido: {str(e)}"}), 500
+    finally:
+        cur.close()
+        conn.close()
 
+    marcar_escrita(f'usuario:{usuario_id}')
     return jsonify({"mensagem": "Pedido criado!", "pedido_id": pedido_id})
 
 #===================================================================================================================================================================================
 #                                                                              Histórico Pedido (OrderScreen)
 #===================================================================================================================================================================================
 
+# ?limit=&after= (paginação), ?sort=id|data&order=asc|desc, ?status=, ?data_inicio=&data_fim=
+# ?include_items=false devolve só o resumo dos pedidos (sem a lista de itens)
+def consulta_pedidos_usuario(args, usuario_id):
+    # Monta a consulta paginada dos pedidos do usuário (ParametroInvalido se os filtros forem inválidos)
+    pagina = Pagina(args, {
+        'id': ('idRelatorio_Pedido', 'idRelatorio_Pedido'),
+        'data': ('data_status', 'data_status'),
+    }, 'id', ('idRelatorio_Pedido', 'idRelatorio_Pedido'))
+    condicoes, params = ['Usuario_idUsuario = %s'], [usuario_id]
+    if args.get('status'):
+        condicao, valores = filtro_lista('status', args['status'])
+        condicoes.append(condicao)
+        params += valores
+    periodo, valores = filtro_periodo('data_status', args)
+    condicoes += periodo
+    params += valores
+    incluir_itens = ler_flag(args.get('include_items', '1'))
+    sql, params = pagina.montar("SELECT * FROM relatorio_pedido", condicoes, params)
+    return pagina, sql, params, incluir_itens
+
+
+def sql_itens_pedidos(quantidade):
+    # Itens de vários pedidos numa única consulta (IN com um %s por pedido)
+    return f"""
+        SELECT rp.Relatorio_Pedido_id, p.nome, rp.quantidade, rp.preco_unitario
+        FROM relatorio_pedido_produto rp
+        JOIN produtos p ON p.idProdutos = rp.Produto_id
+        WHERE rp.Relatorio_Pedido_id IN ({', '.join(['%s'] * quantidade)})
+    """
+
+
+def juntar_itens_pedidos(pedidos, itens):
+    itens_por_pedido = {pedido["idRelatorio_Pedido"]: [] for pedido in pedidos}
+    for item in itens:
+        itens_por_pedido[item.pop("Relatorio_Pedido_id")].append(item)
+    for pedido in pedidos:
+        pedido["items"] = itens_por_pedido[pedido["idRelatorio_Pedido"]]
+
+
 @app.route("/listar_pedidos/<int:usuario_id>", methods=["GET"])
 def listar_pedidos_usuario(usuario_id):
-    conn = get_connection()
+    try:
+        pagina, sql, params, incluir_itens = consulta_pedidos_usuario(request.args, usuario_id)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    conn = get_connection_leitura(f'usuario:{usuario_id}')
     cur = conn.cursor(dictionary=True)
 
     # pega pedidos
-    cur.execute("""
-        SELECT * FROM relatorio_pedido
-        WHERE Usuario_idUsuario = %s
-       
-    """, (usuario_id,))
-    pedidos = cur.fetchall()
+    cur.execute(sql, params)
+    pedidos = pagina.cortar(cur.fetchall())
 
-    # pega itens de cada pedido
-    for pedido in pedidos:
-        cur.execute("""
-            SELECT p.nome, rp.quantidade, rp.preco_unitario
-            FROM relatorio_pedido_produto rp
-            JOIN produtos p ON p.idProdutos = rp.Produto_id
-            WHERE rp.Relatorio_Pedido_id = %s
-        """, (pedido["idRelatorio_Pedido"],))
-        pedido["items"] = cur.fetchall()
+    # pega os itens de todos os pedidos da página numa única consulta
+    if incluir_itens and pedidos:
+        ids = tuple(pedido["idRelatorio_Pedido"] for pedido in pedidos)
+        cur.execute(sql_itens_pedidos(len(ids)), ids)
+        juntar_itens_pedidos(pedidos, cur.fetchall())
 
     cur.close()
     conn.close()
-    return jsonify(pedidos)
+    return pagina.aplicar_cabecalho(jsonify(pedidos))
 
 
 #=============================================================
 # GET - Listar todos os relatórios de pedidos - Administrador
 #===============================================
 
-@app.route('/relatorios_pedidos', methods=['GET'])
-def listar_relatorios():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
+# ?limit=&after= (paginação), ?sort=id|data&order=asc|desc, ?status=, ?data_inicio=&data_fim=, ?usuario_id=
+def consulta_relatorios(args):
+    # Monta a consulta paginada dos relatórios (ParametroInvalido se os filtros forem inválidos)
+    pagina = Pagina(args, {
+        'id': ('rp.idRelatorio_Pedido', 'idRelatorio_Pedido'),
+        'data': ('rp.data_status', 'data_status'),
+    }, 'id', ('rp.idRelatorio_Pedido', 'idRelatorio_Pedido'), direcao_padrao='desc')
+    condicoes, params = [], []
+    if args.get('status'):
+        condicao, valores = filtro_lista('rp.status', args['status'])
+        condicoes.append(condicao)
+        params += valores
+    if args.get('usuario_id'):
+        condicoes.append('rp.Usuario_idUsuario = %s')
+        params.append(args['usuario_id'])
+    periodo, valores = filtro_periodo('rp.data_status', args)
+    condicoes += periodo
+    params += valores
+    sql, params = pagina.montar("""
         SELECT 
             rp.idRelatorio_Pedido,
             rp.Usuario_idUsuario,
@@ -1629,56 +2178,356 @@ def listar_relatorios():
             rp.observacao,
             rp.tipo_pagamento
         FROM relatorio_pedido rp
-        JOIN usuario u ON rp.Usuario_idUsuario = u.idUsuario
-        ORDER BY rp.idRelatorio_Pedido DESC
-    """)
+        JOIN usuario u ON rp.Usuario_idUsuario = u.idUsuario""", condicoes, params)
+    return pagina, sql, params
+
 
-    relatorios = cursor.fetchall()
+@app.route('/relatorios_pedidos', methods=['GET'])
+def listar_relatorios():
+    try:
+        pagina, sql, params = consulta_relatorios(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    conn = get_connection_leitura()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(sql, params)
+
+    relatorios = pagina.cortar(cursor.fetchall())
     cursor.close()
     conn.close()
 
-    return jsonify(relatorios), 200
+    return pagina.aplicar_cabecalho(jsonify(relatorios)), 200
+
+
+#=============================================================
+# GET - Exportar relatórios de pedidos em streaming - Administrador
+#===============================================
+
+# ?formato=ndjson|csv, ?status=, ?data_inicio=&data_fim=, ?itens=1
+# Cursor sem buffer (as linhas vêm do MySQL aos poucos) + resposta em gerador:
+# a memória usada não depende de quantos pedidos são exportados.
+EXPORT_LOTE = int(os.getenv('EXPORT_LOTE', 500))
+COLUNAS_EXPORT = ['idRelatorio_Pedido', 'Usuario_idUsuario', 'nome_usuario', 'telefone_usuario',
+                  'endereco', 'valor_total', 'valor_frete', 'valor_desconto', 'status',
+                  'data_status', 'observacao', 'tipo_pagamento']
+COLUNAS_EXPORT_ITEM = ['Produto_id', 'nome_produto', 'quantidade', 'preco_unitario']
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S')
+    return str(valor)
+
+
+@app.route('/relatorios_pedidos/export', methods=['GET'])
+def exportar_relatorios():
+    formato = request.args.get('formato', 'ndjson').lower()
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({"erro": "formato deve ser 'ndjson' ou 'csv'"}), 400
+    try:
+        incluir_itens = bool(ler_flag(request.args.get('itens')))
+        condicoes, params = [], []
+        if request.args.get('status'):
+            condicao, valores = filtro_lista('rp.status', request.args['status'])
+            condicoes.append(condicao)
+            params += valores
+        periodo, valores = filtro_periodo('rp.data_status', request.args)
+        condicoes += periodo
+        params += valores
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    colunas_itens, join_itens = '', ''
+    if incluir_itens:
+        # Um único LEFT JOIN ordenado pelo pedido: as linhas de um mesmo pedido
+        # chegam juntas e são agrupadas enquanto passam
+        colunas_itens = """,
+            rpp.Produto_id, p.nome AS nome_produto, rpp.quantidade, rpp.preco_unitario"""
+        join_itens = """
+        LEFT JOIN relatorio_pedido_produto rpp ON rpp.Relatorio_Pedido_id = rp.idRelatorio_Pedido
+        LEFT JOIN produtos p ON p.idProdutos = rpp.Produto_id"""
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+    sql = f"""
+        SELECT
+            rp.idRelatorio_Pedido, rp.Usuario_idUsuario,
+            u.nome_completo AS nome_usuario, u.telefone AS telefone_usuario,
+            rp.endereco, rp.valor_total, rp.valor_frete, rp.valor_desconto,
+            rp.status, rp.data_status, rp.observacao, rp.tipo_pagamento{colunas_itens}
+        FROM relatorio_pedido rp
+        JOIN usuario u ON rp.Usuario_idUsuario = u.idUsuario{join_itens}
+        {where}
+        ORDER BY rp.idRelatorio_Pedido"""
+
+    conn = get_connection_leitura()
+    if conn is None:
+        return jsonify({"erro": "Não foi possível conectar ao banco de dados"}), 500
+
+    def linhas_do_banco():
+        # cursor() padrão do mysql-connector não faz buffer do resultado
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, tuple(params))
+            while True:
+                lote = cursor.fetchmany(EXPORT_LOTE)
+                if not lote:
+                    break
+                yield from lote
+        finally:
+            cursor.close()
+            conn.close()
+
+    def pedidos_agrupados():
+        # Junta as linhas consecutivas do mesmo pedido num único dict com "items"
+        atual = None
+        for linha in linhas_do_banco():
+            if atual is None or atual['idRelatorio_Pedido'] != linha['idRelatorio_Pedido']:
+                if atual is not None:
+                    yield atual
+                atual = {coluna: linha[coluna] for coluna in COLUNAS_EXPORT}
+                atual['items'] = []
+            if linha['Produto_id'] is not None:
+                atual['items'].append({coluna: linha[coluna] for coluna in COLUNAS_EXPORT_ITEM})
+        if atual is not None:
+            yield atual
+
+    def gerar_ndjson():
+        pedidos = pedidos_agrupados() if incluir_itens else linhas_do_banco()
+        bloco = []
+        for pedido in pedidos:
+            bloco.append(app.json.dumps(pedido))
+            if len(bloco) >= EXPORT_LOTE:
+                yield '\n'.join(bloco) + '\n'
+                bloco = []
+        if bloco:
+            yield '\n'.join(bloco) + '\n'
+
+    def gerar_csv():
+        # Com itens: uma linha por item do pedido (pedido sem itens sai com as colunas de item vazias)
+        colunas = COLUNAS_EXPORT + (COLUNAS_EXPORT_ITEM if incluir_itens else [])
+        saida = io.StringIO()
+        escritor = csv.writer(saida)
+        escritor.writerow(colunas)
+        for numero, linha in enumerate(linhas_do_banco(), start=1):
+            escritor.writerow([_valor_csv(linha[coluna]) for coluna in colunas])
+            if numero % EXPORT_LOTE == 0:
+                yield saida.getvalue()
+                saida.seek(0)
+                saida.truncate()
+        yield saida.getvalue()
+
+    if formato == 'csv':
+        corpo, mimetype = gerar_csv(), 'text/csv'
+    else:
+        corpo, mimetype = gerar_ndjson(), 'application/x-ndjson'
+    resposta = Response(stream_with_context(corpo), mimetype=mimetype)
+    resposta.headers['Content-Disposition'] = f'attachment; filename=relatorios_pedidos.{formato}'
+    resposta.headers['X-Accel-Buffering'] = 'no'   # proxies não devem segurar o stream
+    return resposta
+
+
+# Transições de status permitidas (comparação sem diferenciar maiúsculas)
+FLUXO_STATUS = ['realizado', 'produção', 'pronto', 'a caminho', 'entregue']
+STATUS_FINAIS = {'entregue', 'cancelado'}
+
+
+def transicao_permitida(atual, novo):
+    atual, novo = (atual or 'realizado').lower(), novo.lower()
+    if atual in STATUS_FINAIS:
+        return False
+    if novo == 'cancelado':
+        return True
+    if atual not in FLUXO_STATUS or novo not in FLUXO_STATUS:
+        return False
+    return FLUXO_STATUS.index(novo) > FLUXO_STATUS.index(atual)
+
+
+def atualizar_estoque(cursor, quantidades, reserva=0, baixar=False):
+    # quantidades: {id_produto: quantidade}, num único UPDATE em ordem de id (mesma ordem do criar_pedido).
+    # reserva: +1 reserva, -1 libera a reserva; baixar: tira do estoque na entrega
+    # (mantém a regra antiga: só baixa se houver estoque suficiente)
+    ids = sorted(quantidades)
+    caso = 'CASE idProdutos ' + ' '.join(['WHEN %s THEN %s'] * len(ids)) + ' END'
+    valores = [v for id_produto in ids for v in (id_produto, quantidades[id_produto])]
+    cursor.execute(f"""
+        UPDATE produtos
+        SET quantidade_estoque = IF(%s AND quantidade_estoque >= {caso}, quantidade_estoque - {caso}, quantidade_estoque),
+            quantidade_reservada = GREATEST(quantidade_reservada + %s * {caso}, 0)
+        WHERE idProdutos IN ({', '.join(['%s'] * len(ids))})
+        ORDER BY idProdutos
+    """, (int(baixar), *valores, *valores, reserva, *valores, *ids))
+
+
+def atualizar_estoque_pedidos(cursor, pedido_ids, reserva=0, baixar=False):
+    # Mesmo que atualizar_estoque, com as quantidades somadas dos itens dos pedidos
+    cursor.execute(f"""
+        SELECT Produto_id, SUM(quantidade)
+        FROM relatorio_pedido_produto
+        WHERE Relatorio_Pedido_id IN ({', '.join(['%s'] * len(pedido_ids))})
+        GROUP BY Produto_id
+    """, tuple(pedido_ids))
+    quantidades = {id_produto: int(total) for id_produto, total in cursor.fetchall()}
+    if quantidades:
+        atualizar_estoque(cursor, quantidades, reserva, baixar)
+    return sorted(quantidades)   # produtos alterados
+
+
+def reserva_ao_mudar(atual, novo):
+    # +1 quando o pedido passa a segurar estoque, -1 quando deixa de segurar
+    # (pedidos entregues ou cancelados não têm reserva)
+    antes = (atual or 'realizado').lower() not in STATUS_FINAIS
+    depois = novo.lower() not in STATUS_FINAIS
+    return int(depois) - int(antes)
 
 
 # PUT - Atualizar status de um pedido
 @app.route('/update_relatorios_pedidos/<int:id_relatorio>', methods=['PUT'])
 def atualizar_status(id_relatorio):
-    data = request.json
+    data = request.get_json() or {}
     novo_status = data.get("status")
-    if not novo_status:
-        return jsonify({"erro": "Campo 'status' é obrigatório"}), 400
+    if not novo_status or not isinstance(novo_status, str):
+        return jsonify({"erro": "Campo 'status' (texto) é obrigatório"}), 400
 
     conn = get_connection()
+    if conn is None:
+        return jsonify({"erro": "Não foi possível conectar ao banco de dados"}), 500
     cursor = conn.cursor()
 
-    cursor.execute("""
-        UPDATE relatorio_pedido
-        SET status = %s
-        WHERE idRelatorio_Pedido = %s""", 
-        (novo_status, id_relatorio))
-
-    # Só atualiza o estoque se o status for "Entregue"
-    if novo_status.lower() == "entregue":
-        # Busca os produtos do pedido
+    try:
         cursor.execute("""
-            SELECT Produto_id, quantidade
-            FROM relatorio_pedido_produto
-            WHERE Relatorio_Pedido_id = %s
-        """, (id_relatorio,))
-        produtos = cursor.fetchall()
-        for produto_id, quantidade in produtos:
-            cursor.execute("""
-                UPDATE produtos
-                SET quantidade_estoque = quantidade_estoque - %s
-                WHERE idProdutos = %s AND quantidade_estoque >= %s
-            """, (quantidade, produto_id, quantidade))
+            SELECT status, Usuario_idUsuario FROM relatorio_pedido
+            WHERE idRelatorio_Pedido = %s
+            FOR UPDATE""", (id_relatorio,))
+        atual = cursor.fetchone()
+        if atual is None:
+            conn.rollback()
+            return jsonify({"erro": "Pedido não encontrado"}), 404
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+        status_atual, dono = atual
+        if (status_atual or '').lower() == novo_status.lower():
+            conn.rollback()
+            return jsonify({"mensagem": "Status já estava atualizado"}), 200
+        # Mesma regra da rota em lote: só avança no fluxo ou cancela; entregue/cancelado
+        # são finais (voltar de "Entregue" deixaria o estoque baixado sem devolver)
+        if not transicao_permitida(status_atual, novo_status):
+            conn.rollback()
+            return jsonify({"erro": f"Não é possível mudar de '{status_atual}' para '{novo_status}'",
+                            "status_atual": status_atual}), 409
+
+        # Rollups: tira o pedido do balde do status antigo e soma no novo
+        rollups.aplicar(cursor, [id_relatorio], -1)
+        cursor.execute("""
+            UPDATE relatorio_pedido
+            SET status = %s
+            WHERE idRelatorio_Pedido = %s""",
+            (novo_status, id_relatorio))
+        rollups.aplicar(cursor, [id_relatorio], 1)
+
+        # Só baixa o estoque quando o pedido PASSA a ser "Entregue"; a reserva é liberada
+        # ao entregar/cancelar
+        baixou_estoque = novo_status.lower() == "entregue"
+        reserva = reserva_ao_mudar(status_atual, novo_status)
+        produtos = []
+        if baixou_estoque or reserva:
+            produtos = atualizar_estoque_pedidos(cursor, [id_relatorio], reserva, baixou_estoque)
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"erro": f"Erro ao atualizar pedido: {str(e)}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    marcar_escrita(f'usuario:{dono}')   # o cliente vê o status novo no histórico
+
+    # Estoque aparece no catálogo
+    if baixou_estoque:
+        produtos_alterados(produtos)
 
     return jsonify({"mensagem": "Status atualizado com sucesso"}), 200
 
+
+# PUT - Atualizar o status de vários pedidos de uma vez (ex.: fechamento do dia)
+# Corpo: {"ids": [1, 2, 3], "status": "Entregue"}
+@app.route('/update_relatorios_pedidos', methods=['PUT'])
+def atualizar_status_lote():
+    data = request.get_json() or {}
+    novo_status = data.get("status")
+    ids = data.get("ids")
+    if not novo_status or not isinstance(ids, list) or not ids:
+        return jsonify({"erro": "Campos 'status' e 'ids' (lista) são obrigatórios"}), 400
+    if len(ids) > 1000:
+        return jsonify({"erro": "Máximo de 1000 pedidos por chamada"}), 400
+    try:
+        ids = sorted({int(i) for i in ids})
+    except (TypeError, ValueError):
+        return jsonify({"erro": "'ids' deve conter apenas números"}), 400
+
+    conn = get_connection()
+    if conn is None:
+        return jsonify({"erro": "Não foi possível conectar ao banco de dados"}), 500
+    cursor = conn.cursor()
+
+    try:
+        # 1️⃣ Trava e lê o status atual de todos os pedidos
+        cursor.execute(f"""
+            SELECT idRelatorio_Pedido, status, Usuario_idUsuario
+            FROM relatorio_pedido
+            WHERE idRelatorio_Pedido IN ({', '.join(['%s'] * len(ids))})
+            FOR UPDATE
+        """, tuple(ids))
+        linhas = cursor.fetchall()
+        atuais = {pedido_id: status for pedido_id, status, _ in linhas}
+        donos = {pedido_id: usuario_id for pedido_id, _, usuario_id in linhas}
+
+        atualizados, ignorados, invalidos, produtos = [], [], [], []
+        nao_encontrados = [i for i in ids if i not in atuais]
+        for pedido_id, status_atual in sorted(atuais.items()):
+            if (status_atual or '').lower() == novo_status.lower():
+                ignorados.append(pedido_id)
+            elif transicao_permitida(status_atual, novo_status):
+                atualizados.append(pedido_id)
+            else:
+                invalidos.append({"id": pedido_id, "status_atual": status_atual})
+
+        # 2️⃣ Um UPDATE para os pedidos e, se entregues, um UPDATE para o estoque
+        if atualizados:
+            rollups.aplicar(cursor, atualizados, -1)
+            cursor.execute(f"""
+                UPDATE relatorio_pedido
+                SET status = %s
+                WHERE idRelatorio_Pedido IN ({', '.join(['%s'] * len(atualizados))})
+            """, (novo_status, *atualizados))
+            rollups.aplicar(cursor, atualizados, 1)
+            # Só há transição a partir de status em aberto: entregue/cancelado liberam a reserva
+            reserva = reserva_ao_mudar('realizado', novo_status)
+            if reserva or novo_status.lower() == "entregue":
+                produtos = atualizar_estoque_pedidos(cursor, atualizados, reserva, novo_status.lower() == "entregue")
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"erro": f"Erro ao atualizar pedidos: {str(e)}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    if atualizados:
+        marcar_escrita(*{f'usuario:{donos[pedido_id]}' for pedido_id in atualizados})
+    if atualizados and novo_status.lower() == "entregue":
+        produtos_alterados(produtos)
+
+    return jsonify({
+        "mensagem": f"{len(atualizados)} pedido(s) atualizado(s)",
+        "atualizados": atualizados,
+        "ignorados": ignorados,
+        "invalidos": invalidos,
+        "nao_encontrados": nao_encontrados,
+    }), 200
+
 #=============================================================
 # Cancelar Pedido (atualiza status para cancelado) - Usuário
 #=============================================================
@@ -1693,9 +2542,10 @@ def cancelar_pedido(pedido_id):
 
         # 1️⃣ Verifica se o pedido existe e se está em status "Realizado"
         cursor.execute("""
-            SELECT idRelatorio_Pedido, status 
+            SELECT idRelatorio_Pedido, status, Usuario_idUsuario
             FROM relatorio_pedido 
             WHERE idRelatorio_Pedido = %s
+            FOR UPDATE
         """, (pedido_id,))
         
         pedido = cursor.fetchone()
@@ -1706,17 +2556,22 @@ def cancelar_pedido(pedido_id):
         if pedido['status'].lower() != 'realizado':
             return jsonify({'error': 'Apenas pedidos com status "Realizado" podem ser cancelados'}), 400
 
-        # 2️⃣ Atualiza o status para "Cancelado"
+        # 2️⃣ Atualiza o status para "Cancelado" (e move o pedido de balde nos rollups)
+        rollups.aplicar(cursor, [pedido_id], -1)
         cursor.execute("""
             UPDATE relatorio_pedido 
             SET status = 'Cancelado', data_status = NOW()
             WHERE idRelatorio_Pedido = %s
         """, (pedido_id,))
+        cancelados = cursor.rowcount
+        rollups.aplicar(cursor, [pedido_id], 1)
+        atualizar_estoque_pedidos(cursor, [pedido_id], reserva=-1)   # libera a reserva
 
         conn.commit()
+        marcar_escrita(f"usuario:{pedido['Usuario_idUsuario']}")
 
         # 3️⃣ Verifica se foi atualizado
-        if cursor.rowcount == 0:
+        if cancelados == 0:
             return jsonify({'error': 'Erro ao cancelar o pedido'}), 500
 
         return jsonify({
@@ -1736,6 +2591,165 @@ def cancelar_pedido(pedido_id):
         if conn:
             conn.close()
 
+#=====================================================================================================================================================================================
+#                                                                           Analytics (lê só os rollups) - Administrador
+#=====================================================================================================================================================================================
+ANALYTICS_DIAS_PADRAO = 30
+
+
+def periodo_analytics(coluna):
+    # Sem data_inicio, os últimos ANALYTICS_DIAS_PADRAO dias
+    args = request.args.to_dict()
+    if not args.get('data_inicio'):
+        args['data_inicio'] = (datetime.now() - timedelta(days=ANALYTICS_DIAS_PADRAO)).strftime('%Y-%m-%d')
+    return filtro_periodo(coluna, args)
+
+
+# ------------------------
+# Vendas por dia/hora e status
+# ------------------------
+# ?data_inicio=&data_fim=, ?granularidade=dia|hora, ?status=
+@app.route('/analytics/vendas', methods=['GET'])
+def analytics_vendas():
+    granularidade = request.args.get('granularidade', 'dia')
+    if granularidade not in ('dia', 'hora'):
+        return jsonify({"erro": "granularidade deve ser 'dia' ou 'hora'"}), 400
+    try:
+        condicoes, params = periodo_analytics('hora')
+        if request.args.get('status'):
+            condicao, valores = filtro_lista('status', request.args['status'])
+            condicoes.append(condicao)
+            params += valores
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    # (%% porque o SQL passa pela substituição de parâmetros do conector)
+    periodo = "DATE_FORMAT(hora, '%%Y-%%m-%%d %%H:00')" if granularidade == 'hora' else "DATE_FORMAT(hora, '%%Y-%%m-%%d')"
+    conn = get_connection_leitura()
+    if conn is None:
+        return jsonify({"erro": "Não foi possível conectar ao banco de dados"}), 500
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT {periodo} AS periodo, status,
+                   CAST(SUM(pedidos) AS SIGNED) AS pedidos, SUM(receita) AS receita,
+                   SUM(descontos) AS descontos, SUM(frete) AS frete
+            FROM rollup_pedidos_hora
+            WHERE {' AND '.join(condicoes)}
+            GROUP BY periodo, status
+            HAVING SUM(pedidos) <> 0
+            ORDER BY periodo, status""", tuple(params))
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    totais = {}
+    for linha in linhas:
+        total = totais.setdefault(linha['status'], {'pedidos': 0, 'receita': 0, 'descontos': 0, 'frete': 0})
+        for campo in total:
+            total[campo] += linha[campo]
+    return jsonify({'periodos': linhas, 'totais': totais}), 200
+
+
+# ------------------------
+# Produtos/categorias mais vendidos
+# ------------------------
+# ?data_inicio=&data_fim=, ?agrupar=produto|categoria, ?status= (padrão: tudo menos Cancelado), ?limit=
+@app.route('/analytics/produtos', methods=['GET'])
+def analytics_produtos():
+    agrupar = request.args.get('agrupar', 'produto')
+    if agrupar not in ('produto', 'categoria'):
+        return jsonify({"erro": "agrupar deve ser 'produto' ou 'categoria'"}), 400
+    try:
+        limite = min(int(request.args.get('limit', 20)), 500)
+        if limite < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"erro": "limit deve ser um inteiro positivo"}), 400
+    try:
+        condicoes, params = periodo_analytics('r.dia')
+        if request.args.get('status'):
+            condicao, valores = filtro_lista('r.status', request.args['status'])
+            condicoes.append(condicao)
+            params += valores
+        else:
+            condicoes.append("r.status <> 'Cancelado'")
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    if agrupar == 'categoria':
+        sql = f"""
+            SELECT r.categoria, CAST(SUM(r.unidades) AS SIGNED) AS unidades, SUM(r.receita) AS receita
+            FROM rollup_produtos_dia r
+            WHERE {' AND '.join(condicoes)}
+            GROUP BY r.categoria
+            ORDER BY receita DESC
+            LIMIT %s"""
+    else:
+        sql = f"""
+            SELECT t.Produto_id, p.nome, t.categoria, t.unidades, t.receita
+            FROM (
+                SELECT r.Produto_id, MAX(r.categoria) AS categoria,
+                       CAST(SUM(r.unidades) AS SIGNED) AS unidades, SUM(r.receita) AS receita
+                FROM rollup_produtos_dia r
+                WHERE {' AND '.join(condicoes)}
+                GROUP BY r.Produto_id
+                ORDER BY receita DESC
+                LIMIT %s
+            ) t
+            LEFT JOIN produtos p ON p.idProdutos = t.Produto_id
+            ORDER BY t.receita DESC"""
+
+    conn = get_connection_leitura()
+    if conn is None:
+        return jsonify({"erro": "Não foi possível conectar ao banco de dados"}), 500
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(sql, tuple(params) + (limite,))
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    return jsonify(linhas), 200
+
+#=====================================================================================================================================================================================
+#                                                                                    Monitoramento
+#=====================================================================================================================================================================================
+# ------------------------
+# Contadores do pool de conexões (deste worker)
+# ------------------------
+@app.route('/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify({'pid': os.getpid(), 'pools': pool_stats(), 'replicas': db.estado_replicas()}), 200
+
+# ------------------------
+# Métricas de todos os workers no formato do Prometheus
+# ------------------------
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metricas.texto_prometheus(), mimetype='text/plain; version=0.0.4')
+
+# ------------------------
+# Últimas consultas lentas e estouros de orçamento (deste worker)
+# ------------------------
+@app.route('/consultas_lentas', methods=['GET'])
+def get_consultas_lentas():
+    return jsonify(dict(consultas.estatisticas(), pid=os.getpid())), 200
+
+# ------------------------
+# Acertos/erros do cache do catálogo (deste worker)
+# ------------------------
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'pid': os.getpid(),
+        'catalogo': catalogo_cache.estatisticas(),
+        'cupons': cupons_cache.estatisticas(),
+        'busca': busca_produtos.estatisticas(),
+        'compressao': compressao.estatisticas(),
+    }), 200
+
 #=====================================================================================================================================================================================
 #                                                                                    Rota IP 
 #=====================================================================================================================================================================================
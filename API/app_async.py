@@ -0,0 +1,335 @@
+from quart import Quart, g, jsonify, request
+from a2wsgi import WSGIMiddleware
+from contextlib import asynccontextmanager
+from werkzeug.exceptions import HTTPException
+import aiomysql
+import asyncio
+import os
+import time
+
+import app as sincrono   # app Flask: todas as rotas que não estão aqui e as consultas SQL compartilhadas
+import compressao
+import db
+import metricas
+import serializacao
+from paginacao import ParametroInvalido
+
+
+#======================================================================
+#   Modo ASGI/asyncio (rotas que só esperam o MySQL)
+#======================================================================
+# As rotas mais chamadas que passam o tempo esperando o banco rodam aqui em
+# Quart + aiomysql, com o mesmo caminho, os mesmos parâmetros e o mesmo JSON
+# de app.py (mesmas consultas SQL, mesma paginação, mesma serialização).
+# Enquanto uma requisição espera o MySQL o processo atende as outras: o limite
+# de requisições em andamento deixa de ser workers × threads e passa a ser o
+# tamanho do pool assíncrono (as que passam disso esperam na fila do pool).
+#
+# Todas as outras rotas continuam no app Flask, atendidas num pool de threads
+# dentro do mesmo processo (a2wsgi): as que gastam CPU (hash de senha,
+# imagens), o catálogo (já sai do cache) e as transações longas (criar_pedido,
+# status, rollups), que usam o mysql-connector síncrono de db.py.
+#
+# Subir:
+#   uvicorn app_async:app --workers 4
+#   gunicorn app_async:app -k uvicorn.workers.UvicornWorker -w 4
+# Comparar com o deploy atual: python benchmarks/carga.py --comparar-async
+#
+# Configuração via .env (além das DB_* e DB_POOL_* de db.py):
+#   ASYNC_POOL_MAX       conexões do pool assíncrono por processo (padrão DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)
+#   ASYNC_WSGI_THREADS   threads para as rotas que ficam no Flask (padrão 10)
+
+CONFIG_POOL = db.config_pool()
+POOL_MAX = int(os.getenv('ASYNC_POOL_MAX', CONFIG_POOL['tamanho'] + CONFIG_POOL['max_overflow']))
+WSGI_THREADS = int(os.getenv('ASYNC_WSGI_THREADS', 10))
+METODOS_CORS = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+api = Quart(__name__, static_folder=None)
+serializacao.iniciar(api)   # mesmo JSON do app.py (datas HTTP, Decimal como string, chaves ordenadas)
+
+
+class BancoIndisponivel(Exception):
+    pass
+
+
+#======================================================================
+#   Pool assíncrono (um por processo, aberto quando o servidor sobe)
+#======================================================================
+_pool = None
+
+
+@api.before_serving
+async def abrir_pool():
+    global _pool
+    parametros = db.parametros_railway()
+    # minsize=0: conecta sob demanda, como o pool de db.py (o servidor sobe mesmo com o banco fora).
+    # autocommit: leituras não deixam transação aberta; escritas usam begin/commit explícitos.
+    _pool = await aiomysql.create_pool(
+        minsize=0, maxsize=POOL_MAX, pool_recycle=CONFIG_POOL['recycle'], autocommit=True,
+        host=parametros['host'], user=parametros['user'], password=parametros['password'] or '',
+        db=parametros['database'], port=parametros['port'], charset='utf8mb4',
+    )
+    print(f"🔌 Pool assíncrono pronto (até {POOL_MAX} conexões)")
+
+
+@api.after_serving
+async def fechar_pool():
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+
+
+@asynccontextmanager
+async def conexao():
+    try:
+        conn = await asyncio.wait_for(_pool.acquire(), CONFIG_POOL['timeout'])
+    except asyncio.TimeoutError:
+        print(f"⚠️ Pool assíncrono esgotado ({POOL_MAX} conexões em uso)")
+        raise BancoIndisponivel('Tempo esgotado esperando uma conexão livre')
+    except (aiomysql.Error, OSError) as e:
+        print("Erro detalhado:", e)
+        raise BancoIndisponivel(str(e))
+    try:
+        yield conn
+    finally:
+        # Conexão devolvida no meio de uma transação é fechada pelo próprio pool
+        _pool.release(conn)
+
+
+async def executar(cur, sql, params=()):
+    # Cronometra o comando (métricas da requisição e log de consultas lentas)
+    inicio = time.perf_counter()
+    try:
+        return await cur.execute(sql, params or None)
+    finally:
+        duracao = time.perf_counter() - inicio
+        g.consultas += 1
+        g.tempo_db += duracao
+        db.notificar_consulta(sql, params, duracao)
+
+
+async def consultar(sql, params=()):
+    async with conexao() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await executar(cur, sql, params)
+            return list(await cur.fetchall())
+
+
+@api.errorhandler(BancoIndisponivel)
+async def banco_indisponivel(e):
+    return jsonify({'error': 'Não foi possível conectar ao banco de dados'}), 500
+
+
+#======================================================================
+#   Hooks da requisição (métricas, CORS e compressão como no app.py)
+#======================================================================
+@api.before_request
+async def antes():
+    g.inicio = time.perf_counter()
+    g.consultas, g.tempo_db = 0, 0.0
+    metricas.requisicao_iniciada()
+
+
+def _cors(resposta):
+    # Mesmo comportamento do flask_cors com as opções padrão do app.py
+    origem = request.headers.get('Origin')
+    if origem is None:
+        return
+    resposta.headers['Access-Control-Allow-Origin'] = origem
+    resposta.vary.add('Origin')
+    if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        resposta.headers['Access-Control-Allow-Methods'] = METODOS_CORS
+        pedidos = request.headers.get('Access-Control-Request-Headers')
+        if pedidos:
+            resposta.headers['Access-Control-Allow-Headers'] = pedidos
+    else:
+        resposta.headers['Access-Control-Expose-Headers'] = 'ETag, X-Next-Cursor'
+
+
+async def _comprimir(resposta):
+    if (resposta.status_code < 200 or resposta.status_code in (204, 206, 304)
+            or 'Content-Encoding' in resposta.headers
+            or resposta.mimetype not in compressao.TIPOS_COMPRIMIVEIS):
+        return
+    resposta.vary.add('Accept-Encoding')
+    codificacao = compressao.escolher_codificacao(request.accept_encodings)
+    if codificacao is None or request.method == 'HEAD':
+        return
+    dados = await resposta.get_data()
+    if len(dados) < compressao.MIN_BYTES:
+        return
+    # Carrinhos e favoritos trazem as imagens: comprime fora do event loop
+    corpo = await asyncio.to_thread(compressao.comprimir_bytes, dados, codificacao)
+    if len(corpo) < len(dados):
+        resposta.set_data(corpo)
+        resposta.headers['Content-Encoding'] = codificacao
+
+
+@api.after_request
+async def depois(resposta):
+    _cors(resposta)
+    await _comprimir(resposta)
+    inicio = g.pop('inicio', None)
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule is not None else 'desconhecida'
+        metricas.requisicao_concluida(rota, request.method, resposta.status_code,
+                                      time.perf_counter() - inicio, g.consultas, g.tempo_db)
+    return resposta
+
+
+#======================================================================
+#   Rotas assíncronas (mesmos contratos de app.py)
+#======================================================================
+# ------------------------
+# Endereços
+# ------------------------
+@api.route("/get_endereco/<int:idUsuario>", methods=["GET"])
+async def get_enderecos(idUsuario):
+    return jsonify(await consultar(sincrono.SQL_ENDERECOS_USUARIO, (idUsuario,))), 200
+
+
+# ------------------------
+# Favoritos
+# ------------------------
+@api.route('/favoritos/<int:user_id>', methods=['GET'])
+async def get_favoritos(user_id):
+    try:
+        return jsonify(await consultar(sincrono.SQL_FAVORITOS_USUARIO, (user_id,))), 200
+    except aiomysql.Error as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ------------------------
+# Carrinho
+# ------------------------
+@api.route('/get_carrinho/<int:user_id>', methods=['GET'])
+async def get_carrinho(user_id):
+    return jsonify(await consultar(sincrono.SQL_ITENS_CARRINHO, (user_id,)))
+
+
+async def chaves_carrinho(cur):
+    # Mesmo estado de app.chaves_carrinho (conferido ao importar app.py)
+    if sincrono._chaves_carrinho['ok'] is None:
+        await executar(cur, sincrono.SQL_CHAVES_CARRINHO)
+        sincrono.registrar_chaves_carrinho(await cur.fetchall())
+    return sincrono._chaves_carrinho['ok']
+
+
+async def carrinho_aberto(cur, usuario_id):
+    # Mesmo caminho de app.carrinho_aberto (mesma ordem de travas: carrinho, depois itens)
+    if await chaves_carrinho(cur):
+        await executar(cur, sincrono.SQL_CARRINHO_ABERTO, (usuario_id,))
+        return cur.lastrowid
+
+    await executar(cur, sincrono.SQL_TRAVAR_USUARIO, (usuario_id,))
+    await cur.fetchall()
+    await executar(cur, sincrono.SQL_BUSCAR_CARRINHO_ABERTO, (usuario_id,))
+    carrinho = await cur.fetchone()
+    if carrinho:
+        return carrinho[0]
+    await executar(cur, sincrono.SQL_CRIAR_CARRINHO, (usuario_id,))
+    return cur.lastrowid
+
+
+async def somar_item(cur, carrinho_id, produto_id, quantidade):
+    # Mesmo caminho de app.gravar_itens para um item só
+    if await chaves_carrinho(cur):
+        await executar(cur, sincrono.SQL_SOMAR_ITEM, (carrinho_id, produto_id, quantidade))
+        return
+
+    await executar(cur, sincrono.SQL_BUSCAR_ITEM, (carrinho_id, produto_id))
+    item = await cur.fetchone()
+    if item:
+        await executar(cur, sincrono.SQL_SOMAR_ITEM_EXISTENTE, (quantidade, item[0]))
+    else:
+        await executar(cur, sincrono.SQL_INSERIR_ITEM, (carrinho_id, produto_id, quantidade))
+
+
+@api.route("/add_carrinho", methods=["POST"])
+async def add_carrinho():
+    data = await request.get_json()
+    usuario_id = data["usuario_id"]
+    produto_id = data["produto_id"]
+    quantidade = data.get("quantidade", 1)
+    if not isinstance(quantidade, int) or quantidade < 1:
+        return jsonify({"status": "erro", "msg": "Quantidade inválida"}), 400
+
+    async with conexao() as conn:
+        async with conn.cursor() as cur:
+            try:
+                await conn.begin()
+                carrinho_id = await carrinho_aberto(cur, usuario_id)
+                await somar_item(cur, carrinho_id, produto_id, quantidade)
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                return jsonify({"status": "erro", "msg": str(e)}), 500
+
+    return jsonify({"status": "sucesso", "msg": "Produto adicionado ao carrinho"})
+
+
+# ------------------------
+# Cupom
+# ------------------------
+@api.route("/validar_cupom", methods=["POST"])
+async def validar_cupom():
+    data = await request.get_json()
+    cupons = await consultar(sincrono.SQL_CUPOM_VALIDO, (data.get("codigo"),))
+    if not cupons:
+        return jsonify({"erro": "Cupom inválido ou expirado"}), 400
+    return jsonify(cupons[0])
+
+
+# ------------------------
+# Pedidos e relatórios
+# ------------------------
+@api.route("/listar_pedidos/<int:usuario_id>", methods=["GET"])
+async def listar_pedidos_usuario(usuario_id):
+    try:
+        pagina, sql, params, incluir_itens = sincrono.consulta_pedidos_usuario(request.args, usuario_id)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    async with conexao() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await executar(cur, sql, params)
+            pedidos = pagina.cortar(list(await cur.fetchall()))
+            if incluir_itens and pedidos:
+                ids = tuple(pedido["idRelatorio_Pedido"] for pedido in pedidos)
+                await executar(cur, sincrono.sql_itens_pedidos(len(ids)), ids)
+                sincrono.juntar_itens_pedidos(pedidos, await cur.fetchall())
+    return pagina.aplicar_cabecalho(jsonify(pedidos))
+
+
+@api.route('/relatorios_pedidos', methods=['GET'])
+async def listar_relatorios():
+    try:
+        pagina, sql, params = sincrono.consulta_relatorios(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    relatorios = pagina.cortar(await consultar(sql, params))
+    return pagina.aplicar_cabecalho(jsonify(relatorios)), 200
+
+
+#======================================================================
+#   Aplicação ASGI: rotas acima no Quart, o resto no Flask
+#======================================================================
+flask_asgi = WSGIMiddleware(sincrono.app, workers=WSGI_THREADS)
+
+
+def _rota_assincrona(scope):
+    try:
+        api.url_map.bind('').match(scope['path'], scope['method'])
+        return True
+    except HTTPException:
+        # 404 / 405 (ex.: DELETE /favoritos/<id>) / redirecionamento: fica com o Flask
+        return False
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http' and not _rota_assincrona(scope):
+        await flask_asgi(scope, receive, send)
+    else:
+        # lifespan (abre/fecha o pool) e as rotas assíncronas
+        await api(scope, receive, send)
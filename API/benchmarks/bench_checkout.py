@@ -0,0 +1,95 @@
+#======================================================================
+#   Benchmark de checkouts concorrentes (POST /criar_pedido)
+#======================================================================
+# Dispara vários pedidos ao mesmo tempo para o MESMO produto e mede vazão e
+# latência. No fim confere se a API vendeu mais do que o estoque disponível.
+#
+# Uso (com a API rodando e um produto de teste cadastrado):
+#   python benchmarks/bench_checkout.py --url http://localhost:8080 \
+#       --produto 1 --usuario 1 --pedidos 200 --concorrencia 20
+#
+# Atenção: cria pedidos de verdade no banco apontado pela API.
+
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def requisicao(url, metodo='GET', corpo=None):
+    dados = json.dumps(corpo).encode() if corpo is not None else None
+    req = urllib.request.Request(url, data=dados, method=metodo,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, json.loads(resp.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'null')
+
+
+def disponivel(url, produto_id):
+    # Estoque menos o que já está reservado em pedidos abertos
+    _, dados = requisicao(f'{url}/get_products')
+    for produto in dados['produtos']:
+        if produto['idProdutos'] == produto_id:
+            return int(produto['quantidade_estoque']) - int(produto.get('quantidade_reservada') or 0)
+    raise SystemExit(f'Produto {produto_id} não encontrado')
+
+
+def um_checkout(args):
+    pedido = {
+        'usuario_id': args.usuario,
+        'valor_total': args.quantidade * 10,
+        'pagamento': 'pix',
+        'observacao': 'bench_checkout',
+        'items': [{'id': args.produto, 'quantity': args.quantidade, 'price': 10}],
+    }
+    inicio = time.perf_counter()
+    status, _ = requisicao(f'{args.url}/criar_pedido', 'POST', pedido)
+    return status, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkouts concorrentes em /criar_pedido')
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--produto', type=int, required=True)
+    parser.add_argument('--usuario', type=int, required=True)
+    parser.add_argument('--pedidos', type=int, default=200)
+    parser.add_argument('--concorrencia', type=int, default=20)
+    parser.add_argument('--quantidade', type=int, default=1)
+    args = parser.parse_args()
+
+    estoque = disponivel(args.url, args.produto)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        resultados = list(executor.map(lambda _: um_checkout(args), range(args.pedidos)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = sorted(lat for _, lat in resultados)
+    aceitos = sum(1 for status, _ in resultados if status == 200)
+    sem_estoque = sum(1 for status, _ in resultados if status == 400)
+    erros = len(resultados) - aceitos - sem_estoque
+
+    def percentil(p):
+        return latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000
+
+    print(f'pedidos: {args.pedidos}  concorrência: {args.concorrencia}  duração: {duracao:.2f}s')
+    print(f'vazão: {args.pedidos / duracao:.1f} checkouts/s')
+    print(f'latência ms  p50={percentil(0.50):.1f}  p95={percentil(0.95):.1f}  '
+          f'p99={percentil(0.99):.1f}  média={statistics.mean(latencias) * 1000:.1f}')
+    print(f'aceitos: {aceitos}  sem estoque (400): {sem_estoque}  erros: {erros}')
+
+    vendidos = aceitos * args.quantidade
+    print(f'unidades vendidas: {vendidos}  estoque no início: {estoque}')
+    if vendidos > estoque:
+        print('❌ OVERSELL: foram aceitas mais unidades do que havia em estoque')
+        raise SystemExit(1)
+    print('✅ sem oversell')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#======================================================================
+#   Benchmark da serialização JSON (json padrão do Flask x orjson)
+#======================================================================
+# Monta listas parecidas com as de /produtos e /relatorios_pedidos (Decimal,
+# datetime, date, textos com acento) e mede quanto tempo cada provedor leva
+# para gerar a resposta. Também confere que os dois geram o mesmo JSON.
+#
+# Uso:
+#   python benchmarks/bench_json.py
+#   python benchmarks/bench_json.py --produtos 5000 --pedidos 2000 --repeticoes 50
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask  # noqa: E402
+import serializacao  # noqa: E402
+
+NOMES = ['Café expresso', 'Cappuccino', 'Pão de queijo', 'Bolo de cenoura', 'Coxinha',
+         'Suco de laranja', 'Croissant', 'Café com leite', 'Torta de limão', 'Água com gás']
+CATEGORIAS = ['cafés', 'salgados', 'doces', 'bebidas']
+STATUS = ['Realizado', 'Produção', 'Pronto', 'A caminho', 'Entregue', 'Cancelado']
+
+
+def gerar_produtos(n, rnd):
+    inicio = datetime(2024, 1, 1)
+    return [{
+        'idProdutos': i,
+        'nome': f'{rnd.choice(NOMES)} {i}',
+        'descricao': 'Feito na hora com ingredientes selecionados da região. ' * 2,
+        'valor': Decimal(rnd.randint(300, 4500)) / 100,
+        'avaliacao': Decimal(rnd.randint(30, 50)) / 10,
+        'imagem': f'http://192.168.0.10:8080/imagens/{rnd.getrandbits(256):064x}',
+        'quantidade_estoque': rnd.randint(0, 200),
+        'categoria': rnd.choice(CATEGORIAS),
+        'data_cadastro': inicio + timedelta(minutes=rnd.randint(0, 500000)),
+        'is_promotion': rnd.randint(0, 1),
+        'vitrine_idVitrine': 1,
+        'administrador_idAdministrador': 1,
+    } for i in range(1, n + 1)]
+
+
+def gerar_pedidos(n, rnd):
+    inicio = datetime(2024, 1, 1)
+    pedidos = []
+    for i in range(1, n + 1):
+        itens = [{
+            'nome': rnd.choice(NOMES),
+            'quantidade': rnd.randint(1, 4),
+            'preco_unitario': Decimal(rnd.randint(300, 4500)) / 100,
+        } for _ in range(rnd.randint(1, 6))]
+        pedidos.append({
+            'idRelatorio_Pedido': i,
+            'Usuario_idUsuario': rnd.randint(1, 500),
+            'nome_usuario': 'João da Silva',
+            'telefone_usuario': '61999990000',
+            'data_nascimento': date(1990, 1, 1) + timedelta(days=rnd.randint(0, 9000)),
+            'endereco': 'Rua das Flores, 123 - Asa Sul, Brasília',
+            'valor_total': sum(item['preco_unitario'] * item['quantidade'] for item in itens),
+            'valor_frete': Decimal('5.00'),
+            'valor_desconto': Decimal('0.00'),
+            'status': rnd.choice(STATUS),
+            'data_status': inicio + timedelta(minutes=rnd.randint(0, 500000)),
+            'observacao': None,
+            'tipo_pagamento': 'pix',
+            'items': itens,
+        })
+    return pedidos
+
+
+def medir(app, dados, repeticoes):
+    with app.app_context():
+        app.json.response(dados)   # aquecimento
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            corpo = app.json.response(dados).get_data()
+            tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return tempos[len(tempos) // 2] * 1000, corpo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serialização JSON das listas da API')
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--pedidos', type=int, default=1000)
+    parser.add_argument('--repeticoes', type=int, default=30)
+    args = parser.parse_args()
+
+    if serializacao.orjson is None:
+        raise SystemExit('orjson não está instalado (pip install orjson)')
+
+    rnd = random.Random(42)
+    cenarios = [
+        (f'{args.produtos} produtos', gerar_produtos(args.produtos, rnd)),
+        (f'{args.pedidos} pedidos com itens', gerar_pedidos(args.pedidos, rnd)),
+    ]
+    padrao = Flask('padrao')
+    padrao.json = serializacao.ProvedorJSON(padrao, backend='padrao')
+    rapido = Flask('orjson')
+    serializacao.iniciar(rapido, backend='orjson')
+
+    print(f"{'cenário':<28}{'padrão ms':>12}{'orjson ms':>12}{'ganho':>8}{'KB':>8}")
+    for nome, dados in cenarios:
+        ms_padrao, corpo_padrao = medir(padrao, dados, args.repeticoes)
+        ms_rapido, corpo_rapido = medir(rapido, dados, args.repeticoes)
+        if json.loads(corpo_padrao) != json.loads(corpo_rapido):
+            raise SystemExit(f'❌ {nome}: os provedores geraram JSON diferente')
+        print(f'{nome:<28}{ms_padrao:>12.2f}{ms_rapido:>12.2f}{ms_padrao / ms_rapido:>7.1f}x'
+              f'{len(corpo_rapido) / 1024:>8.0f}')
+    print('✅ mesmo JSON nos dois provedores')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#======================================================================
+#   Benchmark do hash de senhas (vazão de login no custo escolhido)
+#======================================================================
+# Mede, no mesmo caminho usado por /login (senhas.verificar_senha, que roda
+# no pool limitado), quantas verificações por segundo o servidor aguenta com
+# o custo configurado e com alguns custos alternativos para comparação.
+#
+# Uso:
+#   python benchmarks/bench_senhas.py
+#   python benchmarks/bench_senhas.py --concorrencia 32 --total 400
+#   SENHA_SCRYPT_N=32768 python benchmarks/bench_senhas.py
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import senhas  # noqa: E402
+
+
+def medir(hash_armazenado, total, concorrencia):
+    # "concorrencia" simula as threads de requisição chegando ao mesmo tempo
+    latencias = []
+
+    def um_login(_):
+        inicio = time.perf_counter()
+        confere, _ = senhas.verificar_senha('senha-de-teste', hash_armazenado)
+        assert confere
+        latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(um_login, range(total)))
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'vazao': total / duracao,
+        'p50': latencias[len(latencias) // 2] * 1000,
+        'p95': latencias[int(len(latencias) * 0.95)] * 1000,
+        'media': statistics.mean(latencias) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vazão de verificação de senha')
+    parser.add_argument('--total', type=int, default=200)
+    parser.add_argument('--concorrencia', type=int, default=16)
+    args = parser.parse_args()
+
+    print(f'CPUs: {os.cpu_count()}  workers do pool: {senhas._workers}  '
+          f'total: {args.total}  concorrência: {args.concorrencia}')
+    print(f"{'parâmetros':<32}{'logins/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'média ms':>10}")
+
+    cenarios = [
+        (f'scrypt n={senhas.SCRYPT_N} r={senhas.SCRYPT_R} p={senhas.SCRYPT_P} (atual)',
+         'scrypt', senhas.SCRYPT_N, senhas.PBKDF2_ITER),
+        ('scrypt n=8192 r=8 p=1', 'scrypt', 8192, senhas.PBKDF2_ITER),
+        ('scrypt n=32768 r=8 p=1', 'scrypt', 32768, senhas.PBKDF2_ITER),
+        (f'pbkdf2 iter={senhas.PBKDF2_ITER}', 'pbkdf2', senhas.SCRYPT_N, senhas.PBKDF2_ITER),
+    ]
+    original = (senhas.ALGORITMO, senhas.SCRYPT_N, senhas.PBKDF2_ITER)
+    for nome, algoritmo, n, iteracoes in cenarios:
+        senhas.ALGORITMO, senhas.SCRYPT_N, senhas.PBKDF2_ITER = algoritmo, n, iteracoes
+        hash_armazenado = senhas.gerar_hash('senha-de-teste')
+        r = medir(hash_armazenado, args.total, args.concorrencia)
+        print(f"{nome:<32}{r['vazao']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['media']:>10.1f}")
+    senhas.ALGORITMO, senhas.SCRYPT_N, senhas.PBKDF2_ITER = original
+
+
+if __name__ == '__main__':
+    main()
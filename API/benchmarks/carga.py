@@ -0,0 +1,498 @@
+#======================================================================
+#   Teste de carga das rotas mais usadas (gunicorn + MySQL local)
+#======================================================================
+# Sobe a API no gunicorn apontando para um banco local descartável, cria as
+# tabelas e semeia os dados com gerar_dados.py (mesma semente = mesmos dados;
+# --usuarios/--produtos/--pedidos ajustam o tamanho) e dispara
+# cenários com pesos, como o app faz no dia a dia:
+#   catalogo    GET  /produtos
+#   login       POST /login
+#   carrinho    POST /add_carrinho + GET /get_carrinho/<id>
+#   cupom       POST /validar_cupom
+#   pedido      POST /criar_pedido
+#   relatorios  GET  /relatorios_pedidos?limit=50 (administrador)
+# No fim mostra p50/p95/p99 e vazão por rota. O resultado pode ser gravado
+# como baseline e comparado nas próximas versões: piora acima da tolerância
+# em p95, vazão ou taxa de erro termina com código 1.
+# A API sobe com CONSULTAS_ESTRITO=1: se alguma rota passar do orçamento de
+# comandos SQL (consultas.ORCAMENTOS) o teste também termina com código 1
+# (--ignorar-orcamentos desliga).
+#
+# Uso:
+#   python benchmarks/carga.py --db-user root --db-senha root
+#   python benchmarks/carga.py --duracao 60 --concorrencia 32 --workers 4 --baseline main --gravar-baseline
+#   python benchmarks/carga.py --baseline main          # compara com benchmarks/baselines/main.json
+#   python benchmarks/carga.py --pesos catalogo=60,pedido=0
+#   python benchmarks/carga.py --comparar-async --concorrencia 128   # app.py x app_async.py lado a lado
+#
+# Atenção: o banco --db-nome (padrão cafeteria_carga) é APAGADO e recriado a
+# cada execução. Nunca aponte para o banco de produção.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gerar_dados  # noqa: E402
+from db import config_pool  # noqa: E402
+from gerar_dados import CUPOM, SENHA, email_usuario  # noqa: E402
+
+# Cabeçalho que consultas.py põe nas respostas que passaram do orçamento de comandos SQL
+CABECALHO_ESTOURO = 'X-Orcamento-Consultas'
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Modo assíncrono (app_async.py) no --comparar-async
+APP_ASYNC = 'app_async:app'
+WORKER_ASYNC = 'uvicorn_worker.UvicornWorker'
+
+PESOS_PADRAO = {
+    'catalogo': 35,
+    'login': 10,
+    'carrinho': 20,
+    'cupom': 10,
+    'pedido': 15,
+    'relatorios': 10,
+}
+
+
+# ------------------------
+# Dados
+# ------------------------
+def montar_contexto(usuarios, precos):
+    # Mesma popularidade dos dados gerados: produto 1 é o mais vendido
+    ids = sorted(precos)
+    return {'usuarios': usuarios, 'precos': precos, 'ids': ids,
+            'acumulado': gerar_dados.acumulado_zipf(len(ids), 1.1)}
+
+
+def semear(args):
+    print(f'🛠️  Recriando {args.db_nome} em {args.db_host}:{args.db_porta} e semeando dados...')
+    inicio = time.perf_counter()
+    conn = gerar_dados.recriar_banco(args)
+    try:
+        dados = gerar_dados.gerar(conn, args)
+    finally:
+        conn.close()
+    print(f'   dados prontos em {time.perf_counter() - inicio:.1f}s')
+    return montar_contexto(dados['usuarios'], dados['precos'])
+
+
+# ------------------------
+# Servidor
+# ------------------------
+def subir_gunicorn(args, pasta_temp, extra=None):
+    ambiente = dict(os.environ,
+                    DB_HOST=args.db_host, DB_PORT=str(args.db_porta), DB_USER=args.db_user,
+                    DB_PASSWORD=args.db_senha, DB_NAME=args.db_nome,
+                    CACHE_DIR=os.path.join(pasta_temp, 'cache'),
+                    METRICAS_DIR=os.path.join(pasta_temp, 'metricas'),
+                    TENTATIVAS_SQLITE=os.path.join(pasta_temp, 'tentativas.db'),
+                    CONSULTAS_ESTRITO='1',
+                    **(extra or {}))
+    comando = [sys.executable, '-m', 'gunicorn', args.app, '--chdir', API_DIR,
+               '-b', f'127.0.0.1:{args.porta}', '-w', str(args.workers),
+               '--threads', str(args.threads), '--log-level', 'warning']
+    if args.worker_class:
+        comando += ['-k', args.worker_class]
+    log = open(os.path.join(pasta_temp, 'gunicorn.log'), 'w')
+    processo = subprocess.Popen(comando, env=ambiente, stdout=log, stderr=subprocess.STDOUT)
+
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            log.close()
+            with open(log.name) as arquivo:
+                raise SystemExit(f'❌ gunicorn terminou ao subir:\n{arquivo.read()}')
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', args.porta, timeout=2)
+            conexao.request('GET', '/teste_db')
+            if conexao.getresponse().status == 200:
+                conexao.close()
+                return processo
+        except OSError:
+            pass
+        time.sleep(0.2)
+    processo.kill()
+    raise SystemExit('❌ gunicorn não respondeu em 30s')
+
+
+def parar(processo):
+    processo.terminate()
+    try:
+        processo.wait(10)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+
+
+# ------------------------
+# Cliente e cenários
+# ------------------------
+class Cliente:
+    # Uma conexão HTTP por thread (keep-alive quando o servidor permite)
+
+    def __init__(self, host, porta, registrar):
+        self.conexao = http.client.HTTPConnection(host, porta, timeout=30)
+        self.registrar = registrar
+
+    def chamar(self, rota, metodo, caminho, corpo=None):
+        dados = json.dumps(corpo).encode() if corpo is not None else None
+        cabecalhos = {'Accept-Encoding': 'gzip'}
+        if dados is not None:
+            cabecalhos['Content-Type'] = 'application/json'
+        inicio = time.perf_counter()
+        try:
+            self.conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            resposta.read()
+            status = resposta.status
+            estourou = resposta.getheader(CABECALHO_ESTOURO) is not None
+        except (OSError, http.client.HTTPException):
+            self.conexao.close()
+            status, estourou = 0, False
+        self.registrar(rota, status, time.perf_counter() - inicio, estourou)
+        return status
+
+
+def produto_popular(rnd, contexto):
+    # Poucos produtos concentram a maior parte das vendas (Zipf)
+    return rnd.choices(contexto['ids'], cum_weights=contexto['acumulado'])[0]
+
+
+def cenario_catalogo(cliente, rnd, contexto):
+    cliente.chamar('GET /produtos', 'GET', '/produtos')
+
+
+def cenario_login(cliente, rnd, contexto):
+    usuario = rnd.randint(1, contexto['usuarios'])
+    cliente.chamar('POST /login', 'POST', '/login', {'email': email_usuario(usuario), 'senha': SENHA})
+
+
+def cenario_carrinho(cliente, rnd, contexto):
+    usuario = rnd.randint(1, contexto['usuarios'])
+    cliente.chamar('POST /add_carrinho', 'POST', '/add_carrinho',
+                   {'usuario_id': usuario, 'produto_id': produto_popular(rnd, contexto), 'quantidade': 1})
+    cliente.chamar('GET /get_carrinho', 'GET', f'/get_carrinho/{usuario}')
+
+
+def cenario_cupom(cliente, rnd, contexto):
+    cliente.chamar('POST /validar_cupom', 'POST', '/validar_cupom', {'codigo': CUPOM})
+
+
+def cenario_pedido(cliente, rnd, contexto):
+    ids = {produto_popular(rnd, contexto) for _ in range(rnd.randint(1, 4))}
+    itens = [{'id': i, 'quantity': rnd.randint(1, 3), 'price': contexto['precos'][i]} for i in ids]
+    cliente.chamar('POST /criar_pedido', 'POST', '/criar_pedido', {
+        'usuario_id': rnd.randint(1, contexto['usuarios']),
+        'endereco': 'Rua das Flores, 123',
+        'valor_total': round(sum(item['price'] * item['quantity'] for item in itens), 2),
+        'valor_frete': 5,
+        'pagamento': 'pix',
+        'observacao': 'carga',
+        'items': itens,
+    })
+
+
+def cenario_relatorios(cliente, rnd, contexto):
+    cliente.chamar('GET /relatorios_pedidos', 'GET', '/relatorios_pedidos?limit=50')
+
+
+CENARIOS = {
+    'catalogo': cenario_catalogo,
+    'login': cenario_login,
+    'carrinho': cenario_carrinho,
+    'cupom': cenario_cupom,
+    'pedido': cenario_pedido,
+    'relatorios': cenario_relatorios,
+}
+
+
+def ler_pesos(texto):
+    pesos = dict(PESOS_PADRAO)
+    for parte in filter(None, (texto or '').split(',')):
+        nome, _, valor = parte.partition('=')
+        if nome not in CENARIOS:
+            raise SystemExit(f"Cenário desconhecido '{nome}' (use {', '.join(CENARIOS)})")
+        pesos[nome] = float(valor)
+    return {nome: peso for nome, peso in pesos.items() if peso > 0}
+
+
+def disparar(args, contexto, pesos):
+    # Aquecimento (não medido) e depois "duracao" segundos medidos
+    amostras = {}
+    lock = threading.Lock()
+    medindo = threading.Event()
+
+    def registrar(rota, status, duracao, estourou):
+        if not medindo.is_set():
+            return
+        with lock:
+            amostras.setdefault(rota, []).append((status, duracao, estourou))
+
+    nomes, valores = list(pesos), list(pesos.values())
+    fim = time.monotonic() + args.aquecimento + args.duracao
+
+    def usuario_virtual(numero):
+        rnd = random.Random(args.semente * 1000 + numero)
+        cliente = Cliente(args.host, args.porta, registrar)
+        while time.monotonic() < fim:
+            CENARIOS[rnd.choices(nomes, valores)[0]](cliente, rnd, contexto)
+        cliente.conexao.close()
+
+    threads = [threading.Thread(target=usuario_virtual, args=(i,), daemon=True) for i in range(args.concorrencia)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.aquecimento)
+    medindo.set()
+    inicio = time.monotonic()
+    for thread in threads:
+        thread.join()
+    return amostras, time.monotonic() - inicio
+
+
+# ------------------------
+# Resultado e baseline
+# ------------------------
+def percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))] * 1000
+
+
+def resumir(amostras, duracao):
+    rotas = {}
+    todas = []
+    for rota, lista in sorted(amostras.items()):
+        tempos = sorted(d for _, d, _ in lista)
+        erros = sum(1 for status, _, _ in lista if status == 0 or status >= 500)
+        todas += tempos
+        rotas[rota] = {
+            'requisicoes': len(lista),
+            'erros': erros,
+            'estouros_orcamento': sum(1 for _, _, estourou in lista if estourou),
+            'vazao': round(len(lista) / duracao, 2),
+            'p50': round(percentil(tempos, 0.50), 2),
+            'p95': round(percentil(tempos, 0.95), 2),
+            'p99': round(percentil(tempos, 0.99), 2),
+        }
+    todas.sort()
+    total = {
+        'requisicoes': len(todas),
+        'erros': sum(r['erros'] for r in rotas.values()),
+        'vazao': round(len(todas) / duracao, 2),
+        'p50': round(percentil(todas, 0.50), 2) if todas else 0,
+        'p95': round(percentil(todas, 0.95), 2) if todas else 0,
+        'p99': round(percentil(todas, 0.99), 2) if todas else 0,
+    }
+    return rotas, total
+
+
+def imprimir(rotas, total):
+    print(f"{'rota':<28}{'req':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>7}")
+    for rota, r in list(rotas.items()) + [('TOTAL', total)]:
+        print(f"{rota:<28}{r['requisicoes']:>8}{r['vazao']:>9.1f}{r['p50']:>9.1f}"
+              f"{r['p95']:>9.1f}{r['p99']:>9.1f}{r['erros']:>7}")
+
+
+def descrever(args, extra=None):
+    texto = f'{args.app}: {args.workers} worker(s) x {args.threads} thread(s)'
+    if args.worker_class:
+        texto += f' ({args.worker_class})'
+    if extra:
+        texto += ' ' + ' '.join(f'{chave}={valor}' for chave, valor in extra.items())
+    return texto
+
+
+def rodar(args, contexto, pesos, extra=None):
+    # extra: variáveis de ambiente a mais para o servidor
+    pasta_temp = tempfile.mkdtemp(prefix='cafeteria_carga_')
+    processo = None
+    try:
+        if not args.sem_servidor:
+            processo = subir_gunicorn(args, pasta_temp, extra)
+        print(f'🚀 {descrever(args, extra)}, '
+              f'{args.concorrencia} usuários virtuais, {args.duracao:.0f}s (+{args.aquecimento:.0f}s de aquecimento)')
+        amostras, duracao = disparar(args, contexto, pesos)
+    finally:
+        if processo is not None:
+            parar(processo)
+        shutil.rmtree(pasta_temp, ignore_errors=True)
+    rotas, total = resumir(amostras, duracao)
+    imprimir(rotas, total)
+    return rotas, total
+
+
+def lado_a_lado(sincrono, assincrono):
+    print(f"\nsync:  {sincrono['config']}\nasync: {assincrono['config']}")
+    print(f"{'rota':<28}{'req/s sync':>12}{'req/s async':>13}{'p95 sync':>10}{'p95 async':>11}{'vazão':>8}")
+    rotas = list(sincrono['rotas']) + ['TOTAL']
+    for rota in rotas:
+        s = sincrono['total'] if rota == 'TOTAL' else sincrono['rotas'][rota]
+        a = assincrono['total'] if rota == 'TOTAL' else assincrono['rotas'].get(rota)
+        if a is None:
+            continue
+        ganho = f"{a['vazao'] / s['vazao']:.2f}x" if s['vazao'] else '-'
+        print(f"{rota:<28}{s['vazao']:>12.1f}{a['vazao']:>13.1f}{s['p95']:>10.1f}{a['p95']:>11.1f}{ganho:>8}")
+
+
+def orcamentos_estourados(resultado):
+    # Rotas com respostas marcadas por consultas.py (CONSULTAS_ESTRITO=1)
+    lados = [(lado, resultado[lado]) for lado in ('sincrono', 'assincrono') if lado in resultado] or [('', resultado)]
+    estourados = []
+    for lado, dados in lados:
+        for rota, r in dados['rotas'].items():
+            if r.get('estouros_orcamento'):
+                estourados.append(f"{rota}{' (' + lado + ')' if lado else ''}: "
+                                  f"{r['estouros_orcamento']} de {r['requisicoes']} resposta(s)")
+    return estourados
+
+
+def versao_git():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=API_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, base, tolerancia):
+    # Piora = p95 maior ou vazão menor que a baseline além da tolerância,
+    # ou taxa de erro maior. Diferenças de menos de 2 ms no p95 são ruído.
+    pioras = []
+    print(f"\nComparação com a baseline ({base['meta'].get('versao') or '?'}, {base['meta']['quando']}):")
+    print(f"{'rota':<28}{'p95 base':>10}{'p95 agora':>11}{'req/s base':>12}{'req/s agora':>13}")
+    for rota, b in base['rotas'].items():
+        a = atual['rotas'].get(rota)
+        if a is None:
+            continue
+        marca = ''
+        if a['p95'] > b['p95'] * (1 + tolerancia) and a['p95'] - b['p95'] > 2:
+            pioras.append(f"{rota}: p95 {b['p95']:.1f} -> {a['p95']:.1f} ms")
+            marca = ' ❌'
+        if a['vazao'] < b['vazao'] * (1 - tolerancia):
+            pioras.append(f"{rota}: vazão {b['vazao']:.1f} -> {a['vazao']:.1f} req/s")
+            marca = ' ❌'
+        if a['erros'] / max(a['requisicoes'], 1) > b['erros'] / max(b['requisicoes'], 1) + 0.01:
+            pioras.append(f"{rota}: erros {b['erros']}/{b['requisicoes']} -> {a['erros']}/{a['requisicoes']}")
+            marca = ' ❌'
+        print(f"{rota:<28}{b['p95']:>10.1f}{a['p95']:>11.1f}{b['vazao']:>12.1f}{a['vazao']:>13.1f}{marca}")
+    return pioras
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga das rotas mais usadas')
+    gerar_dados.argumentos_banco(parser)
+    gerar_dados.argumentos_dados(parser, usuarios=5000, produtos=200, pedidos=20000)
+    grupo = parser.add_argument_group('servidor')
+    grupo.add_argument('--app', default='app:app', help='módulo:objeto passado ao gunicorn')
+    grupo.add_argument('--workers', type=int, default=4)
+    grupo.add_argument('--threads', type=int, default=1)
+    grupo.add_argument('--worker-class', help='classe de worker do gunicorn (-k)')
+    grupo.add_argument('--host', default='127.0.0.1')
+    grupo.add_argument('--porta', type=int, default=8099)
+    grupo.add_argument('--sem-servidor', action='store_true',
+                       help='usa uma API já rodando em --host/--porta (apontando para o mesmo banco)')
+    grupo.add_argument('--comparar-async', action='store_true',
+                       help=f'roda a mesma carga em --app e em {APP_ASYNC} ({WORKER_ASYNC}, mesmos workers, '
+                            '--threads para as rotas do Flask e o mesmo limite de conexões do pool) e mostra '
+                            'as duas lado a lado (o banco é semeado de novo antes de cada uma)')
+    grupo = parser.add_argument_group('carga')
+    grupo.add_argument('--duracao', type=float, default=30, help='segundos medidos')
+    grupo.add_argument('--aquecimento', type=float, default=5, help='segundos antes de medir')
+    grupo.add_argument('--concorrencia', type=int, default=16, help='usuários virtuais simultâneos')
+    grupo.add_argument('--pesos', help='ex.: catalogo=60,pedido=0 (demais ficam no padrão)')
+    grupo.add_argument('--ignorar-orcamentos', action='store_true',
+                       help='não termina com erro quando alguma rota passa do orçamento de comandos SQL')
+    grupo = parser.add_argument_group('baseline')
+    grupo.add_argument('--baseline', help=f'nome da baseline em {os.path.relpath(BASELINES_DIR)}/')
+    grupo.add_argument('--gravar-baseline', action='store_true', help='grava o resultado como a baseline')
+    grupo.add_argument('--tolerancia', type=float, default=0.15, help='piora aceita (0.15 = 15%%)')
+    grupo.add_argument('--saida', help='também grava o resultado neste arquivo JSON')
+    args = parser.parse_args()
+
+    gerar_dados.recusar_banco_da_api(args)
+    pesos = ler_pesos(args.pesos)
+    if args.comparar_async and (args.sem_servidor or args.baseline):
+        parser.error('--comparar-async sobe os dois servidores e não usa baseline')
+
+    contexto = semear(args)
+    rotas, total = rodar(args, contexto, pesos)
+    resultado = {
+        'meta': {
+            'versao': versao_git(),
+            'quando': datetime.now().isoformat(timespec='seconds'),
+            'app': args.app,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': args.worker_class,
+            'concorrencia': args.concorrencia,
+            'duracao': args.duracao,
+            'dados': {'usuarios': args.usuarios, 'produtos': args.produtos, 'pedidos': args.pedidos,
+                      'dias': args.dias, 'semente': args.semente},
+            'pesos': pesos,
+        },
+        'rotas': rotas,
+        'total': total,
+    }
+    if args.comparar_async:
+        # Mesmos dados de partida para os dois (a primeira rodada criou pedidos e carrinhos).
+        # Mesmos recursos: as rotas que ficam no Flask rodam em --threads threads (como o
+        # sync) e o pool assíncrono tem o mesmo limite de conexões do pool de db.py; a
+        # thread única do worker uvicorn é o event loop.
+        assincrono = argparse.Namespace(**vars(args))
+        assincrono.app, assincrono.worker_class, assincrono.threads = APP_ASYNC, WORKER_ASYNC, 1
+        pool = config_pool()
+        extra = {'ASYNC_WSGI_THREADS': str(args.threads),
+                 'ASYNC_POOL_MAX': str(pool['tamanho'] + pool['max_overflow'])}
+        contexto = semear(assincrono)
+        rotas, total = rodar(assincrono, contexto, pesos, extra)
+        resultado = {'meta': resultado['meta'],
+                     'sincrono': {'config': descrever(args), 'rotas': resultado['rotas'], 'total': resultado['total']},
+                     'assincrono': {'config': descrever(assincrono, extra), 'rotas': rotas, 'total': total}}
+        resultado['meta']['app_async'] = APP_ASYNC
+        resultado['meta']['ambiente_async'] = extra
+        lado_a_lado(resultado['sincrono'], resultado['assincrono'])
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    estourados = orcamentos_estourados(resultado)
+    if estourados and not args.ignorar_orcamentos:
+        print('❌ Rotas acima do orçamento de comandos SQL (ver consultas.ORCAMENTOS e o log da API):')
+        for estouro in estourados:
+            print(f'   {estouro}')
+        raise SystemExit(1)
+
+    if not args.baseline:
+        return
+    caminho = os.path.join(BASELINES_DIR, f'{args.baseline}.json')
+    if args.gravar_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f'💾 Baseline gravada em {os.path.relpath(caminho)}')
+        return
+    if not os.path.exists(caminho):
+        raise SystemExit(f'❌ Baseline {caminho} não existe (rode com --gravar-baseline)')
+    with open(caminho, encoding='utf-8') as arquivo:
+        base = json.load(arquivo)
+    pioras = comparar(resultado, base, args.tolerancia)
+    if pioras:
+        print('❌ Piora em relação à baseline:')
+        for piora in pioras:
+            print(f'   {piora}')
+        raise SystemExit(1)
+    print('✅ Dentro da tolerância da baseline')
+
+
+if __name__ == '__main__':
+    main()
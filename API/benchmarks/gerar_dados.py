@@ -0,0 +1,457 @@
+#======================================================================
+#   Gerador de dados em massa (usuários, produtos, carrinhos e pedidos)
+#======================================================================
+# Cria as tabelas da API (schema.sql) num banco descartável e
+# carrega dados determinísticos: a mesma --semente (e o mesmo --ate) gera
+# sempre as mesmas linhas. As distribuições imitam o uso real:
+#   - poucos produtos concentram a maior parte das vendas e dos favoritos (Zipf);
+#   - clientes fiéis fazem muitos pedidos, a maioria compra pouco (Zipf);
+#   - pedidos se concentram no café da manhã, almoço e fim de tarde, com
+#     fins de semana mais cheios e volume crescendo ao longo do período;
+#   - pedidos antigos estão entregues (ou cancelados), os recentes em andamento.
+#
+# A carga usa LOAD DATA LOCAL INFILE (arquivos temporários em blocos) e, se o
+# servidor não permitir (local_infile=OFF), INSERTs de várias linhas. Cada
+# tabela tem seu próprio gerador aleatório, então mudar a quantidade de
+# produtos não muda os usuários, por exemplo. Depois da carga rodam as
+# migrações (migracoes.py: índices e rollups), como num banco de produção
+# atualizado; --sem-migracoes deixa só o schema.sql, para comparar.
+#
+# Uso:
+#   python benchmarks/gerar_dados.py --db-user root --db-senha root
+#   python benchmarks/gerar_dados.py --usuarios 1000000 --produtos 2000 --pedidos 3300000   # ~10M itens
+#   python benchmarks/gerar_dados.py --metodo insert --lote 2000
+#
+# Todos os usuários e o administrador (admin@exemplo.com) têm a senha SENHA.
+# Atenção: o banco --db-nome (padrão cafeteria_carga) é APAGADO e recriado.
+
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, API_DIR)
+
+import mysql.connector  # noqa: E402
+from mysql.connector import Error  # noqa: E402
+import migracoes  # noqa: E402
+import rollups  # noqa: E402
+import senhas  # noqa: E402
+
+SENHA = 'carga-123'
+CUPOM = 'CARGA10'
+BLOCO_ARQUIVO = 200000   # linhas por arquivo do LOAD DATA
+
+CATEGORIAS = {
+    'cafés': ['Café expresso', 'Café coado', 'Cappuccino', 'Latte', 'Mocha', 'Macchiato', 'Café gelado'],
+    'salgados': ['Pão de queijo', 'Coxinha', 'Empada', 'Esfirra', 'Quiche', 'Croissant de presunto'],
+    'doces': ['Bolo de cenoura', 'Brownie', 'Torta de limão', 'Cookie', 'Brigadeiro', 'Pudim'],
+    'bebidas': ['Suco de laranja', 'Chá gelado', 'Água com gás', 'Refrigerante', 'Limonada'],
+    'lanches': ['Misto quente', 'Sanduíche natural', 'Tapioca', 'Wrap de frango', 'Torrada'],
+}
+TAMANHOS = ['', ' pequeno', ' médio', ' grande', ' especial', ' da casa']
+RUAS = ['Rua das Flores', 'Avenida Central', 'Quadra 102 Sul', 'Rua do Comércio', 'Alameda dos Ipês']
+BAIRROS = ['Asa Sul', 'Asa Norte', 'Águas Claras', 'Taguatinga', 'Guará', 'Sudoeste']
+PAGAMENTOS = ['pix', 'cartao', 'dinheiro']
+STATUS_ABERTOS = ['Realizado', 'Produção', 'Pronto', 'A caminho']
+
+# Peso de cada hora do dia nos pedidos (cafeteria: manhã, almoço e fim de tarde)
+PESO_HORA = {6: 2, 7: 6, 8: 10, 9: 8, 10: 6, 11: 7, 12: 10, 13: 9, 14: 5,
+             15: 6, 16: 8, 17: 7, 18: 5, 19: 4, 20: 3, 21: 2, 22: 1}
+
+
+# ------------------------
+# Banco
+# ------------------------
+def argumentos_banco(parser):
+    grupo = parser.add_argument_group('banco local (descartável)')
+    grupo.add_argument('--db-host', default=os.getenv('DB_HOST_LOCAL', '127.0.0.1'))
+    grupo.add_argument('--db-porta', type=int, default=int(os.getenv('DB_PORT_LOCAL', 3306)))
+    grupo.add_argument('--db-user', default=os.getenv('DB_USER_LOCAL', 'root'))
+    grupo.add_argument('--db-senha', default=os.getenv('DB_PASSWORD_LOCAL', ''))
+    grupo.add_argument('--db-nome', default='cafeteria_carga')
+
+
+def argumentos_dados(parser, usuarios, produtos, pedidos):
+    grupo = parser.add_argument_group('dados')
+    grupo.add_argument('--usuarios', type=int, default=usuarios)
+    grupo.add_argument('--produtos', type=int, default=produtos)
+    grupo.add_argument('--pedidos', type=int, default=pedidos, help='pedidos no histórico (~3 itens cada)')
+    grupo.add_argument('--dias', type=int, default=365, help='período coberto pelos pedidos')
+    grupo.add_argument('--ate', type=date.fromisoformat, default=date.today(),
+                       help='YYYY-MM-DD: último dia do período (padrão hoje)')
+    grupo.add_argument('--semente', type=int, default=42)
+    grupo.add_argument('--estoque', type=int, default=10 ** 8,
+                       help='estoque inicial de cada produto (baixo = checkouts disputam estoque de verdade)')
+    grupo.add_argument('--metodo', choices=['auto', 'load', 'insert'], default='auto',
+                       help='LOAD DATA LOCAL INFILE, INSERT de várias linhas ou auto (LOAD se o servidor aceitar)')
+    grupo.add_argument('--lote', type=int, default=5000, help='linhas por INSERT/commit no método insert')
+    grupo.add_argument('--sem-migracoes', action='store_true',
+                       help='não aplica migracoes.py depois da carga (sem os índices das consultas quentes)')
+
+
+def conectar(args, banco=None):
+    return mysql.connector.connect(host=args.db_host, port=args.db_porta, user=args.db_user,
+                                   password=args.db_senha, database=banco, autocommit=False,
+                                   allow_local_infile=True)
+
+
+def recusar_banco_da_api(args):
+    if args.db_nome == os.getenv('DB_NAME') and args.db_host == os.getenv('DB_HOST'):
+        raise SystemExit('❌ --db-nome aponta para o banco configurado da API; use um banco descartável')
+
+
+def executar_script(cursor, caminho):
+    # Roda um arquivo .sql comando a comando (sem DELIMITER; comentários "--" ignorados)
+    with open(caminho, encoding='utf-8') as arquivo:
+        linhas = [linha for linha in arquivo if not linha.lstrip().startswith('--')]
+    for comando in ''.join(linhas).split(';'):
+        if comando.strip():
+            cursor.execute(comando)
+
+
+def recriar_banco(args):
+    conn = conectar(args)
+    cursor = conn.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS `{args.db_nome}`')
+    cursor.execute(f'CREATE DATABASE `{args.db_nome}` CHARACTER SET utf8mb4')
+    cursor.close()
+    conn.close()
+
+    conn = conectar(args, args.db_nome)
+    cursor = conn.cursor()
+    executar_script(cursor, os.path.join(API_DIR, 'schema.sql'))
+    conn.commit()
+    cursor.close()
+    return conn
+
+
+# ------------------------
+# Carga em massa
+# ------------------------
+def _campo(valor):
+    if valor is None:
+        return '\\N'
+    return str(valor).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class Carregador:
+    # Grava linhas em blocos: LOAD DATA de um arquivo temporário por bloco ou
+    # executemany (que o conector transforma num INSERT de várias linhas).
+
+    def __init__(self, conn, metodo, lote):
+        self.conn = conn
+        self.metodo = metodo
+        self.lote = lote
+        self.pasta = tempfile.mkdtemp(prefix='cafeteria_dados_')
+        self.totais = {}
+
+    def carregar(self, tabela, colunas, linhas):
+        tamanho = self.lote if self.metodo == 'insert' else BLOCO_ARQUIVO
+        iterador = iter(linhas)
+        while True:
+            bloco = list(itertools.islice(iterador, tamanho))
+            if not bloco:
+                return
+            if self.metodo != 'insert' and not self._load_data(tabela, colunas, bloco):
+                self.metodo = 'insert'
+            if self.metodo == 'insert':
+                for inicio in range(0, len(bloco), self.lote):
+                    self._inserir(tabela, colunas, bloco[inicio:inicio + self.lote])
+            self.totais[tabela] = self.totais.get(tabela, 0) + len(bloco)
+
+    def _load_data(self, tabela, colunas, bloco):
+        caminho = os.path.join(self.pasta, f'{tabela}.tsv')
+        with open(caminho, 'w', encoding='utf-8', newline='\n') as arquivo:
+            for linha in bloco:
+                arquivo.write('\t'.join(map(_campo, linha)))
+                arquivo.write('\n')
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE '{caminho}' INTO TABLE {tabela}
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({', '.join(colunas)})
+            """)
+            self.conn.commit()
+            return True
+        except Error as e:
+            self.conn.rollback()
+            if self.metodo == 'load':
+                raise
+            print(f'   ⚠️ LOAD DATA indisponível ({e.msg}); usando INSERT de várias linhas')
+            return False
+        finally:
+            cursor.close()
+            os.remove(caminho)
+
+    def _inserir(self, tabela, colunas, linhas):
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(
+                f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(['%s'] * len(colunas))})",
+                linhas)
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+    def fechar(self):
+        os.rmdir(self.pasta)
+
+
+# ------------------------
+# Distribuições
+# ------------------------
+def acumulado_zipf(n, expoente):
+    # Pesos acumulados de 1/posição^expoente (posição 1 = mais popular)
+    acumulado, soma = [], 0.0
+    for posicao in range(1, n + 1):
+        soma += posicao ** -expoente
+        acumulado.append(soma)
+    return acumulado
+
+
+def sortear(rnd, acumulado):
+    # Índice (0..n-1) sorteado com os pesos acumulados
+    return bisect.bisect_right(acumulado, rnd.random() * acumulado[-1])
+
+
+def _rnd(args, tabela):
+    # Um gerador por tabela, derivado da semente (str como semente é estável entre execuções)
+    return random.Random(f'{args.semente}:{tabela}')
+
+
+def _dinheiro(centavos):
+    return f'{centavos // 100}.{centavos % 100:02d}'
+
+
+# ------------------------
+# Tabelas
+# ------------------------
+def email_usuario(numero):
+    return f'usuario{numero}@exemplo.com'
+
+
+def _usuarios(args, senha_hash, inicio):
+    rnd = _rnd(args, 'usuario')
+    for i in range(1, args.usuarios + 1):
+        cadastro = inicio + timedelta(seconds=int((i / args.usuarios) * args.dias * 86400))
+        yield (i, f'Usuário {i}', email_usuario(i), senha_hash, f'{i:011d}', f'619{rnd.randint(80000000, 99999999)}',
+               date(1950, 1, 1) + timedelta(days=rnd.randint(0, 20000)), cadastro, cadastro, 1, None)
+
+
+def _enderecos(args):
+    rnd = _rnd(args, 'endereco')
+    proximo = itertools.count(1)
+    for usuario in range(1, args.usuarios + 1):
+        quantos = 0 if rnd.random() < 0.2 else (2 if rnd.random() < 0.15 else 1)
+        for _ in range(quantos):
+            yield (next(proximo), usuario, rnd.choice(RUAS), str(rnd.randint(1, 999)), rnd.choice(BAIRROS),
+                   'Brasília', 'DF', f'70{rnd.randint(0, 999999):06d}', None, None)
+
+
+def _produtos(args, agora):
+    # Devolve as linhas e o preço (centavos) de cada produto
+    rnd = _rnd(args, 'produtos')
+    combinacoes = [(categoria, nome + tamanho) for categoria, nomes in CATEGORIAS.items()
+                   for nome in nomes for tamanho in TAMANHOS]
+    rnd.shuffle(combinacoes)
+    linhas, precos = [], {}
+    for i in range(1, args.produtos + 1):
+        categoria, nome = combinacoes[(i - 1) % len(combinacoes)]
+        if i > len(combinacoes):
+            nome = f'{nome} {i // len(combinacoes) + 1}'
+        precos[i] = rnd.randint(300, 4500)
+        linhas.append((i, nome, 'Feito na hora com ingredientes selecionados da região.', _dinheiro(precos[i]),
+                       f'{rnd.randint(30, 50) / 10:.1f}', f'/imagens/{rnd.getrandbits(256):064x}',
+                       args.estoque, categoria, int(rnd.random() < 0.08),
+                       agora - timedelta(days=rnd.randint(0, args.dias)), 1, 1))
+    return linhas, precos
+
+
+def _favoritos(args, produtos_zipf, agora):
+    rnd = _rnd(args, 'favoritos')
+    proximo = itertools.count(1)
+    for usuario in range(1, args.usuarios + 1):
+        if rnd.random() >= 0.3:
+            continue
+        escolhidos = {sortear(rnd, produtos_zipf) + 1 for _ in range(rnd.randint(1, 6))}
+        for produto in sorted(escolhidos):
+            yield (next(proximo), usuario, produto, agora - timedelta(minutes=rnd.randint(0, args.dias * 1440)))
+
+
+def _carrinhos(args, produtos_zipf, agora):
+    # ~5% dos usuários com carrinho aberto; devolve (carrinhos, itens)
+    rnd = _rnd(args, 'carrinho')
+    carrinhos, itens = [], []
+    proximo_item = itertools.count(1)
+    for usuario in range(1, args.usuarios + 1):
+        if rnd.random() >= 0.05:
+            continue
+        id_carrinho = len(carrinhos) + 1
+        criado = agora - timedelta(minutes=rnd.randint(0, 7 * 1440))
+        carrinhos.append((id_carrinho, usuario, 'aberto', criado))
+        for produto in sorted({sortear(rnd, produtos_zipf) + 1 for _ in range(rnd.randint(1, 5))}):
+            itens.append((next(proximo_item), id_carrinho, produto, rnd.randint(1, 3), criado))
+    return carrinhos, itens
+
+
+def _cupons(args, agora):
+    rnd = _rnd(args, 'cupom')
+    linhas = [(1, CUPOM, 'Cupom do teste de carga', '10.00', 'percentual', date(2099, 12, 31), 1, 1, agora)]
+    for i in range(2, 21):
+        vencido = rnd.random() < 0.4
+        validade = agora.date() + timedelta(days=-rnd.randint(1, 300) if vencido else rnd.randint(1, 300))
+        tipo = rnd.choice(['percentual', 'valor'])
+        linhas.append((i, f'PROMO{i:02d}', f'Promoção {i}', f'{rnd.randint(5, 30)}.00', tipo, validade,
+                       int(rnd.random() < 0.9), 1, agora - timedelta(days=rnd.randint(0, args.dias))))
+    return linhas
+
+
+def _pedidos(args, precos, produtos_zipf, agora):
+    # Gera (pedido, [itens]) em ordem de data, dia a dia; ids explícitos
+    rnd = _rnd(args, 'pedidos')
+    usuarios_zipf = acumulado_zipf(args.usuarios, 0.8)
+    inicio = (agora - timedelta(days=args.dias)).replace(hour=0, minute=0, second=0, microsecond=0)
+    pesos_dia = [(1.3 if (inicio + timedelta(days=d)).weekday() >= 5 else 1.0) * (0.5 + d / args.dias)
+                 for d in range(args.dias)]
+    soma_pesos = sum(pesos_dia)
+    horas = list(PESO_HORA)
+    pesos_hora = list(PESO_HORA.values())
+    recente = agora - timedelta(days=2)
+    id_pedido = 0
+    proximo_item = itertools.count(1)
+    distribuidos = 0.0
+    for dia, peso in enumerate(pesos_dia):
+        # Parte inteira acumulada: o total de pedidos fecha exatamente em args.pedidos
+        distribuidos += args.pedidos * peso / soma_pesos
+        quantidade_dia = round(distribuidos) - id_pedido
+        momentos = sorted(inicio + timedelta(days=dia, hours=hora, seconds=rnd.randint(0, 3599))
+                          for hora in rnd.choices(horas, pesos_hora, k=quantidade_dia))
+        for quando in momentos:
+            id_pedido += 1
+            quantos = 1
+            while quantos < 8 and rnd.random() < 0.62:   # média ~2,6 itens por pedido
+                quantos += 1
+            produtos = {sortear(rnd, produtos_zipf) + 1 for _ in range(quantos)}
+            itens = [(next(proximo_item), id_pedido, produto, rnd.randint(1, 3), _dinheiro(precos[produto]))
+                     for produto in sorted(produtos)]
+            subtotal = sum(precos[produto] * quantidade for _, _, produto, quantidade, _ in itens)
+            cupom = f'PROMO{rnd.randint(2, 20):02d}' if rnd.random() < 0.1 else None
+            desconto = subtotal // 10 if cupom else 0
+            frete = rnd.choice([0, 0, 500, 700])
+            if quando < recente:
+                status = 'Cancelado' if rnd.random() < 0.06 else 'Entregue'
+            else:
+                status = rnd.choice(STATUS_ABERTOS)
+            pedido = (id_pedido, sortear(rnd, usuarios_zipf) + 1, f'{rnd.choice(RUAS)}, {rnd.randint(1, 999)}',
+                      _dinheiro(subtotal - desconto + frete), _dinheiro(frete), _dinheiro(desconto), cupom,
+                      status, None, rnd.choice(PAGAMENTOS), quando)
+            yield pedido, itens
+
+
+COLUNAS = {
+    'usuario': ('idUsuario', 'nome_completo', 'email', 'senha', 'cpf', 'telefone', 'data_nascimento',
+                'data_cadastro', 'data_ultimo_acesso', 'ativo', 'Administrador_idAdministrador'),
+    'endereco': ('idEndereco_usuario', 'Usuario_idUsuario', 'logradouro', 'numero', 'bairro', 'cidade',
+                 'estado', 'cep', 'complemento', 'referencia'),
+    'produtos': ('idProdutos', 'nome', 'descricao', 'valor', 'avaliacao', 'imagem', 'quantidade_estoque',
+                 'categoria', 'is_promotion', 'data_cadastro', 'vitrine_idVitrine', 'administrador_idAdministrador'),
+    'favoritos': ('idFavoritos', 'Usuario_idUsuario', 'Produtos_idProdutos', 'data_criacao'),
+    'carrinho': ('idCarrinho', 'Usuario_idUsuario', 'status', 'data_criacao'),
+    'carrinho_produto': ('idCarrinho_Produtos', 'Carrinho_idCarrinho', 'Produtos_idProdutos', 'quantidade',
+                         'data_criacao'),
+    'cupom': ('idCupom', 'codigo', 'descricao', 'desconto', 'tipo_desconto', 'data_validade', 'ativo',
+              'Administrador_idAdministrador', 'data_criacao'),
+    'relatorio_pedido': ('idRelatorio_Pedido', 'Usuario_idUsuario', 'endereco', 'valor_total', 'valor_frete',
+                         'valor_desconto', 'cupom_codigo', 'status', 'observacao', 'tipo_pagamento', 'data_status'),
+    'relatorio_pedido_produto': ('idRelatorio_Pedido_Produto', 'Relatorio_Pedido_id', 'Produto_id', 'quantidade',
+                                 'preco_unitario'),
+}
+
+
+def gerar(conn, args, progresso=print):
+    # Carrega todas as tabelas; devolve {'usuarios': n, 'precos': {id_produto: valor}}
+    agora = datetime.combine(args.ate, datetime.min.time())
+    inicio = agora - timedelta(days=args.dias)
+    carregador = Carregador(conn, args.metodo, args.lote)
+    cursor = conn.cursor()
+    cursor.execute('SET unique_checks = 0')
+    cursor.close()
+
+    def etapa(nome, funcao):
+        comeco = time.perf_counter()
+        funcao()
+        linhas = ', '.join(f'{carregador.totais.get(t, 0):,} {t}' for t in nome.split('+'))
+        progresso(f'   {linhas} em {time.perf_counter() - comeco:.1f}s')
+
+    senha_hash = senhas.gerar_hash(SENHA)
+    carregador.carregar('administrador', ('idAdministrador', 'nome', 'email', 'senha', 'cargo', 'data_criacao', 'ativo'),
+                        [(1, 'Admin', 'admin@exemplo.com', senha_hash, 'adm', inicio, 1)])
+    carregador.carregar('vitrine', ('idVitrine', 'nome', 'descricao', 'data_criacao'), [(1, 'Principal', '', inicio)])
+
+    linhas_produtos, precos = _produtos(args, agora)
+    produtos_zipf = acumulado_zipf(args.produtos, 1.1)
+    carrinhos, itens_carrinho = _carrinhos(args, produtos_zipf, agora)
+
+    etapa('usuario', lambda: carregador.carregar('usuario', COLUNAS['usuario'], _usuarios(args, senha_hash, inicio)))
+    etapa('endereco', lambda: carregador.carregar('endereco', COLUNAS['endereco'], _enderecos(args)))
+    etapa('produtos', lambda: carregador.carregar('produtos', COLUNAS['produtos'], linhas_produtos))
+    etapa('favoritos', lambda: carregador.carregar('favoritos', COLUNAS['favoritos'],
+                                                   _favoritos(args, produtos_zipf, agora)))
+    etapa('carrinho+carrinho_produto', lambda: (
+        carregador.carregar('carrinho', COLUNAS['carrinho'], carrinhos),
+        carregador.carregar('carrinho_produto', COLUNAS['carrinho_produto'], itens_carrinho)))
+    etapa('cupom', lambda: carregador.carregar('cupom', COLUNAS['cupom'], _cupons(args, agora)))
+
+    def carregar_pedidos():
+        pares = _pedidos(args, precos, produtos_zipf, agora)
+        while True:
+            bloco = list(itertools.islice(pares, BLOCO_ARQUIVO))
+            if not bloco:
+                return
+            carregador.carregar('relatorio_pedido', COLUNAS['relatorio_pedido'], (p for p, _ in bloco))
+            carregador.carregar('relatorio_pedido_produto', COLUNAS['relatorio_pedido_produto'],
+                                (item for _, itens in bloco for item in itens))
+    etapa('relatorio_pedido+relatorio_pedido_produto', carregar_pedidos)
+
+    # Índices criados depois da carga (mais rápido que mantê-los durante os INSERTs)
+    comeco = time.perf_counter()
+    if args.sem_migracoes:
+        rollups.reconstruir(conn)
+        migracoes.recalcular_reservas(conn)
+        progresso(f'   rollups e reservas recalculados em {time.perf_counter() - comeco:.1f}s')
+    else:
+        migracoes.migrar(conn)
+        progresso(f'   migrações aplicadas em {time.perf_counter() - comeco:.1f}s')
+    carregador.fechar()
+    return {'usuarios': args.usuarios, 'precos': {i: c / 100 for i, c in precos.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera dados determinísticos em massa para testes')
+    argumentos_banco(parser)
+    argumentos_dados(parser, usuarios=100000, produtos=500, pedidos=300000)
+    args = parser.parse_args()
+    recusar_banco_da_api(args)
+
+    print(f'🛠️  Recriando {args.db_nome} em {args.db_host}:{args.db_porta} (semente {args.semente})...')
+    inicio = time.perf_counter()
+    conn = recriar_banco(args)
+    try:
+        gerar(conn, args)
+    finally:
+        conn.close()
+    print(f'✅ Dados gerados em {time.perf_counter() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
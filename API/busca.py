@@ -0,0 +1,216 @@
+from collections import Counter
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+
+#======================================================================
+#   Busca de produtos (índice invertido em memória, por worker)
+#======================================================================
+# Indexa nome, descrição e categoria dos produtos. As palavras são
+# normalizadas sem acento e no singular ("cafés" -> "cafe"), a última palavra da consulta
+# casa por prefixo (digitação em andamento) e o ranking é BM25 com peso por
+# campo. A busca não vai ao MySQL: o índice é montado a partir do catálogo e
+# refeito quando a versão de catalogo_cache muda (escrita em outro worker).
+#
+# Configuração via .env:
+#   BUSCA_TTL   segundos até reconstruir o índice mesmo sem mudança de versão (padrão 300)
+
+PESOS = {'nome': 3.0, 'categoria': 2.0, 'descricao': 1.0}
+K1 = 1.2
+B = 0.75
+MAX_EXPANSOES = 50          # termos considerados para um prefixo
+PESO_PREFIXO = 0.8          # termo que só casa por prefixo vale um pouco menos que o exato
+MAX_INCREMENTAL = 200       # acima disso a mudança não é aplicada no índice: a próxima busca reconstrói
+
+STOPWORDS = {'a', 'o', 'as', 'os', 'de', 'da', 'do', 'das', 'dos', 'e', 'em', 'no', 'na',
+             'nos', 'nas', 'com', 'um', 'uma', 'para', 'por', 'ao'}
+
+_PALAVRA = re.compile(r'[a-z0-9]+')
+
+
+def normalizar(texto):
+    sem_acento = unicodedata.normalize('NFKD', str(texto or ''))
+    sem_acento = ''.join(c for c in sem_acento if not unicodedata.combining(c))
+    return sem_acento.casefold()
+
+
+# Plural -> singular (depois de tirar os acentos): "cafés" e "café" viram o mesmo termo
+_PLURAIS = (('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ns', 'm'), ('s', ''))
+
+
+def _singular(palavra):
+    if len(palavra) > 3:
+        for fim, troca in _PLURAIS:
+            if palavra.endswith(fim):
+                return palavra[:-len(fim)] + troca
+    return palavra
+
+
+def tokens(texto):
+    return [_singular(p) for p in _PALAVRA.findall(normalizar(texto)) if p not in STOPWORDS]
+
+
+class IndiceBusca:
+
+    def __init__(self):
+        self.documentos = {}     # id -> produto (linha de produtos)
+        self._postings = {}      # termo -> {id: frequência ponderada}
+        self._termos = []        # termos ordenados (busca por prefixo com bisect)
+        self._tamanhos = {}      # id -> tamanho ponderado do documento
+        self._soma_tamanhos = 0.0
+        self._lock = threading.RLock()
+
+    # ------------------------
+    # Atualização
+    # ------------------------
+    def adicionar(self, produto):
+        id_produto = produto['idProdutos']
+        frequencias = Counter()
+        for campo, peso in PESOS.items():
+            for termo in tokens(produto.get(campo)):
+                frequencias[termo] += peso
+        with self._lock:
+            self._remover(id_produto)
+            self.documentos[id_produto] = produto
+            for termo, freq in frequencias.items():
+                posting = self._postings.get(termo)
+                if posting is None:
+                    posting = self._postings[termo] = {}
+                    bisect.insort(self._termos, termo)
+                posting[id_produto] = freq
+            tamanho = sum(frequencias.values())
+            self._tamanhos[id_produto] = tamanho
+            self._soma_tamanhos += tamanho
+
+    def remover(self, id_produto):
+        with self._lock:
+            self._remover(id_produto)
+
+    def _remover(self, id_produto):
+        produto = self.documentos.pop(id_produto, None)
+        if produto is None:
+            return
+        for campo in PESOS:
+            for termo in tokens(produto.get(campo)):
+                posting = self._postings.get(termo)
+                if posting is None or posting.pop(id_produto, None) is None or posting:
+                    continue
+                del self._postings[termo]
+                self._termos.pop(bisect.bisect_left(self._termos, termo))
+        self._soma_tamanhos -= self._tamanhos.pop(id_produto, 0)
+
+    # ------------------------
+    # Consulta
+    # ------------------------
+    def _expandir(self, termo, prefixo):
+        # Termo exato e, se for o caso, os termos que começam com ele
+        termos = {termo: 1.0} if termo in self._postings else {}
+        if prefixo:
+            inicio = bisect.bisect_left(self._termos, termo)
+            for t in self._termos[inicio:inicio + MAX_EXPANSOES + 1]:
+                if not t.startswith(termo):
+                    break
+                termos.setdefault(t, PESO_PREFIXO)
+        return termos
+
+    def buscar(self, consulta, categoria=None, limite=20, prefixo=True):
+        # Devolve (total, resultados, facetas); todas as palavras precisam casar
+        palavras = tokens(consulta)
+        if not palavras:
+            return 0, [], []
+        with self._lock:
+            n = len(self.documentos) or 1
+            media = (self._soma_tamanhos / n) or 1.0
+            pontos = None
+            for n_palavra, palavra in enumerate(palavras):
+                ultima = prefixo and n_palavra == len(palavras) - 1
+                da_palavra = {}
+                for termo, fator in self._expandir(palavra, ultima).items():
+                    posting = self._postings[termo]
+                    idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for id_produto, freq in posting.items():
+                        norma = K1 * (1 - B + B * self._tamanhos[id_produto] / media)
+                        valor = fator * idf * freq * (K1 + 1) / (freq + norma)
+                        if valor > da_palavra.get(id_produto, 0):
+                            da_palavra[id_produto] = valor
+                if pontos is None:
+                    pontos = da_palavra
+                else:
+                    pontos = {id_: p + da_palavra[id_] for id_, p in pontos.items() if id_ in da_palavra}
+                if not pontos:
+                    return 0, [], []
+
+            # Facetas sobre todos os resultados (antes do filtro de categoria)
+            facetas = Counter(self.documentos[id_].get('categoria') or '' for id_ in pontos)
+            if categoria:
+                alvo = normalizar(categoria)
+                pontos = {id_: p for id_, p in pontos.items()
+                          if normalizar(self.documentos[id_].get('categoria')) == alvo}
+            melhores = heapq.nlargest(limite, pontos.items(), key=lambda item: (item[1], -item[0]))
+            resultados = [dict(self.documentos[id_], score=round(p, 4)) for id_, p in melhores]
+
+        return (len(pontos), resultados,
+                [{'categoria': c, 'total': t} for c, t in facetas.most_common()])
+
+
+class BuscaCatalogo:
+    # Mantém o IndiceBusca em dia com a versão de catalogo_cache
+
+    def __init__(self, cache, carregar_todos, carregar_varios, ttl=None):
+        self.cache = cache
+        self.carregar_todos = carregar_todos
+        self.carregar_varios = carregar_varios   # ids -> produtos que ainda existem
+        self.ttl = float(ttl if ttl is not None else os.getenv('BUSCA_TTL', 300))
+        self.indice = IndiceBusca()
+        self.versao = None
+        self._montado_em = 0.0
+        self._lock = threading.Lock()
+        self.metricas = {'reconstrucoes': 0, 'incrementais': 0}
+
+    def atual(self):
+        versao = self.cache.versao()
+        if versao != self.versao or time.monotonic() - self._montado_em > self.ttl:
+            with self._lock:
+                versao = self.cache.versao()
+                if versao != self.versao or time.monotonic() - self._montado_em > self.ttl:
+                    # Monta um índice novo e troca de uma vez; quem está buscando
+                    # continua no antigo até terminar
+                    novo = IndiceBusca()
+                    for produto in self.carregar_todos():
+                        novo.adicionar(produto)
+                    self.indice, self.versao = novo, versao
+                    self._montado_em = time.monotonic()
+                    self.metricas['reconstrucoes'] += 1
+        return self.indice
+
+    def buscar(self, consulta, categoria=None, limite=20, prefixo=True):
+        return self.atual().buscar(consulta, categoria, limite, prefixo)
+
+    def produtos_alterados(self, ids, versao_anterior, versao_nova):
+        # Chamado pelo handler que gravou os produtos, com o par devolvido por
+        # cache.trocar_versao(). Só aplica a mudança se a versão substituída é a
+        # do índice (nenhuma outra escrita no meio) e os ids são conhecidos e
+        # poucos; senão deixa para a próxima busca reconstruir.
+        with self._lock:
+            if self.versao is None or versao_anterior is None or self.versao != versao_anterior:
+                return
+            if ids is None or len(ids) > MAX_INCREMENTAL:
+                return
+            produtos = {produto['idProdutos']: produto for produto in self.carregar_varios(ids)} if ids else {}
+            for id_produto in ids:
+                if id_produto in produtos:
+                    self.indice.adicionar(produtos[id_produto])
+                else:
+                    self.indice.remover(id_produto)
+            self.versao = versao_nova
+            self.metricas['incrementais'] += 1
+
+    def estatisticas(self):
+        return dict(self.metricas, documentos=len(self.indice.documentos),
+                    termos=len(self.indice._termos), versao=self.versao)
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from flask import current_app, request
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+#======================================================================
+#   Cache em memória do catálogo (por worker) com versão compartilhada
+#======================================================================
+# Cada worker guarda suas próprias entradas, mas a versão do catálogo fica
+# num arquivo em disco: quando um handler de escrita chama invalidar(), todos
+# os workers da máquina passam a ver a nova versão e descartam o que tinham.
+#
+# Configuração via .env:
+#   CACHE_DIR        pasta dos arquivos de versão (padrão: temp do sistema)
+#   CACHE_TTL        segundos que uma entrada vale (padrão 300)
+#   CACHE_MAX_ITENS  número máximo de entradas por cache (padrão 256)
+#   CACHE_MAX_AGE    max-age (s) enviado no Cache-Control (padrão 0 = sempre revalidar)
+
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'cafeteria_cache'))
+
+
+class CacheVersionado:
+
+    def __init__(self, nome, ttl=None, max_itens=None):
+        self.nome = nome
+        self.ttl = float(ttl if ttl is not None else os.getenv('CACHE_TTL', 300))
+        self.max_itens = int(max_itens if max_itens is not None else os.getenv('CACHE_MAX_ITENS', 256))
+        self._arquivo = os.path.join(CACHE_DIR, f'{nome}.versao')
+        self._itens = OrderedDict()   # chave -> (versao, expira_em, valor)
+        self._lock = threading.Lock()
+        self._versao = 0
+        self._stat = None
+        self.metricas = {'hits': 0, 'misses': 0, 'expirados': 0, 'despejados': 0, 'invalidacoes': 0}
+
+    # ------------------------
+    # Versão compartilhada entre workers
+    # ------------------------
+    def versao(self):
+        try:
+            st = os.stat(self._arquivo)
+        except FileNotFoundError:
+            return self.invalidar(contar=False)
+        assinatura = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if assinatura != self._stat:
+            try:
+                with open(self._arquivo) as f:
+                    self._versao = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                self._versao = 0
+            self._stat = assinatura
+        return self._versao
+
+    def invalidar(self, contar=True):
+        return self.trocar_versao(contar)[1]
+
+    def trocar_versao(self, contar=True):
+        # Grava uma versão nova e devolve (versão substituída, versão nova).
+        # A troca é feita com trava entre processos: se outro worker invalidou
+        # no meio, a versão substituída é a dele, e não a que este handler leu antes.
+        # Nova versão = timestamp em ns (único e crescente)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(f'{self._arquivo}.trava', 'w') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                with open(self._arquivo) as f:
+                    anterior = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                anterior = None
+            versao = max(time.time_ns(), (anterior or 0) + 1)
+            fd, temporario = tempfile.mkstemp(dir=CACHE_DIR, prefix=f'.{self.nome}.')
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(versao))
+            os.replace(temporario, self._arquivo)
+        with self._lock:
+            self._itens.clear()
+            if contar:
+                self.metricas['invalidacoes'] += 1
+        self.versao()
+        return anterior, versao
+
+    def recente(self, segundos):
+        # Invalidado há menos de "segundos" (a versão é o instante da invalidação)
+        return time.time_ns() - self.versao() < segundos * 1e9
+
+    # ------------------------
+    # Leitura com carga sob demanda
+    # ------------------------
+    def obter(self, chave, carregar):
+        return self.obter_com_versao(chave, carregar)[1]
+
+    def obter_com_versao(self, chave, carregar):
+        versao = self.versao()
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                if item[0] == versao and item[1] > agora:
+                    self._itens.move_to_end(chave)
+                    self.metricas['hits'] += 1
+                    return item[0], item[2]
+                self.metricas['expirados'] += 1
+                del self._itens[chave]
+            self.metricas['misses'] += 1
+
+        # Carrega fora do lock; grava com a versão lida ANTES da consulta, assim
+        # uma escrita concorrente deixa a entrada já vencida.
+        valor = carregar()
+        with self._lock:
+            self._itens[chave] = (versao, agora + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.metricas['despejados'] += 1
+        return versao, valor
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self.metricas)
+            dados['itens'] = len(self._itens)
+        dados['versao'] = self.versao()
+        return dados
+
+
+# Produtos, promoções e categorias (invalidado pelos handlers de produto/promoção)
+catalogo_cache = CacheVersionado('catalogo')
+
+# Cupons (invalidado pelos handlers de cupom)
+cupons_cache = CacheVersionado('cupons')
+
+
+#======================================================================
+#   Respostas com ETag / If-None-Match
+#======================================================================
+def gerar_etag(cache, versao, chave):
+    # Mesma versão + mesma chave => mesma ETag em qualquer worker
+    resumo = hashlib.sha1(repr(chave).encode()).hexdigest()[:12]
+    return f'{cache.nome}-{versao:x}-{resumo}'
+
+
+def _cache_control(publico):
+    max_age = int(os.getenv('CACHE_MAX_AGE', 0))
+    escopo = 'public' if publico else 'private'
+    if max_age <= 0:
+        return f'{escopo}, no-cache'
+    return f'{escopo}, max-age={max_age}, must-revalidate'
+
+
+def resposta_cacheada(cache, chave, carregar, publico=True, cabecalhos=None):
+    # Se o cliente já tem a versão atual responde 304 sem consultar o MySQL
+    # nem serializar JSON; senão devolve o corpo já serializado do cache.
+    # cabecalhos(dados) -> dict: cabeçalhos tirados dos dados, guardados junto
+    # com o corpo (ex.: X-Next-Cursor da paginação)
+    def montar():
+        dados = carregar()
+        return current_app.json.response(dados).get_data(), (cabecalhos(dados) if cabecalhos else {})
+
+    etag = gerar_etag(cache, cache.versao(), chave)
+    # Comparação fraca: a versão comprimida (compressao.py) leva a mesma ETag marcada como W/
+    if request.if_none_match.contains_weak(etag):
+        resposta = current_app.response_class(status=304)
+    else:
+        versao, (corpo, extras) = cache.obter_com_versao(('corpo',) + tuple(chave), montar)
+        etag = gerar_etag(cache, versao, chave)
+        resposta = current_app.response_class(corpo, mimetype=current_app.json.mimetype)
+        resposta.headers.update(extras)
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = _cache_control(publico)
+    return resposta
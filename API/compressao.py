@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from flask import request
+import gzip
+import os
+import threading
+
+try:
+    import brotli   # opcional: sem ele só gzip
+except ImportError:
+    brotli = None
+
+
+#======================================================================
+#   Compressão das respostas (gzip / brotli negociado pelo Accept-Encoding)
+#======================================================================
+# Hook after_request: comprime respostas JSON/texto acima de um tamanho
+# mínimo. Respostas de arquivo (imagens), em streaming (exportação), 304 e
+# já comprimidas passam direto. Respostas com ETag (catálogo, promoções,
+# cupons) têm o corpo comprimido guardado por (ETag, codificação), então o
+# mesmo catálogo não é comprimido de novo a cada requisição.
+#
+# Configuração via .env:
+#   COMPRESSAO_MIN_BYTES     tamanho mínimo para comprimir (padrão 1024)
+#   COMPRESSAO_NIVEL_GZIP    1..9 (padrão 6)
+#   COMPRESSAO_NIVEL_BROTLI  0..11 (padrão 5)
+#   COMPRESSAO_CACHE_ITENS   corpos comprimidos guardados por worker (padrão 128)
+
+MIN_BYTES = int(os.getenv('COMPRESSAO_MIN_BYTES', 1024))
+NIVEL_GZIP = int(os.getenv('COMPRESSAO_NIVEL_GZIP', 6))
+NIVEL_BROTLI = int(os.getenv('COMPRESSAO_NIVEL_BROTLI', 5))
+CACHE_ITENS = int(os.getenv('COMPRESSAO_CACHE_ITENS', 128))
+
+TIPOS_COMPRIMIVEIS = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain'}
+
+_cache = OrderedDict()   # (etag, codificacao) -> corpo comprimido
+_lock = threading.Lock()
+metricas = {'comprimidas': 0, 'bytes_antes': 0, 'bytes_depois': 0, 'cache_hits': 0}
+
+
+def escolher_codificacao(aceitas):
+    # aceitas = request.accept_encodings; prefere br quando o cliente e o servidor suportam
+    if brotli is not None and aceitas.quality('br') > 0:
+        return 'br'
+    if aceitas.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def comprimir_bytes(dados, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=NIVEL_BROTLI)
+    return gzip.compress(dados, compresslevel=NIVEL_GZIP, mtime=0)
+
+
+def _comprimido_do_cache(etag, codificacao, dados):
+    chave = (etag, codificacao)
+    with _lock:
+        corpo = _cache.get(chave)
+        if corpo is not None:
+            _cache.move_to_end(chave)
+            metricas['cache_hits'] += 1
+            return corpo
+    corpo = comprimir_bytes(dados, codificacao)
+    with _lock:
+        _cache[chave] = corpo
+        while len(_cache) > CACHE_ITENS:
+            _cache.popitem(last=False)
+    return corpo
+
+
+def comprimir_resposta(resposta):
+    if (resposta.direct_passthrough or resposta.is_streamed
+            or resposta.status_code < 200 or resposta.status_code in (204, 206, 304)
+            or 'Content-Encoding' in resposta.headers
+            or resposta.mimetype not in TIPOS_COMPRIMIVEIS):
+        return resposta
+
+    resposta.vary.add('Accept-Encoding')
+    codificacao = escolher_codificacao(request.accept_encodings)
+    if codificacao is None or request.method == 'HEAD':
+        return resposta
+    dados = resposta.get_data()
+    if len(dados) < MIN_BYTES:
+        return resposta
+
+    etag, fraca = resposta.get_etag()
+    corpo = _comprimido_do_cache(etag, codificacao, dados) if etag else comprimir_bytes(dados, codificacao)
+    if len(corpo) >= len(dados):
+        return resposta
+
+    resposta.set_data(corpo)
+    resposta.headers['Content-Encoding'] = codificacao
+    if etag and not fraca:
+        # Outra representação do mesmo conteúdo: ETag fraca (If-None-Match usa comparação fraca)
+        resposta.set_etag(etag, weak=True)
+    with _lock:
+        metricas['comprimidas'] += 1
+        metricas['bytes_antes'] += len(dados)
+        metricas['bytes_depois'] += len(corpo)
+    return resposta
+
+
+def estatisticas():
+    with _lock:
+        dados = dict(metricas, itens_cache=len(_cache))
+    dados['brotli'] = brotli is not None
+    return dados
+
+
+def iniciar(app):
+    app.after_request(comprimir_resposta)
@@ -0,0 +1,180 @@
+from collections import deque
+from flask import has_request_context, request
+import os
+import re
+import threading
+import time
+
+import db
+
+
+#======================================================================
+#   Log de consultas lentas e orçamento de consultas por rota
+#======================================================================
+# Observa todos os comandos SQL feitos pelos cursores do pool (db.CursorMedido):
+#   - comando acima de CONSULTAS_LENTA_MS vai para o log com duração, rota e o
+#     "formato" dos parâmetros (tipos, nunca os valores: há senhas e CPFs);
+#   - com CONSULTAS_EXPLAIN=1, os SELECTs lentos da requisição passam por um
+#     EXPLAIN depois que a resposta foi entregue (no teardown);
+#   - cada rota tem um orçamento de comandos por requisição. Estourar gera um
+#     aviso no log e nunca muda a resposta (a transação da rota já foi
+#     confirmada; um 500 aqui faria o cliente repetir e duplicar o pedido).
+#     Com CONSULTAS_ESTRITO=1 a resposta leva o cabeçalho X-Orcamento-Consultas,
+#     que o teste de carga (benchmarks/carga.py) confere para falhar quando
+#     um N+1 novo aparece.
+#
+# Configuração via .env:
+#   CONSULTAS_LENTA_MS          limite para o log de lentas (padrão 200)
+#   CONSULTAS_EXPLAIN           1 para rodar EXPLAIN das lentas (padrão 0)
+#   CONSULTAS_ORCAMENTO_PADRAO  comandos por requisição nas rotas sem orçamento próprio (padrão 20)
+#   CONSULTAS_ESTRITO           1 para marcar no cabeçalho as respostas que estouraram (padrão 0)
+
+LENTA_MS = float(os.getenv('CONSULTAS_LENTA_MS', 200))
+EXPLAIN = os.getenv('CONSULTAS_EXPLAIN', '0') == '1'
+ORCAMENTO_PADRAO = int(os.getenv('CONSULTAS_ORCAMENTO_PADRAO', 20))
+ESTRITO = os.getenv('CONSULTAS_ESTRITO', '0') == '1'
+CABECALHO_ESTOURO = 'X-Orcamento-Consultas'
+MAX_EXPLAIN_POR_REQUISICAO = 3
+
+# Comandos por requisição nas rotas mais acessadas (nome da função da rota)
+ORCAMENTOS = {
+    'get_produtos': 1,
+    'get_products': 1,
+    'get_categorias': 1,
+    'get_produtos_categoria': 1,
+    'get_promocoes': 1,
+    'buscar_produtos': 1,
+    'listar_pedidos_usuario': 2,   # pedidos + itens de todos numa consulta só
+    'listar_relatorios': 1,
+    'get_carrinho': 1,
+    'add_carrinho': 2,             # upsert do carrinho aberto + upsert do item
+    'listar_usuarios': 1,
+    'criar_pedido': 8,
+    'atualizar_status': 9,
+    'atualizar_status_lote': 9,
+    'analytics_vendas': 1,
+    'analytics_produtos': 1,
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+lentas = deque(maxlen=100)   # últimas consultas lentas deste worker (GET /consultas_lentas)
+estouros = {}                # rota -> vezes que passou do orçamento
+
+
+def _compactar(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def formato_parametros(params):
+    # (12, 'x') -> "(int, str)"; lista do executemany -> "[30 × (int, str)]"
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    if isinstance(params, list) and params and isinstance(params[0], (tuple, list, dict)):
+        return f'[{len(params)} × {formato_parametros(params[0])}]'
+    return '(' + ', '.join(type(v).__name__ for v in params) + ')'
+
+
+def _rota():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return '-'
+
+
+def _consulta_executada(sql, params, duracao):
+    if getattr(_local, 'explicando', False):
+        return
+    if getattr(_local, 'ativa', False):
+        _local.total += 1
+
+    ms = duracao * 1000
+    if ms < LENTA_MS:
+        return
+    registro = {
+        'ms': round(ms, 1),
+        'rota': _rota(),
+        'sql': _compactar(sql)[:2000],
+        'params': formato_parametros(params),
+        'quando': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    print(f"🐢 Consulta lenta ({registro['ms']} ms) em {registro['rota']}: "
+          f"{registro['sql'][:300]} params={registro['params']}")
+    with _lock:
+        lentas.append(registro)
+    if EXPLAIN and getattr(_local, 'ativa', False) and registro['sql'].upper().startswith(('SELECT', 'WITH')):
+        if len(_local.para_explicar) < MAX_EXPLAIN_POR_REQUISICAO:
+            _local.para_explicar.append((sql, params, registro))
+
+
+# ------------------------
+# Hooks da requisição
+# ------------------------
+def _antes():
+    _local.ativa, _local.total, _local.para_explicar = True, 0, []
+
+
+def _depois(resposta):
+    if not getattr(_local, 'ativa', False):
+        return resposta
+    _local.ativa = False
+    endpoint = request.endpoint or '-'
+    limite = ORCAMENTOS.get(endpoint, ORCAMENTO_PADRAO)
+    if _local.total <= limite:
+        return resposta
+
+    with _lock:
+        estouros[endpoint] = estouros.get(endpoint, 0) + 1
+    mensagem = f'{_local.total} comandos SQL em {request.method} {_rota()} (orçamento: {limite})'
+    print(f"⚠️ Orçamento de consultas estourado: {mensagem}")
+    if ESTRITO:
+        resposta.headers[CABECALHO_ESTOURO] = f'{_local.total}/{limite}'
+    return resposta
+
+
+def _explicar(exc):
+    # Roda depois da resposta: não atrasa o cliente
+    pendentes = getattr(_local, 'para_explicar', None)
+    if not pendentes:
+        return
+    _local.para_explicar = []
+    conn = db.get_connection()
+    if conn is None:
+        return
+    _local.explicando = True
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for sql, params, registro in pendentes:
+            try:
+                cursor.execute('EXPLAIN ' + sql, params or ())
+                plano = cursor.fetchall()
+            except Exception as e:
+                print(f"   EXPLAIN falhou: {e}")
+                continue
+            registro['explain'] = plano
+            for linha in plano:
+                varredura = ' ⚠️ varredura completa' if linha.get('type') == 'ALL' else ''
+                print(f"   EXPLAIN {linha.get('table')}: type={linha.get('type')} key={linha.get('key')} "
+                      f"rows={linha.get('rows')} {linha.get('Extra') or ''}{varredura}")
+    finally:
+        _local.explicando = False
+        cursor.close()
+        conn.close()
+
+
+def estatisticas():
+    with _lock:
+        return {
+            'lenta_ms': LENTA_MS,
+            'estrito': ESTRITO,
+            'estouros': dict(estouros),
+            'lentas': list(lentas),
+        }
+
+
+def iniciar(app):
+    db.observadores_consulta.append(_consulta_executada)
+    app.before_request(_antes)
+    app.after_request(_depois)
+    app.teardown_request(_explicar)
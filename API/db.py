@@ -1,41 +1,569 @@
 import mysql.connector
 from mysql.connector import Error
 from dotenv import load_dotenv
+import itertools
 import os
+import threading
+import time
+
+from tentativas import criar_store
 
 load_dotenv()  # lê o .env
 
-def get_connection2(): # Conexão com o banco de dados MySQL localmente. Obs mudar para connection
+
+#======================================================================
+#   Pool de conexões (um por processo/worker do gunicorn)
+#======================================================================
+# Configuração via .env:
+#   DB_POOL_SIZE          conexões mantidas abertas no pool (padrão 5)
+#   DB_POOL_MAX_OVERFLOW  conexões extras permitidas em pico (padrão 10)
+#   DB_POOL_TIMEOUT       segundos esperando uma conexão livre (padrão 10)
+#   DB_POOL_RECYCLE       idade máxima de uma conexão em segundos (padrão 1800)
+#   DB_POOL_PRE_PING      testa a conexão antes de entregar (padrão 1)
+
+def config_pool():
+    return {
+        'tamanho': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'recycle': float(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pre_ping': os.getenv('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False', ''),
+    }
+
+
+#======================================================================
+#   Cursor medido (tempo de cada comando SQL)
+#======================================================================
+# Toda conexão do pool entrega cursores embrulhados: execute/executemany e os
+# fetch* são cronometrados e cada comando é avisado aos observadores
+# registrados (métricas, log de consultas lentas...) com
+#   observador(sql, params, duracao_em_segundos)
+observadores_consulta = []
+
+
+def notificar_consulta(sql, params, duracao):
+    for observador in observadores_consulta:
+        try:
+            observador(sql, params, duracao)
+        except Exception as e:
+            print("Erro no observador de consultas:", e)
+
+
+class CursorMedido:
+    # Um aviso por comando: sem linhas (INSERT/UPDATE...) logo após o execute;
+    # SELECT só quando o resultado acaba de ser lido (fetchall, fetch* vazio,
+    # próximo execute ou close), somando o tempo de leitura.
+
+    def __init__(self, cursor, emprestimo=None):
+        self._cursor = cursor
+        self._emprestimo = emprestimo   # ConexaoPool de onde o cursor saiu
+        self._pendente = None   # [sql, params, duracao] de um SELECT ainda sendo lido
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _concluir(self):
+        if self._pendente is not None:
+            pendente, self._pendente = self._pendente, None
+            notificar_consulta(*pendente)
+
+    def _executar(self, metodo, sql, params, *args, **kwargs):
+        if self._emprestimo is not None:
+            self._emprestimo.conferir()   # cursor de uma conexão já devolvida ao pool
+        self._concluir()
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, params, *args, **kwargs)
+        finally:
+            self._pendente = [sql, params, time.perf_counter() - inicio]
+            if not getattr(self._cursor, 'with_rows', False):
+                self._concluir()
+
+    def execute(self, sql, params=(), *args, **kwargs):
+        return self._executar(self._cursor.execute, sql, params, *args, **kwargs)
+
+    def executemany(self, sql, params, *args, **kwargs):
+        return self._executar(self._cursor.executemany, sql, params, *args, **kwargs)
+
+    def _ler(self, metodo, *args, fim=False):
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args)
+        finally:
+            if self._pendente is not None:
+                self._pendente[2] += time.perf_counter() - inicio
+        if fim or not resultado:
+            self._concluir()
+        return resultado
+
+    def fetchone(self):
+        return self._ler(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._ler(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._ler(self._cursor.fetchall, fim=True)
+
+    def close(self):
+        self._concluir()
+        return self._cursor.close()
+
+
+class ConexaoFisica:
+    # Conexão real guardada no pool entre um empréstimo e outro
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.criada_em = time.monotonic()
+
+
+class ConexaoPool:
+    # Empréstimo de uma conexão do pool: cada checkout recebe um objeto novo.
+    # close() devolve a conexão real ao pool em vez de fechar o socket e
+    # encerra ESTE empréstimo: uma referência guardada depois disso (ou um
+    # cursor criado por ela) levanta erro em vez de mexer na conexão que já
+    # está com outra requisição.
+    # Todo o resto (commit, rollback, lastrowid...) é repassado; cursor() vem medido.
+
+    def __init__(self, pool, fisica):
+        self._pool = pool
+        self._fisica = fisica
+
+    def conferir(self):
+        if self._fisica is None:
+            raise Error(msg=f"Conexão do pool '{self._pool.nome}' já foi devolvida (close) e não pode mais ser usada")
+
+    @property
+    def _conexao(self):
+        self.conferir()
+        return self._fisica.conexao
+
+    def __getattr__(self, nome):
+        return getattr(self._conexao, nome)
+
+    def cursor(self, *args, **kwargs):
+        return CursorMedido(self._conexao.cursor(*args, **kwargs), self)
+
+    def close(self):
+        fisica, self._fisica = self._fisica, None
+        if fisica is not None:
+            self._pool.devolver(self, fisica)
+
+
+class PoolConexoes:
+
+    def __init__(self, nome, parametros, tamanho=5, max_overflow=10, timeout=10.0,
+                 recycle=1800.0, pre_ping=True):
+        self.nome = nome
+        self.parametros = parametros
+        self.tamanho = tamanho
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._livres = []          # pilha (LIFO): reaproveita a conexão mais "quente"
+        self._abertas = 0          # conexões físicas existentes (livres + em uso)
+        self._cond = threading.Condition()
+        self.metricas = {
+            'checkouts': 0,
+            'esperas': 0,
+            'tempo_espera': 0.0,
+            'timeouts': 0,
+            'vazamentos': 0,
+            'criadas': 0,
+            'descartadas': 0,
+            'recicladas': 0,
+        }
+
+    # ------------------------
+    # Criar / descartar conexões físicas
+    # ------------------------
+    def _nova_conexao(self):
+        conexao = mysql.connector.connect(**self.parametros)
+        if conexao.is_connected():
+            print(f"Conectado ao MySQL! (pool {self.nome})")
+        with self._cond:
+            self.metricas['criadas'] += 1
+        return ConexaoFisica(conexao)
+
+    def _descartar(self, fisica):
+        try:
+            fisica.conexao.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._abertas -= 1
+            self.metricas['descartadas'] += 1
+            self._cond.notify()
+
+    def _saudavel(self, fisica):
+        if time.monotonic() - fisica.criada_em > self.recycle:
+            with self._cond:
+                self.metricas['recicladas'] += 1
+            return False
+        if self.pre_ping:
+            try:
+                fisica.conexao.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    # ------------------------
+    # Checkout
+    # ------------------------
+    def obter(self):
+        inicio = time.monotonic()
+        esperou = False
+
+        while True:
+            with self._cond:
+                while not self._livres and self._abertas >= self.tamanho + self.max_overflow:
+                    esperou = True
+                    restante = self.timeout - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self.metricas['timeouts'] += 1
+                        self.metricas['esperas'] += 1
+                        self.metricas['tempo_espera'] += time.monotonic() - inicio
+                        raise Error(msg=f"Timeout esperando conexão livre no pool '{self.nome}'")
+                    self._cond.wait(restante)
+
+                if self._livres:
+                    fisica = self._livres.pop()
+                else:
+                    fisica = None
+                    self._abertas += 1   # reserva a vaga antes de conectar (fora do lock)
+
+            if fisica is None:
+                try:
+                    fisica = self._nova_conexao()
+                except Exception:
+                    with self._cond:
+                        self._abertas -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._saudavel(fisica):
+                self._descartar(fisica)
+                continue
+
+            with self._cond:
+                self.metricas['checkouts'] += 1
+                if esperou:
+                    self.metricas['esperas'] += 1
+                    self.metricas['tempo_espera'] += time.monotonic() - inicio
+            conn = ConexaoPool(self, fisica)   # empréstimo novo a cada checkout
+            _registrar_checkout(conn)
+            return conn
+
+    # ------------------------
+    # Devolução
+    # ------------------------
+    def devolver(self, conn, fisica):
+        # Chamado pelo close() do empréstimo, que já foi encerrado
+        _registrar_devolucao(conn)
+
+        # Descarta transação pendente/resultados não lidos antes de reaproveitar
+        try:
+            if fisica.conexao.unread_result:
+                fisica.conexao.consume_results()
+            fisica.conexao.rollback()
+        except Exception:
+            self._descartar(fisica)
+            return
+
+        with self._cond:
+            if len(self._livres) >= self.tamanho:
+                excedente = True
+            else:
+                self._livres.append(fisica)
+                excedente = False
+                self._cond.notify()
+        if excedente:
+            self._descartar(fisica)
+
+    def estatisticas(self):
+        with self._cond:
+            dados = dict(self.metricas)
+            dados['abertas'] = self._abertas
+            dados['livres'] = len(self._livres)
+            dados['em_uso'] = self._abertas - len(self._livres)
+            dados['tamanho'] = self.tamanho
+            dados['max_overflow'] = self.max_overflow
+        return dados
+
+
+#======================================================================
+#   Conexões em uso por requisição (devolução automática no teardown)
+#======================================================================
+_local = threading.local()
+
+
+def _registrar_checkout(conn):
+    em_uso = getattr(_local, 'conexoes', None)
+    if em_uso is None:
+        em_uso = _local.conexoes = []
+    em_uso.append(conn)
+
+
+def _registrar_devolucao(conn):
+    em_uso = getattr(_local, 'conexoes', None)
+    if em_uso and conn in em_uso:
+        em_uso.remove(conn)
+
+
+def liberar_conexoes_requisicao():
+    # Chamado no teardown da requisição: devolve ao pool as conexões que o
+    # handler esqueceu de fechar e contabiliza como vazamento.
+    em_uso = getattr(_local, 'conexoes', None)
+    if not em_uso:
+        return 0
+    vazadas = list(em_uso)
+    for conn in vazadas:
+        with conn._pool._cond:
+            conn._pool.metricas['vazamentos'] += 1
+        conn.close()
+    _local.conexoes = []
+    return len(vazadas)
+
+
+#======================================================================
+#   Pools por destino (recriados se o processo fizer fork)
+#======================================================================
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def _obter_pool(nome, parametros):
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Conexões herdadas do processo pai (gunicorn --preload) não são reaproveitadas
+            _pools = {}
+            _pools_pid = os.getpid()
+        pool = _pools.get(nome)
+        if pool is None:
+            pool = _pools[nome] = PoolConexoes(nome, parametros, **config_pool())
+        return pool
+
+
+def pool_stats():
+    # Contadores de todos os pools deste processo
+    with _pools_lock:
+        pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    return {nome: pool.estatisticas() for nome, pool in pools.items()}
+
+
+def _conectar(nome, parametros):
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('DB_HOST_LOCAL'),
-            user=os.getenv('DB_USER_LOCAL'),
-            password=os.getenv('DB_PASSWORD_LOCAL'),
-            database=os.getenv('DB_NAME_LOCAL'),
-            port=int(os.getenv('DB_PORT_LOCAL', 3306))
-        )
-        if connection.is_connected():
-            print("Conectado ao MySQL!")
-        return connection
+        return _obter_pool(nome, parametros).obter()
     except Error as e:
         print("Erro detalhado:", e)
         return None
-    
+
+
+def get_connection2(): # Conexão com o banco de dados MySQL localmente. Obs mudar para connection
+    return _conectar('local', {
+        'host': os.getenv('DB_HOST_LOCAL'),
+        'user': os.getenv('DB_USER_LOCAL'),
+        'password': os.getenv('DB_PASSWORD_LOCAL'),
+        'database': os.getenv('DB_NAME_LOCAL'),
+        'port': int(os.getenv('DB_PORT_LOCAL', 3306)),
+    })
+
+
+def parametros_railway():
+    # Também usados pelo pool assíncrono do app_async
+    return {
+        'host': os.getenv('DB_HOST'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'database': os.getenv('DB_NAME'),
+        'port': int(os.getenv('DB_PORT', 3306)),
+    }
 
 
 def get_connection(): # Conexão com o banco de dados MySQL no Railway
+    return _conectar('railway', parametros_railway())
+
+
+#======================================================================
+#   Réplicas de leitura (leituras que aceitam alguns segundos de atraso)
+#======================================================================
+# get_connection_leitura() entrega uma conexão de uma réplica (em rodízio) e
+# cai para o primário (get_connection) quando:
+#   - não há réplicas configuradas;
+#   - a chave pedida (ex.: 'usuario:12') teve escrita há menos de
+#     DB_LEITURA_JANELA segundos: quem acabou de escrever lê o que escreveu
+#     (as rotas de escrita chamam marcar_escrita depois do commit);
+#   - todas as réplicas estão fora do ar ou atrasadas mais que DB_REPLICA_MAX_ATRASO.
+# As telas do administrador (relatórios, exportação, analytics) não usam chave:
+# leem sempre da réplica e o atraso fica limitado por DB_REPLICA_MAX_ATRASO
+# (uma marca global faria toda troca de status mandar essas leituras pesadas
+# ao primário).
+# O atraso de cada réplica (SHOW REPLICA STATUS, requer o privilégio
+# REPLICATION CLIENT) é consultado no máximo a cada DB_REPLICA_VERIFICAR
+# segundos por worker; réplica fora do ar ou atrasada fica de fora até a
+# próxima verificação. As marcas de escrita ficam num store do mesmo backend
+# do controle de tentativas (SQLite da máquina ou Redis), então valem para
+# todos os workers.
+#
+# Configuração via .env:
+#   DB_REPLICAS            host[:porta] separados por vírgula (vazio = tudo no primário)
+#   DB_REPLICA_USER        usuário nas réplicas (padrão DB_USER); senha em DB_REPLICA_PASSWORD (padrão DB_PASSWORD)
+#   DB_REPLICA_MAX_ATRASO  segundos de atraso aceitos (padrão 5)
+#   DB_REPLICA_VERIFICAR   segundos entre verificações do atraso (padrão 2)
+#   DB_LEITURA_JANELA      segundos em que as leituras de quem escreveu vão ao primário (padrão 10)
+
+MAX_ATRASO = float(os.getenv('DB_REPLICA_MAX_ATRASO', 5))
+VERIFICAR_A_CADA = float(os.getenv('DB_REPLICA_VERIFICAR', 2))
+JANELA_LEITURA = float(os.getenv('DB_LEITURA_JANELA', 10))
+
+
+def _ler_replicas():
+    replicas = []
+    for item in os.getenv('DB_REPLICAS', '').split(','):
+        host, _, porta = item.strip().partition(':')
+        if not host:
+            continue
+        porta = int(porta or 3306)
+        replicas.append({
+            'nome': f'replica:{host}:{porta}',
+            'parametros': {
+                'host': host,
+                'user': os.getenv('DB_REPLICA_USER', os.getenv('DB_USER')),
+                'password': os.getenv('DB_REPLICA_PASSWORD', os.getenv('DB_PASSWORD')),
+                'database': os.getenv('DB_NAME'),
+                'port': porta,
+                'connection_timeout': 3,   # réplica fora do ar não pode segurar a requisição por muito tempo
+            },
+        })
+    return replicas
+
+
+REPLICAS = _ler_replicas()
+_estado_replicas = {}   # nome -> {'ok', 'verificada_em', 'atraso'}
+_estado_lock = threading.Lock()
+_rodizio = itertools.count()
+_marcas = None          # store das marcas de escrita, criado no primeiro uso
+
+
+def _store_marcas():
+    global _marcas
+    with _estado_lock:
+        if _marcas is None:
+            _marcas = criar_store(janela=JANELA_LEITURA, nome='escritas')
+        return _marcas
+
+
+def marcar_escrita(*chaves):
+    # Chamar depois do commit: as próximas leituras dessas chaves vão ao primário
+    if not REPLICAS:
+        return
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME'),
-            port=int(os.getenv('DB_PORT', 3306))
-        )
-        if connection.is_connected():
-            print("Conectado ao MySQL!")
-        return connection
+        store = _store_marcas()
+        for chave in chaves:
+            store.registrar('escrita', chave)
+    except Exception as e:
+        print("Erro ao marcar escrita para as réplicas:", e)
+
+
+def escrita_recente(chave):
+    try:
+        return _store_marcas().contar('escrita', chave) > 0
+    except Exception as e:
+        print("Erro ao consultar marcas de escrita:", e)
+        return True   # na dúvida, lê do primário
+
+
+def _atraso(conn):
+    # Cursor cru (fora das métricas e do orçamento de consultas da rota)
+    cursor = conn._conexao.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+            coluna = 'Seconds_Behind_Source'
+        except Error:
+            cursor.execute("SHOW SLAVE STATUS")   # MySQL anterior ao 8.0.22
+            coluna = 'Seconds_Behind_Master'
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+    # Sem linhas = o servidor não é réplica; NULL = replicação parada
+    return linhas[0].get(coluna) if linhas else None
+
+
+def _atualizar_estado(replica, ok, motivo):
+    with _estado_lock:
+        estado = _estado_replicas[replica['nome']]
+        mudou = estado['ok'] != ok
+        estado['ok'] = ok
+    if mudou:
+        if ok:
+            print(f"✅ {replica['nome']} de volta ao rodízio de leituras ({motivo})")
+        else:
+            print(f"⚠️ {replica['nome']} fora do rodízio de leituras ({motivo})")
+
+
+def _conexao_replica(replica):
+    agora = time.monotonic()
+    with _estado_lock:
+        estado = _estado_replicas.setdefault(replica['nome'], {'ok': True, 'verificada_em': 0.0, 'atraso': None})
+        verificar = agora - estado['verificada_em'] >= VERIFICAR_A_CADA
+        if verificar:
+            estado['verificada_em'] = agora   # só uma thread verifica por vez
+        elif not estado['ok']:
+            return None
+
+    conn = _conectar(replica['nome'], replica['parametros'])
+    if conn is None:
+        _atualizar_estado(replica, False, 'sem conexão')
+        return None
+    if not verificar:
+        return conn
+
+    try:
+        atraso = _atraso(conn)
     except Error as e:
-        print("Erro detalhado:", e)
+        conn.close()
+        _atualizar_estado(replica, False, f'erro ao ler o atraso: {e}')
+        return None
+    with _estado_lock:
+        estado['atraso'] = atraso
+    if atraso is None or atraso > MAX_ATRASO:
+        conn.close()
+        _atualizar_estado(replica, False, 'replicação parada' if atraso is None else f'atraso de {atraso}s')
         return None
+    _atualizar_estado(replica, True, f'atraso de {atraso}s')
+    return conn
+
+
+def get_connection_leitura(chave=None, primario=False):
+    # Conexão para rotas só de leitura. chave: quem está lendo ('usuario:12'...);
+    # primario=True força o primário (ex.: cache invalidado há pouco)
+    if not REPLICAS or primario or (chave is not None and escrita_recente(chave)):
+        return get_connection()
+    inicio = next(_rodizio)
+    for i in range(len(REPLICAS)):
+        conn = _conexao_replica(REPLICAS[(inicio + i) % len(REPLICAS)])
+        if conn is not None:
+            return conn
+    return get_connection()
+
 
+def estado_replicas():
+    agora = time.monotonic()
+    with _estado_lock:
+        return {nome: {'ok': estado['ok'], 'atraso': estado['atraso'],
+                       'verificada_ha': round(agora - estado['verificada_em'], 1)}
+                for nome, estado in _estado_replicas.items()}
@@ -0,0 +1,375 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import argparse
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+try:
+    from PIL import Image, UnidentifiedImageError   # opcional: sem Pillow as miniaturas caem na imagem original
+except ImportError:
+    Image = None
+
+
+#======================================================================
+#   Imagens dos produtos (armazenamento endereçado pelo conteúdo)
+#======================================================================
+# Cada imagem é gravada uma vez em disco com o nome = sha256 do conteúdo,
+# em subpastas pelos primeiros caracteres do hash:
+#   <IMAGENS_DIR>/ab/cd/abcd...ef.jpg
+# A mesma imagem enviada duas vezes vira o mesmo arquivo, e a linha de
+# produtos guarda só a URL (/imagens/<hash>), nunca os bytes. Como o
+# conteúdo de um hash nunca muda, a rota de imagem responde com cache
+# "immutable" de um ano.
+#
+# Configuração via .env:
+#   IMAGENS_DIR        pasta do armazenamento (padrão: API/imagens)
+#   IMAGENS_MAX_BYTES  tamanho máximo de uma imagem (padrão 5 MB)
+#   IMAGENS_URL_BASE   início da URL gravada no produto (padrão: endereço da requisição)
+#   IMAGENS_DERIVADOS_DIR        pasta das miniaturas (padrão: <IMAGENS_DIR>/derivados)
+#   IMAGENS_DERIVADOS_MAX_BYTES  espaço máximo das miniaturas (padrão 200 MB, as menos usadas saem)
+#   IMAGENS_WORKERS              processos que redimensionam (padrão 2)
+#   IMAGENS_TIMEOUT              segundos esperando uma miniatura ficar pronta (padrão 20)
+#
+# Imagens em base64 já gravadas nos produtos:
+#   python imagens.py --migrar --url-base http://192.168.0.10:8080
+
+IMAGENS_DIR = os.getenv('IMAGENS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imagens'))
+MAX_BYTES = int(os.getenv('IMAGENS_MAX_BYTES', 5 * 1024 * 1024))
+
+# Só formatos de imagem conhecidos (nada de servir HTML/SVG enviado por alguém)
+TIPOS = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+_HASH = re.compile(r'^[0-9a-f]{64}$')
+_DATA_URI = re.compile(r'^data:image/[\w.+-]+;base64,', re.IGNORECASE)
+
+
+class ImagemInvalida(ValueError):
+    pass
+
+
+def detectar_tipo(dados):
+    # Pela assinatura dos primeiros bytes, não pelo nome/Content-Type enviado
+    if dados[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if dados[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if dados[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if dados[:4] == b'RIFF' and dados[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _pasta(hash_imagem):
+    return os.path.join(IMAGENS_DIR, hash_imagem[:2], hash_imagem[2:4])
+
+
+def salvar(dados):
+    # Devolve o hash; se a imagem já existe não grava de novo
+    if not dados:
+        raise ImagemInvalida('Imagem vazia')
+    if len(dados) > MAX_BYTES:
+        raise ImagemInvalida(f'Imagem maior que {MAX_BYTES // (1024 * 1024)} MB')
+    extensao = detectar_tipo(dados)
+    if extensao is None:
+        raise ImagemInvalida('Formato não suportado (use JPEG, PNG, GIF ou WebP)')
+
+    hash_imagem = hashlib.sha256(dados).hexdigest()
+    pasta = _pasta(hash_imagem)
+    destino = os.path.join(pasta, f'{hash_imagem}.{extensao}')
+    if os.path.exists(destino):
+        return hash_imagem
+
+    # Grava num temporário da mesma pasta e renomeia: quem ler nunca vê arquivo pela metade
+    os.makedirs(pasta, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=pasta, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return hash_imagem
+
+
+def localizar(hash_imagem):
+    # Devolve (caminho, mimetype) ou None
+    if not _HASH.match(hash_imagem or ''):
+        return None
+    pasta = _pasta(hash_imagem)
+    for extensao, mimetype in TIPOS.items():
+        caminho = os.path.join(pasta, f'{hash_imagem}.{extensao}')
+        if os.path.exists(caminho):
+            return caminho, mimetype
+    return None
+
+
+def dados_inline(valor):
+    # Bytes da imagem se "valor" for data URI / base64; None se for uma URL comum
+    if not isinstance(valor, str):
+        return None
+    texto = valor.strip()
+    if _DATA_URI.match(texto):
+        texto = texto.split(',', 1)[1]
+    elif '://' in texto or texto.startswith('/') or len(texto) < 64:
+        return None
+    try:
+        dados = base64.b64decode(texto, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    return dados if detectar_tipo(dados) else None
+
+
+def url(hash_imagem, base=''):
+    return f"{base.rstrip('/')}/imagens/{hash_imagem}"
+
+
+def guardar_se_inline(valor, base):
+    # Usado por add_product/update_produto: troca a imagem embutida pela URL
+    dados = dados_inline(valor)
+    if dados is None:
+        return valor
+    return url(salvar(dados), base)
+
+
+# ------------------------
+# Derivados (miniaturas por largura)
+# ------------------------
+# /imagens/<hash>/w/<largura> gera na primeira vez uma versão com no máximo
+# essa largura (WebP se o cliente aceitar, senão JPEG) num pool de processos
+# e grava em disco; as próximas vêm direto do arquivo. A largura é arredondada
+# para cima numa lista fixa, então o número de variantes por imagem é limitado.
+DERIVADOS_DIR = os.getenv('IMAGENS_DERIVADOS_DIR', os.path.join(IMAGENS_DIR, 'derivados'))
+DERIVADOS_MAX_BYTES = int(os.getenv('IMAGENS_DERIVADOS_MAX_BYTES', 200 * 1024 * 1024))
+LARGURAS = (64, 128, 256, 384, 512, 768, 1024, 1536)
+QUALIDADE = {'webp': 80, 'jpg': 82}
+MIMETYPES_DERIVADOS = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+_pool = {'executor': None, 'pid': None}
+_em_andamento = {}        # caminho do derivado -> (Future, pool) (evita gerar o mesmo arquivo duas vezes)
+_lock_derivados = threading.Lock()
+_uso = {'bytes': None}    # estimativa do espaço ocupado pelos derivados neste worker
+_sem_derivado = OrderedDict()   # hashes que o Pillow não consegue decodificar (servidos como a original)
+MAX_SEM_DERIVADO = 10000
+# Só estes erros dizem que o arquivo em si não serve; os demais (disco, arquivo
+# truncado no meio da escrita...) caem na original sem marcar o hash
+ERROS_DECODIFICACAO = (UnidentifiedImageError, Image.DecompressionBombError) if Image else ()
+
+
+def largura_padronizada(largura):
+    for permitida in LARGURAS:
+        if largura <= permitida:
+            return permitida
+    return LARGURAS[-1]
+
+
+def _executor():
+    # Um pool por worker do gunicorn (processos não sobrevivem ao fork)
+    if _pool['pid'] != os.getpid():
+        _pool['executor'] = ProcessPoolExecutor(max_workers=int(os.getenv('IMAGENS_WORKERS', 2)))
+        _pool['pid'] = os.getpid()
+    return _pool['executor']
+
+
+def _descartar_pool(executor):
+    # Um processo do pool morreu (OOM, segfault do Pillow): o próximo uso cria outro
+    with _lock_derivados:
+        if _pool['executor'] is not executor:
+            return   # outra requisição já trocou o pool
+        _pool['pid'] = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _redimensionar(origem, destino, largura, formato, qualidade):
+    # Roda no processo do pool
+    with Image.open(origem) as imagem:
+        imagem.thumbnail((largura, largura * 10), Image.LANCZOS)
+        if formato == 'jpg' and imagem.mode != 'RGB':
+            fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+            fundo.paste(imagem.convert('RGBA'), mask=imagem.convert('RGBA').split()[-1])
+            imagem = fundo
+        elif formato == 'webp' and imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA')
+        pasta = os.path.dirname(destino)
+        os.makedirs(pasta, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=pasta, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                imagem.save(f, 'JPEG' if formato == 'jpg' else 'WEBP', quality=qualidade, optimize=True)
+            os.replace(temporario, destino)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+    return os.path.getsize(destino)
+
+
+def _podar():
+    # Remove os derivados usados há mais tempo (mtime é atualizado a cada acesso)
+    arquivos, total = [], 0
+    for raiz, _, nomes in os.walk(DERIVADOS_DIR):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            arquivos.append((st.st_mtime, st.st_size, caminho))
+            total += st.st_size
+    if total > DERIVADOS_MAX_BYTES:
+        arquivos.sort()
+        alvo = DERIVADOS_MAX_BYTES * 0.9
+        for _, tamanho, caminho in arquivos:
+            if total <= alvo:
+                break
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except FileNotFoundError:
+                pass
+    _uso['bytes'] = total
+
+
+def derivado(hash_imagem, largura, aceita_webp, timeout=None):
+    # Devolve (caminho, mimetype) da miniatura, ou None se a imagem não existe.
+    # Sem Pillow (ou para GIF, que perderia a animação) devolve a original;
+    # também quando o Pillow não consegue abrir o arquivo (corrompido, truncado,
+    # grande demais para descomprimir).
+    original = localizar(hash_imagem)
+    if original is None:
+        return None
+    if Image is None or original[1] == 'image/gif' or hash_imagem in _sem_derivado:
+        return original
+
+    formato = 'webp' if aceita_webp else 'jpg'
+    largura = largura_padronizada(largura)
+    destino = os.path.join(DERIVADOS_DIR, hash_imagem[:2], f'{hash_imagem}-w{largura}.{formato}')
+    if os.path.exists(destino):
+        try:
+            os.utime(destino)   # marca como usado para o LRU
+        except FileNotFoundError:
+            pass
+        else:
+            return destino, MIMETYPES_DERIVADOS[formato]
+
+    executor = None
+    try:
+        with _lock_derivados:
+            futuro, executor = _em_andamento.get(destino, (None, None))
+            if futuro is None:
+                executor = _executor()
+                futuro = executor.submit(
+                    _redimensionar, original[0], destino, largura, formato, QUALIDADE[formato])
+                _em_andamento[destino] = (futuro, executor)
+                futuro.add_done_callback(lambda _: _em_andamento.pop(destino, None))
+        tamanho = futuro.result(timeout=timeout or float(os.getenv('IMAGENS_TIMEOUT', 20)))
+    except TimeoutError:
+        raise   # ainda processando: a rota responde 503
+    except BrokenProcessPool as e:
+        print(f"⚠️ Pool de miniaturas quebrado ({e}); recriando e servindo a original de {hash_imagem}")
+        if executor is not None:
+            _descartar_pool(executor)
+        return original
+    except ERROS_DECODIFICACAO as e:
+        print(f"⚠️ Pillow não decodifica {hash_imagem} ({type(e).__name__}: {e}); servindo sempre a original")
+        with _lock_derivados:
+            _sem_derivado[hash_imagem] = True
+            while len(_sem_derivado) > MAX_SEM_DERIVADO:
+                _sem_derivado.popitem(last=False)
+        return original
+    except (OSError, ValueError, SyntaxError) as e:
+        # Arquivo truncado, erro de disco...: pode dar certo na próxima, então não marca o hash
+        print(f"⚠️ Miniatura de {hash_imagem} não gerada ({type(e).__name__}: {e}); servindo a original")
+        return original
+
+    with _lock_derivados:
+        if _uso['bytes'] is None:
+            _podar()
+        else:
+            _uso['bytes'] += tamanho
+            if _uso['bytes'] > DERIVADOS_MAX_BYTES:
+                _podar()
+    return destino, MIMETYPES_DERIVADOS[formato]
+
+
+# ------------------------
+# Migração das imagens já gravadas em produtos
+# ------------------------
+def migrar(conn, base, lote=100):
+    # Percorre os produtos pelo id (em lotes) e regrava os que têm a imagem embutida
+    cursor = conn.cursor()
+    ultimo, migrados, invalidos = 0, 0, 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT idProdutos, imagem FROM produtos
+                WHERE idProdutos > %s AND imagem NOT LIKE 'http%%' AND imagem NOT LIKE '/%%'
+                ORDER BY idProdutos
+                LIMIT %s""", (ultimo, lote))
+            linhas = cursor.fetchall()
+            if not linhas:
+                break
+            trocas = []
+            for id_produto, imagem in linhas:
+                ultimo = id_produto
+                try:
+                    novo = guardar_se_inline(imagem, base)
+                except ImagemInvalida:
+                    novo = imagem
+                if novo != imagem:
+                    trocas.append((novo, id_produto))
+                elif imagem:
+                    invalidos += 1
+            if trocas:
+                cursor.executemany("UPDATE produtos SET imagem = %s WHERE idProdutos = %s", trocas)
+                conn.commit()
+                migrados += len(trocas)
+    finally:
+        cursor.close()
+    return migrados, invalidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Armazenamento de imagens dos produtos')
+    parser.add_argument('--migrar', action='store_true',
+                        help='move as imagens em base64 da tabela produtos para o armazenamento')
+    parser.add_argument('--url-base', default=os.getenv('IMAGENS_URL_BASE', ''),
+                        help='início da URL gravada no produto, ex.: http://192.168.0.10:8080')
+    args = parser.parse_args()
+    if not args.migrar:
+        parser.print_help()
+        return
+    if not args.url_base:
+        raise SystemExit('Informe --url-base (ou IMAGENS_URL_BASE): o app precisa de uma URL completa')
+
+    from db import get_connection
+    from cache import catalogo_cache
+    conn = get_connection()
+    if conn is None:
+        raise SystemExit('Não foi possível conectar ao banco de dados')
+    try:
+        migrados, ignorados = migrar(conn, args.url_base)
+    finally:
+        conn.close()
+    if migrados:
+        catalogo_cache.invalidar()
+    print(f'✅ {migrados} imagem(ns) migrada(s); {ignorados} valor(es) não reconhecido(s) como imagem')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import csv
+import io
+import json
+import os
+
+import imagens
+
+
+#======================================================================
+#   Importação em massa de produtos (CSV ou NDJSON em streaming)
+#======================================================================
+# As linhas são lidas do corpo da requisição uma a uma, validadas e gravadas
+# em lotes (executemany = um INSERT de várias linhas por lote, um commit por
+# lote). A memória usada não depende do tamanho do arquivo: no máximo um
+# lote em memória e uma lista de erros com tamanho limitado.
+# Imagem em base64/data URI vai para o armazenamento de imagens.py, como em
+# /add_products; no produto fica só a URL.
+#
+# Configuração via .env:
+#   IMPORTACAO_LOTE      linhas por lote/transação (padrão 500)
+#   IMPORTACAO_MAX_ERROS erros detalhados no relatório (padrão 1000)
+
+TAMANHO_LOTE = int(os.getenv('IMPORTACAO_LOTE', 500))
+MAX_ERROS = int(os.getenv('IMPORTACAO_MAX_ERROS', 1000))
+MAX_IDS_ATUALIZADOS = 1000   # acima disso não guarda os ids (o índice de busca é reconstruído)
+
+COLUNAS = ('nome', 'descricao', 'valor', 'imagem', 'quantidade_estoque', 'categoria',
+           'vitrine_idVitrine', 'administrador_idAdministrador', 'data_cadastro')
+
+SQL_INSERIR = f"""
+    INSERT INTO produtos ({', '.join(COLUNAS)})
+    VALUES ({', '.join(['%s'] * len(COLUNAS))})
+"""
+
+# Atualização pela chave primária: vira um único INSERT de várias linhas no executemany
+SQL_ATUALIZAR = f"""
+    INSERT INTO produtos (idProdutos, {', '.join(COLUNAS)})
+    VALUES ({', '.join(['%s'] * (len(COLUNAS) + 1))})
+    ON DUPLICATE KEY UPDATE
+        nome = VALUES(nome), descricao = VALUES(descricao), valor = VALUES(valor),
+        imagem = VALUES(imagem), quantidade_estoque = VALUES(quantidade_estoque),
+        categoria = VALUES(categoria)
+"""
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+# ------------------------
+# Leitura em streaming
+# ------------------------
+def ler_linhas(stream, formato):
+    # Gera (numero_da_linha, dict | LinhaInvalida)
+    texto = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        # Campo do CSV pode trazer uma imagem em base64 (até IMAGENS_MAX_BYTES)
+        csv.field_size_limit(max(csv.field_size_limit(), imagens.MAX_BYTES * 4 // 3 + 1024))
+        leitor = csv.DictReader(texto)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    else:
+        for numero, linha in enumerate(texto, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+                if not isinstance(registro, dict):
+                    raise ValueError('a linha não é um objeto JSON')
+                yield numero, registro
+            except ValueError as e:
+                yield numero, LinhaInvalida(f'JSON inválido: {e}')
+
+
+def validar(registro, administrador_id, agora, base_imagens=''):
+    def texto(campo, obrigatorio=True, tamanho=None):
+        valor = registro.get(campo)
+        valor = str(valor).strip() if valor is not None else ''
+        if obrigatorio and not valor:
+            raise LinhaInvalida(f"Campo '{campo}' é obrigatório")
+        if tamanho and len(valor) > tamanho:
+            raise LinhaInvalida(f"Campo '{campo}' maior que {tamanho} caracteres")
+        return valor
+
+    nome = texto('nome', tamanho=100)
+    descricao = texto('descricao')
+    imagem = texto('imagem')
+    try:
+        imagem = imagens.guardar_se_inline(imagem, base_imagens)
+    except imagens.ImagemInvalida as e:
+        raise LinhaInvalida(f"Campo 'imagem': {e}")
+    categoria = texto('categoria', obrigatorio=False, tamanho=45) or 'geral'
+    try:
+        valor = Decimal(str(registro.get('valor')).replace(',', '.'))
+        if valor < 0 or not valor.is_finite():
+            raise InvalidOperation
+    except (InvalidOperation, ValueError):
+        raise LinhaInvalida("Campo 'valor' deve ser um número maior ou igual a zero")
+    try:
+        quantidade = int(registro.get('quantidade_estoque'))
+        if quantidade < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise LinhaInvalida("Campo 'quantidade_estoque' deve ser um inteiro maior ou igual a zero")
+    try:
+        vitrine_id = int(registro.get('vitrine_id') or 1)
+    except (TypeError, ValueError):
+        raise LinhaInvalida("Campo 'vitrine_id' deve ser inteiro")
+
+    return (nome, descricao, valor, imagem, quantidade, categoria, vitrine_id, administrador_id, agora)
+
+
+# ------------------------
+# Gravação em lotes
+# ------------------------
+class Relatorio:
+
+    def __init__(self):
+        self.linhas = 0
+        self.inseridos = 0
+        self.atualizados = 0
+        self.total_erros = 0
+        self.erros = []
+        self.ids_atualizados = []   # None quando passou de MAX_IDS_ATUALIZADOS
+
+    def erro(self, numero, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS:
+            self.erros.append({'linha': numero, 'erro': mensagem})
+
+    def como_dict(self):
+        return {
+            'linhas': self.linhas,
+            'inseridos': self.inseridos,
+            'atualizados': self.atualizados,
+            'total_erros': self.total_erros,
+            'erros': self.erros,
+            'erros_omitidos': self.total_erros - len(self.erros),
+        }
+
+
+def _gravar_lote(conn, lote, upsert, relatorio):
+    # lote: lista de (numero_da_linha, valores)
+    cursor = conn.cursor()
+    try:
+        novos, existentes = lote, []
+        if upsert:
+            # Mesmo nome repetido no lote: vale a última linha
+            por_nome = {}
+            for numero, valores in lote:
+                por_nome[valores[0].lower()] = (numero, valores)
+            cursor.execute(
+                f"SELECT idProdutos, nome FROM produtos WHERE nome IN ({', '.join(['%s'] * len(por_nome))})",
+                tuple(valores[0] for _, valores in por_nome.values()))
+            ids = {nome.lower(): id_produto for id_produto, nome in cursor.fetchall()}
+            novos = [item for chave, item in por_nome.items() if chave not in ids]
+            existentes = [(ids[chave],) + item[1] for chave, item in por_nome.items() if chave in ids]
+
+        if novos:
+            cursor.executemany(SQL_INSERIR, [valores for _, valores in novos])
+        if existentes:
+            cursor.executemany(SQL_ATUALIZAR, existentes)
+        conn.commit()
+        relatorio.inseridos += len(novos)
+        relatorio.atualizados += len(existentes)
+        if relatorio.ids_atualizados is not None:
+            relatorio.ids_atualizados += [valores[0] for valores in existentes]
+            if len(relatorio.ids_atualizados) > MAX_IDS_ATUALIZADOS:
+                relatorio.ids_atualizados = None
+    except Exception as e:
+        conn.rollback()
+        for numero, _ in lote:
+            relatorio.erro(numero, f'Erro ao gravar o lote: {e}')
+    finally:
+        cursor.close()
+
+
+def importar(conn, linhas, administrador_id=None, upsert=False, base_imagens=''):
+    relatorio = Relatorio()
+    agora = datetime.now()
+    lote = []
+    for numero, registro in linhas:
+        relatorio.linhas += 1
+        try:
+            if isinstance(registro, LinhaInvalida):
+                raise registro
+            lote.append((numero, validar(registro, administrador_id, agora, base_imagens)))
+        except LinhaInvalida as e:
+            relatorio.erro(numero, str(e))
+            continue
+        if len(lote) >= TAMANHO_LOTE:
+            _gravar_lote(conn, lote, upsert, relatorio)
+            lote = []
+    if lote:
+        _gravar_lote(conn, lote, upsert, relatorio)
+    return relatorio
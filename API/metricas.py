@@ -0,0 +1,307 @@
+from flask import g, request
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+import db
+
+
+#======================================================================
+#   Métricas das requisições no formato do Prometheus (GET /metrics)
+#======================================================================
+# Cada worker do gunicorn conta as suas requisições (latência por rota,
+# status, em andamento, consultas e tempo de banco por requisição) e grava
+# de tempos em tempos um snapshot em <METRICAS_DIR>/<pid>.json. O /metrics,
+# atendido por qualquer worker, soma os snapshots de todos. Os contadores de
+# workers que já morreram são somados num arquivo "acumulado.json" para que
+# os totais nunca diminuam; os gauges (em andamento, pool) só valem para os
+# workers vivos.
+#
+# Configuração via .env:
+#   METRICAS_DIR        pasta dos snapshots (padrão: temp do sistema)
+#   METRICAS_INTERVALO  segundos entre snapshots de um worker (padrão 1)
+
+METRICAS_DIR = os.getenv('METRICAS_DIR', os.path.join(tempfile.gettempdir(), 'cafeteria_metricas'))
+INTERVALO = float(os.getenv('METRICAS_INTERVALO', 1))
+
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BUCKETS_TEMPO_DB = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+POOL_CONTADORES = ('checkouts', 'esperas', 'timeouts', 'vazamentos', 'criadas', 'descartadas', 'recicladas')
+POOL_GAUGES = ('abertas', 'livres', 'em_uso')
+
+_lock = threading.Lock()
+_local = threading.local()
+_estado = {'pid': None, 'ultimo_snapshot': 0.0}
+
+
+def _novo_registro():
+    return {
+        'duracao': {},     # "rota|metodo" -> histograma
+        'status': {},      # "rota|metodo|status" -> total
+        'consultas': {},   # "rota" -> histograma de consultas por requisição
+        'tempo_db': {},    # "rota" -> histograma do tempo de banco por requisição
+        'db_total': 0,
+        'em_andamento': 0,
+    }
+
+
+_dados = _novo_registro()
+
+
+def _observar(histogramas, chave, valor, buckets):
+    h = histogramas.get(chave)
+    if h is None:
+        h = histogramas[chave] = {'buckets': [0] * len(buckets), 'soma': 0.0, 'total': 0}
+    for i, limite in enumerate(buckets):
+        if valor <= limite:
+            h['buckets'][i] += 1
+    h['soma'] += valor
+    h['total'] += 1
+
+
+# ------------------------
+# Coleta
+# ------------------------
+def _consulta_executada(sql, params, duracao):
+    # Observador do db.CursorMedido: soma na requisição da thread atual
+    if getattr(_local, 'ativa', False):
+        _local.consultas += 1
+        _local.tempo_db += duracao
+
+
+def _rota():
+    return request.url_rule.rule if request.url_rule is not None else 'desconhecida'
+
+
+def requisicao_iniciada():
+    with _lock:
+        _dados['em_andamento'] += 1
+
+
+def requisicao_concluida(rota, metodo, status, duracao, consultas, tempo_db):
+    # Também chamada pelo app_async, que mede as próprias consultas
+    with _lock:
+        _dados['em_andamento'] -= 1
+        _observar(_dados['duracao'], f'{rota}|{metodo}', duracao, BUCKETS_DURACAO)
+        chave_status = f'{rota}|{metodo}|{status}'
+        _dados['status'][chave_status] = _dados['status'].get(chave_status, 0) + 1
+        _observar(_dados['consultas'], rota, consultas, BUCKETS_CONSULTAS)
+        _observar(_dados['tempo_db'], rota, tempo_db, BUCKETS_TEMPO_DB)
+        _dados['db_total'] += consultas
+    if time.monotonic() - _estado['ultimo_snapshot'] > INTERVALO:
+        gravar_snapshot()
+
+
+def _antes():
+    g.metricas_inicio = time.perf_counter()
+    _local.ativa, _local.consultas, _local.tempo_db = True, 0, 0.0
+    requisicao_iniciada()
+
+
+def _depois(resposta):
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is None:
+        return resposta
+    duracao = time.perf_counter() - inicio
+    consultas, tempo_db = getattr(_local, 'consultas', 0), getattr(_local, 'tempo_db', 0.0)
+    _local.ativa = False
+    requisicao_concluida(_rota(), request.method, resposta.status_code, duracao, consultas, tempo_db)
+    return resposta
+
+
+# ------------------------
+# Snapshots por worker
+# ------------------------
+def _arquivo(nome):
+    return os.path.join(METRICAS_DIR, nome)
+
+
+def _gravar_json(caminho, conteudo):
+    fd, temporario = tempfile.mkstemp(dir=METRICAS_DIR, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(conteudo, f)
+    os.replace(temporario, caminho)
+
+
+def _ler_json(caminho):
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _somar(destino, origem):
+    # Soma os contadores/histogramas de "origem" em "destino" (gauges ficam de fora)
+    for secao in ('duracao', 'consultas', 'tempo_db'):
+        for chave, h in origem.get(secao, {}).items():
+            d = destino[secao].setdefault(chave, {'buckets': [0] * len(h['buckets']), 'soma': 0.0, 'total': 0})
+            d['buckets'] = [a + b for a, b in zip(d['buckets'], h['buckets'])]
+            d['soma'] += h['soma']
+            d['total'] += h['total']
+    for chave, total in origem.get('status', {}).items():
+        destino['status'][chave] = destino['status'].get(chave, 0) + total
+    destino['db_total'] += origem.get('db_total', 0)
+    for nome, pool in origem.get('pool', {}).items():
+        d = destino.setdefault('pool', {}).setdefault(nome, {c: 0 for c in POOL_CONTADORES + ('tempo_espera',)})
+        for campo in POOL_CONTADORES + ('tempo_espera',):
+            d[campo] += pool.get(campo, 0)
+
+
+def _acumular_mortos(arquivos):
+    # Move os snapshots de workers mortos para acumulado.json (com trava entre processos)
+    with open(_arquivo('.trava'), 'w') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        acumulado = _ler_json(_arquivo('acumulado.json')) or dict(_novo_registro(), pool={})
+        for caminho in arquivos:
+            snapshot = _ler_json(caminho)
+            if snapshot is not None:
+                _somar(acumulado, snapshot)
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+        _gravar_json(_arquivo('acumulado.json'), acumulado)
+
+
+def gravar_snapshot():
+    pid = os.getpid()
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    if _estado['pid'] != pid:
+        # Processo novo (ou fork): um arquivo antigo com o mesmo pid é de outro processo
+        if _estado['pid'] is not None:
+            with _lock:
+                _dados.clear()
+                _dados.update(_novo_registro())
+        _estado['pid'] = pid
+        if os.path.exists(_arquivo(f'{pid}.json')):
+            _acumular_mortos([_arquivo(f'{pid}.json')])
+    with _lock:
+        snapshot = json.loads(json.dumps(_dados))
+    snapshot['pid'] = pid
+    snapshot['pool'] = db.pool_stats()
+    _gravar_json(_arquivo(f'{pid}.json'), snapshot)
+    _estado['ultimo_snapshot'] = time.monotonic()
+
+
+def agregar():
+    # Soma de todos os workers (vivos + acumulado dos mortos)
+    gravar_snapshot()
+    total = dict(_novo_registro(), pool={})
+    gauges = {'em_andamento': 0, 'workers': 0, 'pool': {}}
+    mortos = []
+    for nome in os.listdir(METRICAS_DIR):
+        if not nome.endswith('.json') or nome == 'acumulado.json':
+            continue
+        caminho = _arquivo(nome)
+        try:
+            pid = int(nome[:-5])
+        except ValueError:
+            continue
+        if not _vivo(pid):
+            mortos.append(caminho)
+            continue
+        snapshot = _ler_json(caminho)
+        if snapshot is None:
+            continue
+        _somar(total, snapshot)
+        gauges['em_andamento'] += snapshot.get('em_andamento', 0)
+        gauges['workers'] += 1
+        for pool, valores in snapshot.get('pool', {}).items():
+            g_pool = gauges['pool'].setdefault(pool, {campo: 0 for campo in POOL_GAUGES})
+            for campo in POOL_GAUGES:
+                g_pool[campo] += valores.get(campo, 0)
+    if mortos:
+        _acumular_mortos(mortos)
+    acumulado = _ler_json(_arquivo('acumulado.json'))
+    if acumulado:
+        _somar(total, acumulado)
+    return total, gauges
+
+
+# ------------------------
+# Formato texto do Prometheus
+# ------------------------
+def _rotulos(**rotulos):
+    partes = []
+    for nome, valor in rotulos.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{nome}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def _histograma(linhas, nome, ajuda, histogramas, buckets, nomes_rotulos):
+    linhas.append(f'# HELP {nome} {ajuda}')
+    linhas.append(f'# TYPE {nome} histogram')
+    for chave in sorted(histogramas):
+        h = histogramas[chave]
+        rotulos = dict(zip(nomes_rotulos, chave.split('|')))
+        for limite, quantidade in zip(buckets, h['buckets']):
+            linhas.append(f'{nome}_bucket{_rotulos(**rotulos, le=limite)} {quantidade}')
+        linhas.append(f'{nome}_bucket{_rotulos(**rotulos, le="+Inf")} {h["total"]}')
+        linhas.append(f'{nome}_sum{_rotulos(**rotulos)} {h["soma"]}')
+        linhas.append(f'{nome}_count{_rotulos(**rotulos)} {h["total"]}')
+
+
+def texto_prometheus():
+    total, gauges = agregar()
+    linhas = []
+    _histograma(linhas, 'cafeteria_http_duracao_segundos', 'Latência das requisições por rota',
+                total['duracao'], BUCKETS_DURACAO, ('rota', 'metodo'))
+
+    linhas.append('# HELP cafeteria_http_requisicoes_total Requisições por rota e status')
+    linhas.append('# TYPE cafeteria_http_requisicoes_total counter')
+    for chave in sorted(total['status']):
+        rota, metodo, status = chave.rsplit('|', 2)
+        linhas.append(f'cafeteria_http_requisicoes_total{_rotulos(rota=rota, metodo=metodo, status=status)} '
+                      f'{total["status"][chave]}')
+
+    linhas.append('# HELP cafeteria_http_em_andamento Requisições sendo atendidas agora')
+    linhas.append('# TYPE cafeteria_http_em_andamento gauge')
+    linhas.append(f'cafeteria_http_em_andamento {gauges["em_andamento"]}')
+    linhas.append('# HELP cafeteria_workers Workers com snapshot recente')
+    linhas.append('# TYPE cafeteria_workers gauge')
+    linhas.append(f'cafeteria_workers {gauges["workers"]}')
+
+    _histograma(linhas, 'cafeteria_db_consultas_por_requisicao', 'Comandos SQL por requisição',
+                total['consultas'], BUCKETS_CONSULTAS, ('rota',))
+    _histograma(linhas, 'cafeteria_db_tempo_por_requisicao_segundos', 'Tempo de banco por requisição',
+                total['tempo_db'], BUCKETS_TEMPO_DB, ('rota',))
+    linhas.append('# HELP cafeteria_db_consultas_total Comandos SQL executados')
+    linhas.append('# TYPE cafeteria_db_consultas_total counter')
+    linhas.append(f'cafeteria_db_consultas_total {total["db_total"]}')
+
+    linhas.append('# HELP cafeteria_pool_conexoes Conexões dos pools por estado')
+    linhas.append('# TYPE cafeteria_pool_conexoes gauge')
+    for pool, valores in sorted(gauges['pool'].items()):
+        for campo in POOL_GAUGES:
+            linhas.append(f'cafeteria_pool_conexoes{_rotulos(pool=pool, estado=campo)} {valores[campo]}')
+    for campo in POOL_CONTADORES:
+        linhas.append(f'# TYPE cafeteria_pool_{campo}_total counter')
+        for pool, valores in sorted(total['pool'].items()):
+            linhas.append(f'cafeteria_pool_{campo}_total{_rotulos(pool=pool)} {valores[campo]}')
+    linhas.append('# TYPE cafeteria_pool_tempo_espera_segundos_total counter')
+    for pool, valores in sorted(total['pool'].items()):
+        linhas.append(f'cafeteria_pool_tempo_espera_segundos_total{_rotulos(pool=pool)} {valores["tempo_espera"]}')
+    return '\n'.join(linhas) + '\n'
+
+
+def iniciar(app):
+    db.observadores_consulta.append(_consulta_executada)
+    app.before_request(_antes)
+    app.after_request(_depois)
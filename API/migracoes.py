@@ -0,0 +1,376 @@
+from datetime import datetime
+import argparse
+import sys
+import time
+
+import rollups
+
+
+#======================================================================
+#   Migrações versionadas do esquema
+#======================================================================
+# Cada migração tem um número de versão e só roda uma vez por banco
+# (tabela schema_migracoes). Além disso, cada passo confere o
+# information_schema antes de mudar algo (índice já existe? tabela existe?),
+# então rodar de novo num banco já ajustado à mão não quebra nada.
+#
+# Uso:
+#   python migracoes.py                aplica as migrações pendentes
+#   python migracoes.py --status       lista aplicadas / pendentes
+#   python migracoes.py --verificar    EXPLAIN das consultas quentes; sai com
+#                                      código 1 se alguma varre a tabela inteira
+#   --local                            usa get_connection2 (banco local)
+#
+# Migração nova: escreva a função e acrescente no fim de MIGRACOES com o
+# próximo número. Nunca mude o número de uma migração já publicada.
+
+
+# ------------------------
+# Consultas ao information_schema
+# ------------------------
+def tabela_existe(cursor, tabela):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s""", (tabela,))
+    return cursor.fetchone()[0] > 0
+
+
+def coluna_existe(cursor, tabela, coluna):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""", (tabela, coluna))
+    return cursor.fetchone()[0] > 0
+
+
+def indices(cursor, tabela):
+    # {nome: (unico, [colunas na ordem])}
+    cursor.execute("""
+        SELECT index_name, non_unique, column_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY index_name, seq_in_index""", (tabela,))
+    resultado = {}
+    for nome, nao_unico, coluna in cursor.fetchall():
+        resultado.setdefault(nome, (not nao_unico, []))[1].append(coluna.lower())
+    return resultado
+
+
+def indice_equivalente(cursor, tabela, colunas, unico=False):
+    # Algum índice que já comece por essas colunas (com outro nome, criado à mão...)
+    colunas = [c.lower() for c in colunas]
+    for nome, (eh_unico, existentes) in indices(cursor, tabela).items():
+        if existentes[:len(colunas)] == colunas and (eh_unico or not unico):
+            if not unico or len(existentes) == len(colunas):
+                return nome
+    return None
+
+
+def tem_duplicados(cursor, tabela, colunas):
+    lista = ', '.join(colunas)
+    cursor.execute(f"""
+        SELECT 1 FROM {tabela}
+        WHERE {' AND '.join(f'{c} IS NOT NULL' for c in colunas)}
+        GROUP BY {lista} HAVING COUNT(*) > 1 LIMIT 1""")
+    return cursor.fetchone() is not None
+
+
+def criar_indice(cursor, tabela, nome, colunas, unico=False):
+    if not tabela_existe(cursor, tabela):
+        print(f"   ⚠️ {tabela} não existe; índice {nome} ignorado")
+        return
+    existente = indice_equivalente(cursor, tabela, colunas, unico)
+    if existente:
+        print(f"   = {tabela}.{existente} já cobre ({', '.join(colunas)})")
+        return
+    if unico and tem_duplicados(cursor, tabela, colunas):
+        # Não dá para garantir unicidade sem limpar os dados; o índice comum já resolve a busca
+        print(f"   ⚠️ {tabela} tem valores repetidos em ({', '.join(colunas)}); criando índice não único")
+        unico = False
+        if indice_equivalente(cursor, tabela, colunas):
+            return
+    inicio = time.perf_counter()
+    cursor.execute(f"ALTER TABLE {tabela} ADD {'UNIQUE ' if unico else ''}INDEX {nome} ({', '.join(colunas)})")
+    print(f"   + {tabela}.{nome} ({', '.join(colunas)}) em {time.perf_counter() - inicio:.1f}s")
+
+
+# ------------------------
+# Migrações
+# ------------------------
+def m001_indices_consultas(conn, cursor):
+    # Colunas filtradas pelas rotas mais usadas de app.py
+    criar_indice(cursor, 'usuario', 'uq_usuario_email', ['email'], unico=True)          # login, reset_password
+    criar_indice(cursor, 'usuario', 'uq_usuario_cpf', ['cpf'], unico=True)              # buscar/excluir cliente
+    criar_indice(cursor, 'administrador', 'uq_administrador_email', ['email'], unico=True)
+    criar_indice(cursor, 'endereco', 'idx_endereco_usuario', ['Usuario_idUsuario'])
+    criar_indice(cursor, 'carrinho', 'idx_carrinho_usuario_status', ['Usuario_idUsuario', 'status'])
+    criar_indice(cursor, 'favoritos', 'idx_favoritos_usuario', ['Usuario_idUsuario'])
+    criar_indice(cursor, 'cupom', 'uq_cupom_codigo', ['codigo'], unico=True)
+    criar_indice(cursor, 'produtos', 'idx_produtos_categoria', ['categoria'])
+    criar_indice(cursor, 'produtos', 'idx_produtos_promocao', ['is_promotion'])
+    # Histórico do usuário (filtro + ordenação por data) e relatórios por período
+    criar_indice(cursor, 'relatorio_pedido', 'idx_relatorio_pedido_usuario_data', ['Usuario_idUsuario', 'data_status'])
+    criar_indice(cursor, 'relatorio_pedido', 'idx_relatorio_pedido_data', ['data_status'])
+    # Itens por pedido (listagens/exportação) e pedidos por produto
+    criar_indice(cursor, 'relatorio_pedido_produto', 'idx_rpp_pedido', ['Relatorio_Pedido_id'])
+    criar_indice(cursor, 'relatorio_pedido_produto', 'idx_rpp_produto_pedido', ['Produto_id', 'Relatorio_Pedido_id'])
+
+
+def m002_carrinho_produto_unico(conn, cursor):
+    # Mesmo conteúdo de "Banco de dados - MySql/carrinho_produto_unico.sql":
+    # junta linhas repetidas do mesmo produto no mesmo carrinho e cria a chave única
+    colunas = ['Carrinho_idCarrinho', 'Produtos_idProdutos']
+    if not tabela_existe(cursor, 'carrinho_produto'):
+        print("   ⚠️ carrinho_produto não existe; ignorada")
+        return
+    if indice_equivalente(cursor, 'carrinho_produto', colunas, unico=True):
+        print("   = carrinho_produto já tem a chave única")
+        return
+    cursor.execute("""
+        UPDATE carrinho_produto cp
+        JOIN (
+            SELECT MIN(idCarrinho_Produtos) AS id, SUM(quantidade) AS quantidade
+            FROM carrinho_produto
+            GROUP BY Carrinho_idCarrinho, Produtos_idProdutos
+            HAVING COUNT(*) > 1
+        ) dup ON dup.id = cp.idCarrinho_Produtos
+        SET cp.quantidade = dup.quantidade""")
+    cursor.execute("""
+        DELETE cp FROM carrinho_produto cp
+        JOIN carrinho_produto manter
+          ON manter.Carrinho_idCarrinho = cp.Carrinho_idCarrinho
+         AND manter.Produtos_idProdutos = cp.Produtos_idProdutos
+         AND manter.idCarrinho_Produtos < cp.idCarrinho_Produtos""")
+    if cursor.rowcount:
+        print(f"   {cursor.rowcount} linha(s) repetida(s) juntada(s)")
+    conn.commit()
+    criar_indice(cursor, 'carrinho_produto', 'uq_carrinho_produto', colunas, unico=True)
+
+
+def m003_rollups(conn, cursor):
+    # Tabelas de rollups.py + backfill a partir dos pedidos existentes
+    rollups.reconstruir(conn)
+    print(f"   rollups criados e recalculados ({', '.join(rollups.TABELAS)})")
+
+
+def recalcular_reservas(conn):
+    # Reserva de cada produto = itens dos pedidos ainda não entregues/cancelados
+    # (criar_pedido reserva, entrega/cancelamento liberam; aqui recalcula do zero)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE produtos p
+            LEFT JOIN (
+                SELECT rpp.Produto_id, SUM(rpp.quantidade) AS quantidade
+                FROM relatorio_pedido_produto rpp
+                JOIN relatorio_pedido rp ON rp.idRelatorio_Pedido = rpp.Relatorio_Pedido_id
+                WHERE rp.status NOT IN ('Entregue', 'Cancelado')
+                GROUP BY rpp.Produto_id
+            ) abertos ON abertos.Produto_id = p.idProdutos
+            SET p.quantidade_reservada = COALESCE(abertos.quantidade, 0)""")
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def m004_reserva_estoque(conn, cursor):
+    # Reserva dos pedidos em aberto na própria linha do produto: o checkout
+    # não precisa mais somar o histórico de pedidos
+    if not coluna_existe(cursor, 'produtos', 'quantidade_reservada'):
+        cursor.execute("""
+            ALTER TABLE produtos
+            ADD COLUMN quantidade_reservada INT NOT NULL DEFAULT 0 AFTER quantidade_estoque""")
+        print("   + produtos.quantidade_reservada")
+    recalcular_reservas(conn)
+    print("   reservas recalculadas a partir dos pedidos em aberto")
+
+
+def m005_um_carrinho_aberto(conn, cursor):
+    # Um carrinho aberto por usuário (chave única numa coluna gerada que só tem
+    # valor nos abertos), usada pelo upsert de app.carrinho_aberto
+    if not tabela_existe(cursor, 'carrinho'):
+        print("   ⚠️ carrinho não existe; ignorada")
+        return
+    if not coluna_existe(cursor, 'carrinho', 'usuario_aberto'):
+        cursor.execute("""
+            ALTER TABLE carrinho
+            ADD COLUMN usuario_aberto INT AS (IF(status = 'aberto', Usuario_idUsuario, NULL)) VIRTUAL""")
+        print("   + carrinho.usuario_aberto")
+    if tem_duplicados(cursor, 'carrinho', ['usuario_aberto']):
+        # Junta os itens dos carrinhos abertos repetidos no mais antigo e apaga os outros
+        cursor.execute("""
+            INSERT INTO carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos, quantidade, data_criacao)
+            SELECT manter.id, cp.Produtos_idProdutos, cp.quantidade, cp.data_criacao
+            FROM carrinho_produto cp
+            JOIN carrinho c ON c.idCarrinho = cp.Carrinho_idCarrinho
+            JOIN (SELECT usuario_aberto, MIN(idCarrinho) AS id FROM carrinho
+                  WHERE usuario_aberto IS NOT NULL GROUP BY usuario_aberto) manter
+              ON manter.usuario_aberto = c.usuario_aberto AND manter.id <> c.idCarrinho
+            ON DUPLICATE KEY UPDATE quantidade = carrinho_produto.quantidade + VALUES(quantidade)""")
+        cursor.execute("""
+            DELETE c, cp FROM carrinho c
+            JOIN carrinho manter
+              ON manter.usuario_aberto = c.usuario_aberto AND manter.idCarrinho < c.idCarrinho
+            LEFT JOIN carrinho_produto cp ON cp.Carrinho_idCarrinho = c.idCarrinho""")
+        print("   carrinhos abertos repetidos juntados")
+        conn.commit()
+    criar_indice(cursor, 'carrinho', 'uq_carrinho_aberto', ['usuario_aberto'], unico=True)
+
+
+def m006_rollups_fatiados(conn, cursor):
+    # Rollups com a coluna fatia na chave (rollups.FATIAS linhas por balde).
+    # São dados derivados: recria as tabelas e recalcula a partir dos pedidos
+    if coluna_existe(cursor, 'rollup_pedidos_hora', 'fatia') and coluna_existe(cursor, 'rollup_produtos_dia', 'fatia'):
+        print("   = rollups já têm a coluna fatia")
+        return
+    for tabela in rollups.TABELAS:
+        cursor.execute(f"DROP TABLE IF EXISTS {tabela}")
+    rollups.reconstruir(conn)
+    print(f"   rollups recriados com {rollups.FATIAS} fatia(s) por balde")
+
+
+MIGRACOES = [
+    (1, 'Índices das consultas quentes', m001_indices_consultas),
+    (2, 'Chave única (carrinho, produto) em carrinho_produto', m002_carrinho_produto_unico),
+    (3, 'Tabelas de rollup de vendas', m003_rollups),
+    (4, 'Reserva de estoque em produtos.quantidade_reservada', m004_reserva_estoque),
+    (5, 'Um carrinho aberto por usuário (chave única)', m005_um_carrinho_aberto),
+    (6, 'Rollups divididos em fatias (menos disputa pela linha da hora)', m006_rollups_fatiados),
+]
+
+
+# ------------------------
+# Execução
+# ------------------------
+def _aplicadas(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao      INT          NOT NULL,
+            descricao   VARCHAR(255) NOT NULL,
+            aplicada_em DATETIME     NOT NULL,
+            PRIMARY KEY (versao)
+        ) ENGINE=InnoDB""")
+    cursor.execute("SELECT versao FROM schema_migracoes")
+    return {versao for (versao,) in cursor.fetchall()}
+
+
+def migrar(conn):
+    # Aplica as pendentes em ordem; devolve quantas rodaram
+    cursor = conn.cursor(buffered=True)
+    try:
+        aplicadas = _aplicadas(cursor)
+        pendentes = [m for m in MIGRACOES if m[0] not in aplicadas]
+        for versao, descricao, funcao in pendentes:
+            print(f"🛠️  Migração {versao:03d}: {descricao}")
+            inicio = time.perf_counter()
+            try:
+                funcao(conn, cursor)
+                cursor.execute("INSERT INTO schema_migracoes (versao, descricao, aplicada_em) VALUES (%s, %s, %s)",
+                               (versao, descricao, datetime.now()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"❌ Migração {versao:03d} falhou")
+                raise
+            print(f"✅ Migração {versao:03d} aplicada em {time.perf_counter() - inicio:.1f}s")
+        return len(pendentes)
+    finally:
+        cursor.close()
+
+
+def status(conn):
+    cursor = conn.cursor(buffered=True)
+    try:
+        aplicadas = _aplicadas(cursor)
+    finally:
+        cursor.close()
+    for versao, descricao, _ in MIGRACOES:
+        print(f"{'✅' if versao in aplicadas else '⏳'} {versao:03d} {descricao}")
+
+
+# ------------------------
+# Verificação dos planos (EXPLAIN)
+# ------------------------
+def consultas_quentes():
+    # (nome, SQL, parâmetros de exemplo), com as constantes e os montadores do
+    # próprio app.py: o EXPLAIN roda exatamente o que as rotas executam.
+    # (import aqui dentro: app.py sobe o Flask, só precisa dele no --verificar)
+    from werkzeug.datastructures import MultiDict
+    import app
+
+    pedidos = app.consulta_pedidos_usuario(MultiDict({'limit': '50'}), 1)
+    relatorios = app.consulta_relatorios(MultiDict({'limit': '50', 'data_inicio': '2025-01-01',
+                                                    'data_fim': '2025-01-02'}))
+    return [
+        ('login', app.SQL_LOGIN_USUARIO, ('x@exemplo.com',)),
+        ('login_admin', app.SQL_LOGIN_ADMIN, ('x@exemplo.com',)),
+        ('reset_password', app.SQL_CONFERIR_DADOS_RESET, ('x@exemplo.com', '00000000001', '2000-01-01')),
+        ('buscar_cliente', app.SQL_BUSCAR_CLIENTE, ('00000000001',)),
+        ('get_enderecos', app.SQL_ENDERECOS_USUARIO, (1,)),
+        ('carrinho_aberto', app.SQL_CARRINHO_ABERTO, (1,)),
+        ('add_carrinho', app.SQL_SOMAR_ITEM, (1, 1, 1)),
+        ('get_carrinho', app.SQL_ITENS_CARRINHO, (1,)),
+        ('remove_produto_carrinho', app.SQL_CONTAR_ITENS_CARRINHO, (1,)),
+        ('get_favoritos', app.SQL_FAVORITOS_USUARIO, (1,)),
+        ('validar_cupom', app.SQL_CUPOM_VALIDO, ('CUPOM',)),
+        ('get_produtos_categoria', app.SQL_PRODUTOS_CATEGORIA, ('cafés',)),
+        ('get_promocoes', app.SQL_PROMOCOES, ()),
+        ('criar_pedido (produtos)', app.sql_travar_produtos(2), (1, 2)),
+        ('listar_pedidos_usuario', pedidos[1], pedidos[2]),
+        ('listar_pedidos_usuario (itens)', app.sql_itens_pedidos(3), (1, 2, 3)),
+        ('listar_relatorios (período)', relatorios[1], relatorios[2]),
+    ]
+
+
+def verificar(conn):
+    # Devolve a lista de consultas com varredura completa (type=ALL) em alguma tabela
+    problemas = []
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        for nome, sql, params in consultas_quentes():
+            cursor.execute('EXPLAIN ' + sql, params)
+            plano = cursor.fetchall()
+            # (a linha INSERT de um upsert sempre aparece como type=ALL: não é leitura)
+            varreduras = [linha['table'] for linha in plano
+                          if linha.get('type') == 'ALL' and linha.get('select_type') != 'INSERT']
+            print(f"{'❌' if varreduras else '✅'} {nome}")
+            for linha in plano:
+                print(f"     {linha.get('table')}: type={linha.get('type')} key={linha.get('key')} "
+                      f"rows={linha.get('rows')} {linha.get('Extra') or ''}")
+            if varreduras:
+                problemas.append(f"{nome}: varredura completa em {', '.join(varreduras)}")
+    finally:
+        cursor.close()
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrações do esquema do banco')
+    parser.add_argument('--status', action='store_true', help='lista migrações aplicadas e pendentes')
+    parser.add_argument('--verificar', action='store_true', help='EXPLAIN das consultas quentes')
+    parser.add_argument('--local', action='store_true', help='usa o banco local (get_connection2)')
+    args = parser.parse_args()
+
+    from db import get_connection, get_connection2
+    conn = get_connection2() if args.local else get_connection()
+    if conn is None:
+        raise SystemExit('Não foi possível conectar ao banco de dados')
+    try:
+        if args.status:
+            status(conn)
+        elif args.verificar:
+            problemas = verificar(conn)
+            if problemas:
+                print('❌ Consultas com varredura completa:')
+                for problema in problemas:
+                    print(f'   {problema}')
+                sys.exit(1)
+            print('✅ Nenhuma consulta quente varre a tabela inteira')
+        else:
+            if not migrar(conn):
+                print('✅ Nenhuma migração pendente')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
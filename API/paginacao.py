@@ -0,0 +1,177 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import base64
+import json
+
+
+#======================================================================
+#   Paginação por cursor (keyset) para as rotas de listagem
+#======================================================================
+# O cliente envia ?limit=N e, a partir da segunda página, ?after=<cursor>.
+# O cursor é o par (valor da coluna de ordenação, id) da última linha da
+# página anterior, então a próxima página vem de um WHERE sobre o índice,
+# sem OFFSET, e o custo não cresce com o tamanho da tabela.
+
+LIMITE_MAXIMO = 500
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def _valor_cursor(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S.%f')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def gerar_cursor(ordem, direcao, valor, id_):
+    dados = json.dumps({'o': ordem, 'd': direcao, 'v': [_valor_cursor(valor), id_]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def ler_cursor(token, ordem, direcao):
+    try:
+        preenchimento = '=' * (-len(token) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(token + preenchimento))
+        valor, id_ = dados['v']
+    except (ValueError, KeyError, TypeError):
+        raise ParametroInvalido('Cursor inválido')
+    if dados.get('o') != ordem or dados.get('d') != direcao:
+        raise ParametroInvalido('Cursor não corresponde à ordenação pedida')
+    return valor, id_
+
+
+def ler_data(valor, fim=False):
+    # Aceita 'AAAA-MM-DD' ou 'AAAA-MM-DD HH:MM:SS'. Para o fim do intervalo uma
+    # data sem hora vale até o fim do dia (o filtro usa "<").
+    if not valor:
+        return None
+    try:
+        if len(valor) == 10:
+            dia = datetime.strptime(valor, '%Y-%m-%d')
+            return dia + timedelta(days=1) if fim else dia
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise ParametroInvalido(f"Data inválida: '{valor}'")
+
+
+class Pagina:
+    # ordenacoes: {'nome_no_parametro': ('coluna SQL', 'chave na linha')}
+    # coluna_id:  ('coluna SQL do id', 'chave do id na linha')
+
+    def __init__(self, args, ordenacoes, padrao, coluna_id, direcao_padrao='asc'):
+        self.ordem = args.get('sort', padrao)
+        if self.ordem not in ordenacoes:
+            raise ParametroInvalido(f"sort deve ser um de: {', '.join(ordenacoes)}")
+        self.direcao = args.get('order', direcao_padrao).lower()
+        if self.direcao not in ('asc', 'desc'):
+            raise ParametroInvalido("order deve ser 'asc' ou 'desc'")
+
+        self.coluna, self.chave = ordenacoes[self.ordem]
+        self.coluna_id, self.chave_id = coluna_id
+
+        limite = args.get('limit')
+        if limite is None:
+            # Sem limit a rota devolve tudo, como antes (compatível com o app atual)
+            self.limite = None
+        else:
+            try:
+                self.limite = int(limite)
+            except ValueError:
+                raise ParametroInvalido('limit deve ser um número inteiro')
+            if not 1 <= self.limite <= LIMITE_MAXIMO:
+                raise ParametroInvalido(f'limit deve estar entre 1 e {LIMITE_MAXIMO}')
+
+        after = args.get('after')
+        self.cursor = ler_cursor(after, self.ordem, self.direcao) if after else None
+        self.proximo = None
+
+    def where(self):
+        # Condição keyset (coluna, id) > / < (valor, id) expandida para usar o índice
+        if self.cursor is None:
+            return '', []
+        op = '>' if self.direcao == 'asc' else '<'
+        valor, id_ = self.cursor
+        if self.coluna == self.coluna_id:
+            return f'{self.coluna_id} {op} %s', [id_]
+        return (f'({self.coluna} {op} %s OR ({self.coluna} = %s AND {self.coluna_id} {op} %s))',
+                [valor, valor, id_])
+
+    def order_by(self):
+        if self.coluna == self.coluna_id:
+            return f'ORDER BY {self.coluna_id} {self.direcao.upper()}'
+        return f'ORDER BY {self.coluna} {self.direcao.upper()}, {self.coluna_id} {self.direcao.upper()}'
+
+    def limit(self):
+        # Busca uma linha a mais para saber se existe próxima página
+        if self.limite is None:
+            return '', []
+        return 'LIMIT %s', [self.limite + 1]
+
+    def montar(self, select, condicoes=(), params=()):
+        # select: "SELECT ... FROM ... [JOIN ...]" sem WHERE
+        condicoes = list(condicoes)
+        params = list(params)
+        keyset, params_keyset = self.where()
+        if keyset:
+            condicoes.append(keyset)
+            params += params_keyset
+        sql = select
+        if condicoes:
+            sql += '\nWHERE ' + ' AND '.join(condicoes)
+        sql += '\n' + self.order_by()
+        limit, params_limit = self.limit()
+        if limit:
+            sql += '\n' + limit
+            params += params_limit
+        return sql, tuple(params)
+
+    def cortar(self, linhas):
+        # Remove a linha extra e calcula o cursor da próxima página
+        if self.limite is not None and len(linhas) > self.limite:
+            linhas = linhas[:self.limite]
+            ultima = linhas[-1]
+            self.proximo = gerar_cursor(self.ordem, self.direcao, ultima[self.chave], ultima[self.chave_id])
+        return linhas
+
+    def aplicar_cabecalho(self, resposta):
+        if self.proximo:
+            resposta.headers['X-Next-Cursor'] = self.proximo
+        return resposta
+
+
+def filtro_lista(coluna, valor):
+    # "Entregue,Cancelado" -> coluna IN (%s, %s)
+    itens = [v.strip() for v in valor.split(',') if v.strip()]
+    if not itens:
+        raise ParametroInvalido(f'Filtro vazio para {coluna}')
+    return f"{coluna} IN ({', '.join(['%s'] * len(itens))})", itens
+
+
+def ler_flag(valor):
+    if valor is None:
+        return None
+    if valor.lower() in ('1', 'true', 'sim'):
+        return 1
+    if valor.lower() in ('0', 'false', 'nao', 'não'):
+        return 0
+    raise ParametroInvalido(f"Valor inválido: '{valor}' (use 1 ou 0)")
+
+
+def filtro_periodo(coluna, args):
+    # ?data_inicio=...&data_fim=... sobre a coluna informada
+    condicoes, params = [], []
+    inicio = ler_data(args.get('data_inicio'))
+    fim = ler_data(args.get('data_fim'), fim=True)
+    if inicio:
+        condicoes.append(f'{coluna} >= %s')
+        params.append(inicio)
+    if fim:
+        condicoes.append(f'{coluna} < %s')
+        params.append(fim)
+    return condicoes, params
@@ -0,0 +1,198 @@
+from datetime import date
+import argparse
+import os
+import time
+
+
+#======================================================================
+#   Rollups de vendas (agregados por hora e por dia, mantidos aos poucos)
+#======================================================================
+# Cada escrita em relatorio_pedido aplica um delta nas tabelas de rollup na
+# MESMA transação: antes da mudança subtrai o pedido do "balde" antigo
+# (hora/dia do data_status + status) e depois soma no balde novo. Assim uma
+# troca de status, um cancelamento ou um pedido novo custam alguns
+# INSERT ... ON DUPLICATE KEY UPDATE, e os relatórios leem só os rollups.
+#
+#   rollup_pedidos_hora  (hora, status, fatia)             pedidos, receita, descontos, frete
+#   rollup_produtos_dia  (dia, status, Produto_id, fatia)  categoria, unidades, receita
+#
+# Cada balde é dividido em FATIAS linhas (fatia = id do pedido % FATIAS): no
+# pico todos os checkouts caem na mesma hora/status, e uma linha só faria
+# todos esperarem a trava uns dos outros até o commit. Os relatórios somam
+# as fatias (SUM ... GROUP BY), então o número de fatias pode mudar a
+# qualquer momento sem recalcular nada.
+#
+# Backfill / correção:
+#   python rollups.py --rebuild                      recria tudo a partir dos pedidos
+#   python rollups.py --rebuild --desde 2024-01-01   só a partir da data
+#
+# As tabelas são criadas pela migração 003 de migracoes.py (fatias: 006). A
+# existência delas é conferida uma vez quando a API sobe (iniciar); se não
+# existirem, as rotas continuam funcionando, cada delta ignorado aparece no
+# log e é preciso rodar o --rebuild depois de criá-las.
+#
+# Configuração via .env:
+#   ROLLUPS_FATIAS   linhas por balde (padrão 8)
+
+FATIAS = max(1, int(os.getenv('ROLLUPS_FATIAS', 8)))
+
+TABELAS = {
+    'rollup_pedidos_hora': """
+        CREATE TABLE IF NOT EXISTS rollup_pedidos_hora (
+            hora      DATETIME      NOT NULL,
+            status    VARCHAR(45)   NOT NULL,
+            pedidos   INT           NOT NULL DEFAULT 0,
+            receita   DECIMAL(14,2) NOT NULL DEFAULT 0,
+            descontos DECIMAL(14,2) NOT NULL DEFAULT 0,
+            frete     DECIMAL(14,2) NOT NULL DEFAULT 0,
+            fatia     SMALLINT      NOT NULL DEFAULT 0,
+            PRIMARY KEY (hora, status, fatia)
+        ) ENGINE=InnoDB""",
+    'rollup_produtos_dia': """
+        CREATE TABLE IF NOT EXISTS rollup_produtos_dia (
+            dia        DATE          NOT NULL,
+            status     VARCHAR(45)   NOT NULL,
+            Produto_id INT           NOT NULL,
+            categoria  VARCHAR(45)   NOT NULL DEFAULT '',
+            unidades   INT           NOT NULL DEFAULT 0,
+            receita    DECIMAL(14,2) NOT NULL DEFAULT 0,
+            fatia      SMALLINT      NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, status, Produto_id, fatia),
+            KEY idx_rollup_produtos_categoria (dia, categoria)
+        ) ENGINE=InnoDB""",
+}
+
+# None = não deu para conferir ao subir (banco fora): os deltas são aplicados
+# e, se as tabelas não existirem, o erro aparece na própria rota
+_prontas = {'ok': None}
+
+
+def criar_tabelas(cursor):
+    for ddl in TABELAS.values():
+        cursor.execute(ddl)
+
+
+def iniciar(conectar):
+    # Confere uma vez, ao subir a API, se as tabelas de rollup existem
+    conn = conectar()
+    if conn is None:
+        print("⚠️ Rollups: banco indisponível ao subir; tabelas não conferidas")
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name IN ('rollup_pedidos_hora', 'rollup_produtos_dia')""")
+        _prontas['ok'] = cursor.fetchone()[0] == len(TABELAS)
+    finally:
+        cursor.close()
+        conn.close()
+    if not _prontas['ok']:
+        print("⚠️ Tabelas de rollup não encontradas; os relatórios vão ficar defasados até "
+              "rodar 'python migracoes.py' ou 'python rollups.py --rebuild'")
+
+
+def _somar(cursor, where, params, sinal):
+    # Soma (sinal=1) ou subtrai (sinal=-1) os pedidos selecionados nos baldes do
+    # estado ATUAL deles. O SELECT fica numa derivada para o UPDATE poder usar delta.*
+    params = tuple(params)
+    cursor.execute(f"""
+        INSERT INTO rollup_pedidos_hora (hora, status, pedidos, receita, descontos, frete, fatia)
+        SELECT * FROM (
+            SELECT DATE(rp.data_status) + INTERVAL HOUR(rp.data_status) HOUR AS hora,
+                   rp.status,
+                   %s * COUNT(*) AS pedidos,
+                   %s * COALESCE(SUM(rp.valor_total), 0) AS receita,
+                   %s * COALESCE(SUM(rp.valor_desconto), 0) AS descontos,
+                   %s * COALESCE(SUM(rp.valor_frete), 0) AS frete,
+                   MOD(rp.idRelatorio_Pedido, %s) AS fatia
+            FROM relatorio_pedido rp
+            WHERE {where}
+            GROUP BY hora, rp.status, fatia
+        ) AS delta
+        ON DUPLICATE KEY UPDATE
+            pedidos = rollup_pedidos_hora.pedidos + delta.pedidos,
+            receita = rollup_pedidos_hora.receita + delta.receita,
+            descontos = rollup_pedidos_hora.descontos + delta.descontos,
+            frete = rollup_pedidos_hora.frete + delta.frete
+    """, (sinal,) * 4 + (FATIAS,) + params)
+    cursor.execute(f"""
+        INSERT INTO rollup_produtos_dia (dia, status, Produto_id, categoria, unidades, receita, fatia)
+        SELECT * FROM (
+            SELECT DATE(rp.data_status) AS dia,
+                   rp.status,
+                   rpp.Produto_id,
+                   COALESCE(MAX(p.categoria), '') AS categoria,
+                   %s * SUM(rpp.quantidade) AS unidades,
+                   %s * SUM(rpp.quantidade * rpp.preco_unitario) AS receita,
+                   MOD(rp.idRelatorio_Pedido, %s) AS fatia
+            FROM relatorio_pedido rp
+            JOIN relatorio_pedido_produto rpp ON rpp.Relatorio_Pedido_id = rp.idRelatorio_Pedido
+            LEFT JOIN produtos p ON p.idProdutos = rpp.Produto_id
+            WHERE {where}
+            GROUP BY dia, rp.status, rpp.Produto_id, fatia
+        ) AS delta
+        ON DUPLICATE KEY UPDATE
+            categoria = delta.categoria,
+            unidades = rollup_produtos_dia.unidades + delta.unidades,
+            receita = rollup_produtos_dia.receita + delta.receita
+    """, (sinal,) * 2 + (FATIAS,) + params)
+
+
+def aplicar(cursor, pedido_ids, sinal):
+    # Chamado dentro da transação do handler: -1 antes de mudar os pedidos, +1 depois
+    if not pedido_ids:
+        return
+    if _prontas['ok'] is False:
+        print(f"⚠️ Rollups: delta {sinal:+d} ignorado para o(s) pedido(s) {list(pedido_ids)} "
+              "(tabelas não existem; rode 'python rollups.py --rebuild' depois de criá-las)")
+        return
+    _somar(cursor, f"rp.idRelatorio_Pedido IN ({', '.join(['%s'] * len(pedido_ids))})",
+           pedido_ids, sinal)
+
+
+def reconstruir(conn, desde=None):
+    # Recalcula os rollups a partir dos pedidos (tudo ou a partir de "desde")
+    cursor = conn.cursor()
+    try:
+        criar_tabelas(cursor)
+        if desde:
+            cursor.execute("DELETE FROM rollup_pedidos_hora WHERE hora >= %s", (desde,))
+            cursor.execute("DELETE FROM rollup_produtos_dia WHERE dia >= %s", (desde,))
+            _somar(cursor, "rp.data_status >= %s", (desde,), 1)
+        else:
+            cursor.execute("DELETE FROM rollup_pedidos_hora")
+            cursor.execute("DELETE FROM rollup_produtos_dia")
+            _somar(cursor, "1 = 1", (), 1)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    _prontas['ok'] = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rollups de vendas')
+    parser.add_argument('--rebuild', action='store_true', help='recalcula os rollups a partir dos pedidos')
+    parser.add_argument('--desde', type=date.fromisoformat, help='YYYY-MM-DD: recalcula só a partir desta data')
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from db import get_connection
+    conn = get_connection()
+    if conn is None:
+        raise SystemExit('Não foi possível conectar ao banco de dados')
+    inicio = time.perf_counter()
+    try:
+        reconstruir(conn, args.desde)
+    finally:
+        conn.close()
+    print(f'✅ Rollups recalculados em {time.perf_counter() - inicio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
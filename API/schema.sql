@@ -0,0 +1,158 @@
+-- -----------------------------------------------------
+-- Tabelas usadas pela API (app.py)
+-- -----------------------------------------------------
+-- Estrutura que as rotas esperam hoje (nomes de tabelas e colunas como estão
+-- nas consultas de app.py). Serve para subir um banco local vazio, por
+-- exemplo no teste de carga (benchmarks/carga.py).
+--
+-- Só as chaves primárias, a chave única de carrinho_produto (necessária para
+-- o upsert do carrinho) e os índices das junções de itens de pedido. Os
+-- índices das buscas quentes e as tabelas de rollup vêm das migrações:
+--
+--   mysql -u root -p cafeteria < API/schema.sql
+--   python API/migracoes.py
+
+CREATE TABLE IF NOT EXISTS administrador (
+  idAdministrador INT NOT NULL AUTO_INCREMENT,
+  nome            VARCHAR(100) NULL,
+  email           VARCHAR(100) NOT NULL,
+  senha           VARCHAR(255) NOT NULL,
+  cargo           VARCHAR(45)  NULL,
+  cpf             VARCHAR(14)  NULL,
+  data_nascimento DATE         NULL,
+  data_criacao    DATETIME     NULL,
+  ativo           TINYINT(1)   NOT NULL DEFAULT 1,
+  PRIMARY KEY (idAdministrador)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS usuario (
+  idUsuario                     INT NOT NULL AUTO_INCREMENT,
+  nome_social                   VARCHAR(100) NULL,
+  nome_completo                 VARCHAR(100) NOT NULL,
+  email                         VARCHAR(100) NOT NULL,
+  senha                         VARCHAR(255) NOT NULL,
+  cpf                           VARCHAR(14)  NULL,
+  telefone                      VARCHAR(20)  NULL,
+  data_nascimento               DATE         NULL,
+  data_cadastro                 DATETIME     NULL,
+  data_ultimo_acesso            DATETIME     NULL,
+  ativo                         TINYINT(1)   NOT NULL DEFAULT 1,
+  Administrador_idAdministrador INT          NULL,
+  PRIMARY KEY (idUsuario)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS endereco (
+  idEndereco_usuario INT NOT NULL AUTO_INCREMENT,
+  Usuario_idUsuario  INT          NOT NULL,
+  logradouro         VARCHAR(100) NULL,
+  numero             VARCHAR(10)  NULL,
+  bairro             VARCHAR(45)  NULL,
+  cidade             VARCHAR(45)  NULL,
+  estado             VARCHAR(45)  NULL,
+  cep                VARCHAR(9)   NULL,
+  complemento        VARCHAR(100) NULL,
+  referencia         VARCHAR(100) NULL,
+  PRIMARY KEY (idEndereco_usuario)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS vitrine (
+  idVitrine    INT NOT NULL AUTO_INCREMENT,
+  nome         VARCHAR(45) NULL,
+  descricao    TEXT        NULL,
+  data_criacao DATETIME    NULL,
+  PRIMARY KEY (idVitrine)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS produtos (
+  idProdutos                    INT NOT NULL AUTO_INCREMENT,
+  nome                          VARCHAR(100)  NOT NULL,
+  descricao                     TEXT          NULL,
+  valor                         DECIMAL(10,2) NOT NULL,
+  avaliacao                     DECIMAL(2,1)  NULL,
+  imagem                        MEDIUMTEXT    NULL,
+  quantidade_estoque            INT           NOT NULL DEFAULT 0,
+  quantidade_reservada          INT           NOT NULL DEFAULT 0,
+  categoria                     VARCHAR(45)   NULL,
+  is_promotion                  TINYINT(1)    NOT NULL DEFAULT 0,
+  data_cadastro                 DATETIME      NULL,
+  vitrine_idVitrine             INT           NULL,
+  administrador_idAdministrador INT           NULL,
+  PRIMARY KEY (idProdutos)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS favoritos (
+  idFavoritos         INT NOT NULL AUTO_INCREMENT,
+  Usuario_idUsuario   INT      NOT NULL,
+  Produtos_idProdutos INT      NOT NULL,
+  data_criacao        DATETIME NULL,
+  PRIMARY KEY (idFavoritos)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS carrinho (
+  idCarrinho        INT NOT NULL AUTO_INCREMENT,
+  Usuario_idUsuario INT         NOT NULL,
+  status            VARCHAR(20) NOT NULL DEFAULT 'aberto',
+  data_criacao      DATETIME    NULL,
+  usuario_aberto    INT AS (IF(status = 'aberto', Usuario_idUsuario, NULL)) VIRTUAL,
+  PRIMARY KEY (idCarrinho),
+  UNIQUE KEY uq_carrinho_aberto (usuario_aberto)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS carrinho_produto (
+  idCarrinho_Produtos INT NOT NULL AUTO_INCREMENT,
+  Carrinho_idCarrinho INT      NOT NULL,
+  Produtos_idProdutos INT      NOT NULL,
+  quantidade          INT      NOT NULL DEFAULT 1,
+  data_criacao        DATETIME NULL,
+  PRIMARY KEY (idCarrinho_Produtos),
+  UNIQUE KEY uq_carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS cupom (
+  idCupom                       INT NOT NULL AUTO_INCREMENT,
+  codigo                        VARCHAR(45)   NOT NULL,
+  descricao                     VARCHAR(255)  NULL,
+  desconto                      DECIMAL(10,2) NOT NULL,
+  tipo_desconto                 VARCHAR(20)   NOT NULL DEFAULT 'percentual',
+  data_validade                 DATE          NOT NULL,
+  ativo                         TINYINT(1)    NOT NULL DEFAULT 1,
+  Administrador_idAdministrador INT           NULL,
+  data_criacao                  DATETIME      NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (idCupom)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS cartao_credito (
+  idCartao_credito                  INT NOT NULL AUTO_INCREMENT,
+  nome                              VARCHAR(100) NOT NULL,
+  numero                            VARCHAR(19)  NOT NULL,
+  validade                          VARCHAR(7)   NOT NULL,
+  cvv                               VARCHAR(4)   NOT NULL,
+  Forma_pagamento_idForma_pagamento INT          NULL,
+  PRIMARY KEY (idCartao_credito)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS relatorio_pedido (
+  idRelatorio_Pedido INT NOT NULL AUTO_INCREMENT,
+  Usuario_idUsuario  INT           NOT NULL,
+  endereco           TEXT          NULL,
+  valor_total        DECIMAL(10,2) NOT NULL,
+  valor_frete        DECIMAL(10,2) NOT NULL DEFAULT 0,
+  valor_desconto     DECIMAL(10,2) NOT NULL DEFAULT 0,
+  cupom_codigo       VARCHAR(45)   NULL,
+  status             VARCHAR(45)   NOT NULL,
+  observacao         TEXT          NULL,
+  tipo_pagamento     VARCHAR(45)   NULL,
+  data_status        DATETIME      NULL,
+  PRIMARY KEY (idRelatorio_Pedido)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS relatorio_pedido_produto (
+  idRelatorio_Pedido_Produto INT NOT NULL AUTO_INCREMENT,
+  Relatorio_Pedido_id        INT           NOT NULL,
+  Produto_id                 INT           NOT NULL,
+  quantidade                 INT           NOT NULL,
+  preco_unitario             DECIMAL(10,2) NOT NULL,
+  PRIMARY KEY (idRelatorio_Pedido_Produto),
+  KEY fk_relatorio_pedido_produto_pedido_idx (Relatorio_Pedido_id),
+  KEY fk_relatorio_pedido_produto_produto_idx (Produto_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
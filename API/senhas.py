@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+
+#======================================================================
+#   Hash de senhas (scrypt/PBKDF2 da biblioteca padrão)
+#======================================================================
+# Formatos guardados na coluna senha:
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>
+#   pbkdf2_sha256$<iteracoes>$<salt>$<hash>
+# Qualquer outro valor é tratado como senha antiga em texto puro: o login
+# compara direto e, se acertar, regrava a senha já com hash.
+# Sem senha guardada (usuário que não existe), a verificação calcula um hash
+# falso com o custo atual, para o tempo de resposta não revelar quais e-mails existem.
+#
+# O cálculo é propositalmente pesado, então roda num pool de threads com fila
+# limitada (hashlib libera o GIL durante o cálculo). Um pico de logins espera
+# na fila do pool em vez de ocupar todas as threads de requisição.
+#
+# Configuração via .env:
+#   SENHA_ALGORITMO     scrypt (padrão) ou pbkdf2
+#   SENHA_SCRYPT_N      custo do scrypt (padrão 16384)
+#   SENHA_SCRYPT_R      (padrão 8)
+#   SENHA_SCRYPT_P      (padrão 1)
+#   SENHA_PBKDF2_ITER   iterações do PBKDF2 (padrão 600000)
+#   SENHA_WORKERS       threads do pool de hash (padrão: nº de CPUs)
+#   SENHA_FILA          máximo de cálculos aguardando (padrão 4 × workers)
+#   SENHA_TIMEOUT       segundos esperando vaga/resultado (padrão 10)
+
+ALGORITMO = os.getenv('SENHA_ALGORITMO', 'scrypt')
+SCRYPT_N = int(os.getenv('SENHA_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.getenv('SENHA_SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('SENHA_SCRYPT_P', 1))
+PBKDF2_ITER = int(os.getenv('SENHA_PBKDF2_ITER', 600000))
+TAMANHO_SALT = 16
+TAMANHO_HASH = 32
+
+
+class PoolSenhasOcupado(Exception):
+    pass
+
+
+def _b64(dados):
+    return base64.b64encode(dados).decode().rstrip('=')
+
+
+def _de_b64(texto):
+    return base64.b64decode(texto + '=' * (-len(texto) % 4))
+
+
+def _scrypt(senha, salt, n, r, p):
+    return hashlib.scrypt(senha.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=TAMANHO_HASH)
+
+
+def _pbkdf2(senha, salt, iteracoes):
+    return hashlib.pbkdf2_hmac('sha256', senha.encode(), salt, iteracoes, dklen=TAMANHO_HASH)
+
+
+def gerar_hash(senha):
+    salt = os.urandom(TAMANHO_SALT)
+    if ALGORITMO == 'pbkdf2':
+        return f'pbkdf2_sha256${PBKDF2_ITER}${_b64(salt)}${_b64(_pbkdf2(senha, salt, PBKDF2_ITER))}'
+    return (f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$'
+            f'{_b64(salt)}${_b64(_scrypt(senha, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P))}')
+
+
+def verificar(senha, armazenado):
+    # Devolve (confere, precisa_regravar)
+    if not armazenado:
+        return False, False
+    partes = armazenado.split('$')
+
+    if partes[0] == 'scrypt' and len(partes) == 6:
+        n, r, p = int(partes[1]), int(partes[2]), int(partes[3])
+        calculado = _scrypt(senha, _de_b64(partes[4]), n, r, p)
+        confere = hmac.compare_digest(calculado, _de_b64(partes[5]))
+        atual = ALGORITMO == 'scrypt' and (n, r, p) == (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return confere, confere and not atual
+
+    if partes[0] == 'pbkdf2_sha256' and len(partes) == 4:
+        iteracoes = int(partes[1])
+        calculado = _pbkdf2(senha, _de_b64(partes[2]), iteracoes)
+        confere = hmac.compare_digest(calculado, _de_b64(partes[3]))
+        atual = ALGORITMO == 'pbkdf2' and iteracoes == PBKDF2_ITER
+        return confere, confere and not atual
+
+    # Senha antiga em texto puro
+    confere = hmac.compare_digest(senha.encode(), armazenado.encode())
+    return confere, confere
+
+
+# ------------------------
+# Pool limitado para os cálculos
+# ------------------------
+_workers = int(os.getenv('SENHA_WORKERS', os.cpu_count() or 2))
+_timeout = float(os.getenv('SENHA_TIMEOUT', 10))
+_executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='senhas')
+_vagas = threading.BoundedSemaphore(int(os.getenv('SENHA_FILA', _workers * 4)))
+
+
+_falso = {}
+_falso_lock = threading.Lock()
+
+
+def _hash_falso():
+    # Gerado uma vez por processo, com o algoritmo e o custo configurados
+    with _falso_lock:
+        if 'hash' not in _falso:
+            _falso['hash'] = gerar_hash(_b64(os.urandom(TAMANHO_SALT)))
+        return _falso['hash']
+
+
+def _verificar_ou_simular(senha, armazenado):
+    if not armazenado:
+        verificar(senha, _hash_falso())
+        return False, False
+    return verificar(senha, armazenado)
+
+
+def _no_pool(funcao, *args):
+    if not _vagas.acquire(timeout=_timeout):
+        raise PoolSenhasOcupado('Muitas verificações de senha em andamento, tente novamente')
+    try:
+        futuro = _executor.submit(funcao, *args)
+    except BaseException:
+        _vagas.release()
+        raise
+    # A vaga só volta quando o cálculo termina de fato: se a requisição desistir
+    # por tempo, o cálculo continua ocupando o pool e não pode liberar outro
+    futuro.add_done_callback(lambda _: _vagas.release())
+    try:
+        return futuro.result(timeout=_timeout)
+    except TempoEsgotado:
+        futuro.cancel()   # se ainda estava na fila, nem começa
+        raise PoolSenhasOcupado('Verificação de senha demorou demais, tente novamente')
+
+
+def verificar_senha(senha, armazenado):
+    # armazenado None/vazio (usuário inexistente) gasta o mesmo tempo e devolve (False, False)
+    return _no_pool(_verificar_ou_simular, senha, armazenado)
+
+
+def hash_senha(senha):
+    return _no_pool(gerar_hash, senha)
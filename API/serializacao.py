@@ -0,0 +1,104 @@
+from flask.json.provider import DefaultJSONProvider
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import dataclasses
+import os
+import uuid
+
+try:
+    import orjson   # opcional: sem ele fica o json da biblioteca padrão
+except ImportError:
+    orjson = None
+
+
+#======================================================================
+#   Serialização JSON das respostas (orjson com fallback para o json padrão)
+#======================================================================
+# Mesmo formato que o Flask já entregava para o app:
+#   date/datetime  -> data HTTP ("Mon, 01 Jan 2024 10:00:00 GMT")
+#   Decimal        -> string ("12.50")
+#   chaves ordenadas, sem espaços (com indentação em modo debug)
+# A única diferença no texto é que acentos saem em UTF-8 em vez de é,
+# o que é o mesmo JSON para qualquer parser.
+#
+# Configuração via .env:
+#   JSON_BACKEND   orjson (padrão, se instalado) ou padrao
+
+
+_DIAS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MESES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _data_http(valor):
+    # Mesmo texto de werkzeug.http.http_date, sem passar pelo módulo email (bem mais rápido)
+    if isinstance(valor, datetime):
+        if valor.tzinfo is not None:
+            valor = valor.astimezone(timezone.utc)
+        hora, minuto, segundo = valor.hour, valor.minute, valor.second
+    else:
+        hora = minuto = segundo = 0
+    return (f'{_DIAS[valor.weekday()]}, {valor.day:02d} {_MESES[valor.month - 1]} {valor.year:04d} '
+            f'{hora:02d}:{minuto:02d}:{segundo:02d} GMT')
+
+
+def _padrao(obj):
+    # Chamado pelo orjson para o que ele não serializa sozinho (as datas chegam
+    # aqui por causa do OPT_PASSTHROUGH_DATETIME, para manter o formato HTTP)
+    if isinstance(obj, date):
+        return _data_http(obj)
+    if isinstance(obj, (Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _OPCOES = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    _OPCOES_INDENTADO = _OPCOES | orjson.OPT_INDENT_2
+
+
+class ProvedorJSON(DefaultJSONProvider):
+
+    def __init__(self, app, backend='orjson'):
+        super().__init__(app)
+        self.usa_orjson = orjson is not None and backend == 'orjson'
+
+    def _orjson(self, obj, indentado=False):
+        # None = deixa para o json padrão (inteiros enormes, NaN etc.)
+        try:
+            return orjson.dumps(obj, default=_padrao, option=_OPCOES_INDENTADO if indentado else _OPCOES)
+        except orjson.JSONEncodeError as e:
+            if isinstance(e.__cause__, TypeError):
+                raise e.__cause__
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if self.usa_orjson and not kwargs:
+            dados = self._orjson(obj)
+            if dados is not None:
+                return dados.decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.usa_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # Gera os bytes direto, sem passar por str
+        if not self.usa_orjson:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indentado = (self.compact is None and self._app.debug) or self.compact is False
+        dados = self._orjson(obj, indentado)
+        if dados is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(dados + b'\n', mimetype=self.mimetype)
+
+
+def iniciar(app, backend=None):
+    app.json = ProvedorJSON(app, backend or os.getenv('JSON_BACKEND', 'orjson'))
+    return app.json
@@ -0,0 +1,260 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+import itertools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+#======================================================================
+#   Controle de tentativas (login, login_admin, reset de senha)
+#======================================================================
+# Contador por janela deslizante: conta as falhas dos últimos N segundos para
+# cada (escopo, chave). O estado fica fora do processo (SQLite na máquina ou
+# Redis), então o limite vale para todos os workers do gunicorn juntos.
+#
+# Configuração via .env:
+#   TENTATIVAS_BACKEND     sqlite (padrão), memoria ou redis
+#   TENTATIVAS_JANELA      segundos da janela deslizante (padrão 900)
+#   TENTATIVAS_MAX_CHAVES  limite de chaves em memória (padrão 10000)
+#   TENTATIVAS_MAX_REGISTROS  limite de registros no SQLite (padrão 1000000)
+#   TENTATIVAS_SQLITE      arquivo do SQLite (padrão: temp do sistema)
+#   TENTATIVAS_REDIS_URL   ex.: redis://localhost:6379/0
+#
+# Quando o limite enche, sai primeiro o que já expirou e, se ainda faltar espaço,
+# as chaves com menos falhas: um atacante que manda milhares de e-mails diferentes
+# com uma falha cada não consegue empurrar para fora o contador de quem está
+# tentando adivinhar a senha de uma conta.
+
+TAMANHO_MAX_CHAVE = 254   # e-mails maiores que isso não existem; corta lixo enviado por atacantes
+AMOSTRA_DESCARTE = 64     # chaves mais antigas examinadas para escolher a que sai da memória
+
+
+def _normalizar(chave):
+    return str(chave).strip().lower()[:TAMANHO_MAX_CHAVE]
+
+
+class StoreTentativas(ABC):
+    # Interface comum dos backends
+
+    def __init__(self, janela=900, max_chaves=10000):
+        self.janela = float(janela)
+        self.max_chaves = int(max_chaves)
+
+    @abstractmethod
+    def registrar(self, escopo, chave):
+        # Registra uma falha e devolve quantas existem dentro da janela
+        ...
+
+    @abstractmethod
+    def contar(self, escopo, chave):
+        ...
+
+    @abstractmethod
+    def limpar(self, escopo, chave):
+        ...
+
+
+# ------------------------
+# Memória do processo (um worker só / desenvolvimento)
+# ------------------------
+class StoreMemoria(StoreTentativas):
+
+    def __init__(self, janela=900, max_chaves=10000, max_por_chave=50):
+        super().__init__(janela, max_chaves)
+        self.max_por_chave = max_por_chave
+        self._dados = OrderedDict()   # (escopo, chave) -> deque de timestamps
+        self._lock = threading.Lock()
+
+    def _vigentes(self, item, agora):
+        while item and item[0] <= agora - self.janela:
+            item.popleft()
+        return len(item)
+
+    def registrar(self, escopo, chave):
+        agora = time.time()
+        k = (escopo, _normalizar(chave))
+        with self._lock:
+            item = self._dados.get(k)
+            if item is None:
+                item = self._dados[k] = deque(maxlen=self.max_por_chave)
+            item.append(agora)
+            self._dados.move_to_end(k)
+            if len(self._dados) > self.max_chaves:
+                self._abrir_espaco(agora)
+            return self._vigentes(item, agora)
+
+    def _abrir_espaco(self, agora):
+        # Limite rígido de memória. As chaves estão na ordem da última falha, então
+        # as que já saíram da janela ficam no começo; se tirar essas não bastar,
+        # sai a de menos falhas entre as usadas há mais tempo
+        while self._dados:
+            k, item = next(iter(self._dados.items()))
+            if item[-1] > agora - self.janela:
+                break
+            del self._dados[k]
+        while len(self._dados) > self.max_chaves:
+            antigas = itertools.islice(self._dados.items(), AMOSTRA_DESCARTE)
+            k, _ = min(antigas, key=lambda par: self._vigentes(par[1], agora))
+            del self._dados[k]
+
+    def contar(self, escopo, chave):
+        k = (escopo, _normalizar(chave))
+        with self._lock:
+            item = self._dados.get(k)
+            if item is None:
+                return 0
+            total = self._vigentes(item, time.time())
+            if total == 0:
+                del self._dados[k]
+            return total
+
+    def limpar(self, escopo, chave):
+        with self._lock:
+            self._dados.pop((escopo, _normalizar(chave)), None)
+
+
+# ------------------------
+# SQLite local (compartilhado entre os workers da mesma máquina)
+# ------------------------
+class StoreSQLite(StoreTentativas):
+
+    def __init__(self, caminho, janela=900, max_registros=1000000, limpeza_a_cada=200):
+        super().__init__(janela, max_registros)   # aqui o limite é de registros (uma linha por falha)
+        self.caminho = caminho
+        self.limpeza_a_cada = limpeza_a_cada
+        self._local = threading.local()
+        self._contador = itertools.count(1)   # next() é atômico entre as threads (GIL)
+        with self._conexao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tentativas (
+                    escopo TEXT NOT NULL,
+                    chave  TEXT NOT NULL,
+                    ts     REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tentativas ON tentativas (escopo, chave, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tentativas_ts ON tentativas (ts)")
+
+    def _conexao(self):
+        # Uma conexão por thread (sqlite3 não compartilha conexões entre threads)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def registrar(self, escopo, chave):
+        agora = time.time()
+        chave = _normalizar(chave)
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM tentativas WHERE escopo = ? AND chave = ? AND ts <= ?",
+                         (escopo, chave, agora - self.janela))
+            conn.execute("INSERT INTO tentativas (escopo, chave, ts) VALUES (?, ?, ?)", (escopo, chave, agora))
+            (total,) = conn.execute("SELECT COUNT(*) FROM tentativas WHERE escopo = ? AND chave = ?",
+                                    (escopo, chave)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if next(self._contador) % self.limpeza_a_cada == 0:
+            self._limpeza(agora)
+        return total
+
+    def _limpeza(self, agora):
+        # Remove o que saiu da janela e aplica o limite rígido de tamanho,
+        # mantendo as chaves com mais falhas (e, entre iguais, as mais recentes)
+        conn = self._conexao()
+        conn.execute("DELETE FROM tentativas WHERE ts <= ?", (agora - self.janela,))
+        (total,) = conn.execute("SELECT COUNT(*) FROM tentativas").fetchone()
+        if total <= self.max_chaves:
+            return
+        conn.execute("""
+            DELETE FROM tentativas WHERE rowid IN (
+                SELECT t.rowid FROM tentativas t
+                JOIN (SELECT escopo, chave, COUNT(*) AS falhas, MAX(ts) AS ultima
+                      FROM tentativas GROUP BY escopo, chave) g
+                  ON g.escopo = t.escopo AND g.chave = t.chave
+                ORDER BY g.falhas DESC, g.ultima DESC, t.ts DESC
+                LIMIT -1 OFFSET ?
+            )""", (self.max_chaves,))
+
+    def contar(self, escopo, chave):
+        (total,) = self._conexao().execute(
+            "SELECT COUNT(*) FROM tentativas WHERE escopo = ? AND chave = ? AND ts > ?",
+            (escopo, _normalizar(chave), time.time() - self.janela)).fetchone()
+        return total
+
+    def limpar(self, escopo, chave):
+        self._conexao().execute("DELETE FROM tentativas WHERE escopo = ? AND chave = ?",
+                                (escopo, _normalizar(chave)))
+
+
+# ------------------------
+# Redis (compartilhado entre máquinas) — requer o pacote "redis"
+# ------------------------
+class StoreRedis(StoreTentativas):
+
+    def __init__(self, url, janela=900, max_chaves=10000, prefixo='cafeteria:tentativas'):
+        super().__init__(janela, max_chaves)
+        import redis  # opcional: só é necessário com TENTATIVAS_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefixo = prefixo
+
+    def _chave(self, escopo, chave):
+        return f'{self.prefixo}:{escopo}:{_normalizar(chave)}'
+
+    def registrar(self, escopo, chave):
+        # Sorted set com os timestamps; o EXPIRE garante que a chave some sozinha
+        agora = time.time()
+        k = self._chave(escopo, chave)
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(k, 0, agora - self.janela)
+        pipe.zadd(k, {f'{agora:.6f}:{os.getpid()}:{threading.get_ident()}': agora})
+        pipe.zcard(k)
+        pipe.expire(k, int(self.janela) + 1)
+        return pipe.execute()[2]
+
+    def contar(self, escopo, chave):
+        return self._redis.zcount(self._chave(escopo, chave), time.time() - self.janela, '+inf')
+
+    def limpar(self, escopo, chave):
+        self._redis.delete(self._chave(escopo, chave))
+
+
+def criar_store(backend=None, janela=None, nome='tentativas'):
+    # nome != 'tentativas' cria um store separado (outro arquivo SQLite / prefixo no Redis)
+    # no mesmo backend, ex.: as marcas de escrita das réplicas de leitura em db.py
+    backend = backend or os.getenv('TENTATIVAS_BACKEND', 'sqlite')
+    janela = float(janela if janela is not None else os.getenv('TENTATIVAS_JANELA', 900))
+    if backend == 'memoria':
+        return StoreMemoria(janela, int(os.getenv('TENTATIVAS_MAX_CHAVES', 10000)))
+    if backend == 'redis':
+        return StoreRedis(os.getenv('TENTATIVAS_REDIS_URL', 'redis://localhost:6379/0'), janela,
+                          prefixo=f'cafeteria:{nome}')
+    if backend == 'sqlite':
+        caminho = os.getenv('TENTATIVAS_SQLITE', os.path.join(tempfile.gettempdir(), 'cafeteria_tentativas.db'))
+        if nome != 'tentativas':
+            raiz, extensao = os.path.splitext(caminho)
+            caminho = f'{raiz}_{nome}{extensao}'
+        return StoreSQLite(caminho, janela, int(os.getenv('TENTATIVAS_MAX_REGISTROS', 1000000)))
+    raise ValueError(f"TENTATIVAS_BACKEND inválido: '{backend}'")
+
+
+_padrao = None          # store de login/reset, criado no primeiro uso (importar não cria arquivo)
+_padrao_lock = threading.Lock()
+
+
+def store_tentativas():
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = criar_store()
+        return _padrao
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos da API são importados pelo nome (import app, import db...), como no gunicorn
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
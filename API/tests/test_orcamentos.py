@@ -0,0 +1,135 @@
+import pytest
+
+import app
+import consultas
+import db
+import rollups
+
+
+#======================================================================
+#   Orçamento de consultas por rota (consultas.ORCAMENTOS)
+#======================================================================
+# As rotas rodam no cliente de teste do Flask com uma conexão falsa: o cursor
+# de verdade (db.CursorMedido) envolve um cursor que só devolve linhas prontas,
+# então cada comando passa por db.notificar_consulta como em produção. Um N+1
+# novo (uma consulta por pedido/item) faz o teste falhar sem precisar de MySQL.
+
+
+class CursorFalso:
+    # Devolve as linhas da primeira regra cujo trecho aparece no SQL
+
+    def __init__(self, regras, dicionario):
+        self.regras = regras
+        self.dicionario = dicionario
+        self.linhas = []
+        self.with_rows = False
+        self.lastrowid = 1
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        self.linhas = []
+        for trecho, linhas in self.regras:
+            if trecho in sql:
+                self.linhas = [dict(l) if self.dicionario else tuple(l.values()) for l in linhas]
+                break
+        self.with_rows = sql.lstrip().upper().startswith('SELECT')
+        self.rowcount = len(self.linhas) or 1
+
+    def executemany(self, sql, params):
+        self.with_rows = False
+        self.rowcount = len(params)
+
+    def fetchone(self):
+        return self.linhas.pop(0) if self.linhas else None
+
+    def fetchall(self):
+        linhas, self.linhas = self.linhas, []
+        return linhas
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+
+    def __init__(self, regras):
+        self.regras = regras
+
+    def cursor(self, dictionary=False, **kwargs):
+        return db.CursorMedido(CursorFalso(self.regras, dictionary), None)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def rodar(monkeypatch):
+    # rodar(regras, metodo, url, json=None) -> (resposta, comandos SQL da requisição)
+    comandos = []
+
+    def contar(sql, params, duracao):
+        comandos.append(sql)
+
+    monkeypatch.setattr(db, 'observadores_consulta', db.observadores_consulta + [contar])
+    monkeypatch.setitem(rollups._prontas, 'ok', True)          # conta também os deltas dos rollups
+    monkeypatch.setitem(app._chaves_carrinho, 'ok', True)      # caminho com as chaves únicas
+    monkeypatch.setattr(app, 'marcar_escrita', lambda *chaves: None)
+    cliente = app.app.test_client()
+
+    def _rodar(regras, metodo, url, json=None):
+        conexao = lambda *args, **kwargs: ConexaoFalsa(regras)
+        monkeypatch.setattr(app, 'get_connection', conexao)
+        monkeypatch.setattr(app, 'get_connection_leitura', conexao)
+        comandos.clear()
+        resposta = cliente.open(url, method=metodo, json=json)
+        return resposta, list(comandos)
+
+    return _rodar
+
+
+def conferir(resposta, comandos, endpoint):
+    assert resposta.status_code < 400, resposta.get_data(as_text=True)
+    assert consultas.CABECALHO_ESTOURO not in resposta.headers
+    limite = consultas.ORCAMENTOS[endpoint]
+    assert len(comandos) <= limite, f'{endpoint}: {len(comandos)} comandos (orçamento {limite}):\n' + \
+        '\n'.join(' '.join(sql.split())[:120] for sql in comandos)
+
+
+def test_listar_pedidos_usuario_uma_consulta_para_todos_os_itens(rodar):
+    pedidos = [{'idRelatorio_Pedido': i, 'status': 'Realizado'} for i in range(1, 21)]
+    itens = [{'Relatorio_Pedido_id': i, 'nome': 'Café', 'quantidade': 1, 'preco_unitario': 5} for i in range(1, 21)]
+    resposta, comandos = rodar([('FROM relatorio_pedido_produto', itens), ('FROM relatorio_pedido', pedidos)],
+                               'GET', '/listar_pedidos/7')
+    conferir(resposta, comandos, 'listar_pedidos_usuario')
+    assert all(len(pedido['items']) == 1 for pedido in resposta.get_json())
+
+
+def test_get_carrinho(rodar):
+    itens = [{'carrinho_id': 1, 'produto_id': i, 'nome': 'Café', 'descricao': '', 'valor': 5,
+              'imagem': '', 'quantidade': 1} for i in range(1, 11)]
+    resposta, comandos = rodar([('FROM carrinho_produto', itens)], 'GET', '/get_carrinho/7')
+    conferir(resposta, comandos, 'get_carrinho')
+    assert len(resposta.get_json()) == 10
+
+
+def test_add_carrinho(rodar):
+    resposta, comandos = rodar([], 'POST', '/add_carrinho',
+                               json={'usuario_id': 7, 'produto_id': 3, 'quantidade': 2})
+    conferir(resposta, comandos, 'add_carrinho')
+
+
+def test_criar_pedido_nao_cresce_com_os_itens(rodar):
+    produtos = [{'idProdutos': i, 'nome': f'Produto {i}', 'quantidade_estoque': 100, 'quantidade_reservada': 0}
+                for i in range(1, 31)]
+    pedido = {
+        'usuario_id': 7, 'valor_total': 150, 'pagamento': 'pix',
+        'items': [{'id': i, 'quantity': 1, 'price': 5} for i in range(1, 31)],
+    }
+    resposta, comandos = rodar([('FROM produtos', produtos)], 'POST', '/criar_pedido', json=pedido)
+    conferir(resposta, comandos, 'criar_pedido')
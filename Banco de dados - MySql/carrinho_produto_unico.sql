@@ -0,0 +1,24 @@
+-- -----------------------------------------------------
+-- Chave única (carrinho, produto) em carrinho_produto
+-- Necessária para o upsert de /add_carrinho e /carrinho/<usuario_id>/itens
+-- -----------------------------------------------------
+
+-- 1) Junta linhas duplicadas do mesmo produto no mesmo carrinho (soma as quantidades na mais antiga)
+UPDATE carrinho_produto cp
+JOIN (
+    SELECT MIN(idCarrinho_Produtos) AS id, SUM(quantidade) AS quantidade
+    FROM carrinho_produto
+    GROUP BY Carrinho_idCarrinho, Produtos_idProdutos
+    HAVING COUNT(*) > 1
+) dup ON dup.id = cp.idCarrinho_Produtos
+SET cp.quantidade = dup.quantidade;
+
+DELETE cp FROM carrinho_produto cp
+JOIN carrinho_produto manter
+  ON manter.Carrinho_idCarrinho = cp.Carrinho_idCarrinho
+ AND manter.Produtos_idProdutos = cp.Produtos_idProdutos
+ AND manter.idCarrinho_Produtos < cp.idCarrinho_Produtos;
+
+-- 2) Chave única
+ALTER TABLE carrinho_produto
+    ADD UNIQUE KEY uq_carrinho_produto (Carrinho_idCarrinho, Produtos_idProdutos);